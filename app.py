@@ -5,11 +5,32 @@ from pathlib import Path
 from telegram import Update
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler, filters
 
-from src.audio2text.speech_recognition import SpeechRecognition
+from src.audio2text.speech_recognition import DEFAULT_MODEL_PATH, SpeechRecognition
+from src.audio2text.transcription_cache import TranscriptionCache
+from src.image_generation.generation import DEFAULT_MODEL_PATH as GENERATION_MODEL_PATH
+from src.image_generation.generation import (
+    StableDiffusionPipeline,
+    get_generation_profile_from_env,
+)
+from src.image_generation.generation_cache import GenerationCache
+from src.image_processing.command_parser.command_parser_creator import CommandParserTypes, get_command_parser
+from src.image_processing.command_parser.language_package import LanguageType
 from src.image_processing.image_processor import ImageProcessor
-from src.sticker_generator.sticker_generator import StickerGenerator
+from src.image_processing.tiled_executor import get_tiling_config_from_env
+from src.inference.async_models import (
+    AsyncCommandParser,
+    AsyncImageProcessor,
+    AsyncSpeechRecognition,
+    AsyncStableDiffusionPipeline,
+    AsyncStickerGenerator,
+)
+from src.inference.batching import BatchingConfig
+from src.inference.executor import InferenceExecutor, ModelName, get_executor_configs_from_env
+from src.inference.model_registry import ModelRegistry, get_registry_config_from_env
+from src.sticker_generator.sticker_generator import StickerGenerator, get_sticker_model_config_from_env
 from src.telegram_bot.bot import TelegramBot
-from src.telegram_bot.utils import BOT_STATES
+from src.telegram_bot.update_processor import ChatUpdateProcessor
+from src.telegram_bot.utils import BOT_STATES, CANCEL_GENERATION_PREFIX, is_cancel_generation
 
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 
@@ -17,18 +38,68 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+# Updates processed at once, the default of python-telegram-bot for concurrent updates
+MAX_CONCURRENT_UPDATES = 256
+
 
 def main() -> None:
     data_folder = Path("data/")
     data_folder.mkdir(parents=True, exist_ok=True)
     Path("models/").mkdir(parents=True, exist_ok=True)
 
-    app = Application.builder().token(os.environ["BOT_TOKEN"]).build()
-    audio_processor = SpeechRecognition()
-    image_processor = ImageProcessor()
-    sticker_generator = StickerGenerator()
+    # Updates of a chat are processed in order, so the conversation state is not changed concurrently
+    update_processor = ChatUpdateProcessor(MAX_CONCURRENT_UPDATES, is_concurrent=is_cancel_generation)
+    app = Application.builder().token(os.environ["BOT_TOKEN"]).concurrent_updates(update_processor).build()
+    executor = InferenceExecutor(get_executor_configs_from_env())
+    registry = ModelRegistry(get_registry_config_from_env())
+    sticker_config = get_sticker_model_config_from_env()
+    generation_profile = get_generation_profile_from_env()
+    tiling_config = get_tiling_config_from_env()
+
+    audio_processor = AsyncSpeechRecognition(
+        registry.register(ModelName.SPEECH_RECOGNITION, SpeechRecognition),
+        executor,
+        BatchingConfig(),
+        cache=TranscriptionCache(data_folder / "cache/transcriptions", model_id=DEFAULT_MODEL_PATH),
+    )
+    image_processor = AsyncImageProcessor(
+        registry.register(ModelName.IMAGE_PROCESSING, lambda: ImageProcessor(tiling=tiling_config)), executor
+    )
+    sticker_generator = AsyncStickerGenerator(
+        registry.register(
+            ModelName.STICKER_GENERATION,
+            lambda: StickerGenerator(
+                str(sticker_config.model_path),
+                sticker_config.model_type.value,
+                sticker_config.precision,
+                embedding_cache_folder=data_folder / "cache/embeddings",
+            ),
+        ),
+        executor,
+    )
+    image_generator = AsyncStableDiffusionPipeline(
+        registry.register(ModelName.IMAGE_GENERATION, lambda: StableDiffusionPipeline(profile=generation_profile)),
+        executor,
+        cache=GenerationCache(data_folder / "cache/generations", GENERATION_MODEL_PATH, generation_profile),
+    )
+    command_parser = AsyncCommandParser(
+        registry.register(
+            ModelName.COMMAND_PARSING, lambda: get_command_parser(CommandParserTypes.TIERED)(LanguageType.EN)
+        ),
+        executor,
+    )
+    registry.start_monitor()
 
-    bot = TelegramBot(audio_processor, image_processor, sticker_generator, logger, data_folder, num_few_shot_samples=-1)
+    bot = TelegramBot(
+        audio_processor,
+        image_processor,
+        sticker_generator,
+        image_generator,
+        command_parser,
+        logger,
+        data_folder,
+        num_few_shot_samples=-1,
+    )
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler("start", bot.start)],
         states={
@@ -55,9 +126,15 @@ def main() -> None:
         allow_reentry=True,
     )
 
+    # Registered before the conversation, so the Cancel button works while the generation handler is running
+    app.add_handler(CallbackQueryHandler(bot.cancel_generation, pattern=f"^{CANCEL_GENERATION_PREFIX}"))
     app.add_handler(conv_handler)
 
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    try:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
+    finally:
+        registry.stop_monitor()
+        executor.shutdown(wait=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import List
+
+from tap import Tap
+
+from src.audio2text.speech_recognition import SpeechRecognition
+from src.inference.async_models import AsyncSpeechRecognition
+from src.inference.batching import BatchingConfig
+from src.inference.executor import InferenceExecutor, ModelName
+from src.inference.model_registry import ModelRegistry
+
+
+class Arguments(Tap):
+    audio_path: Path = Path("./audio_files/Example.ogg")
+    model_path: str = "openai/whisper-small"
+    num_requests: int = 32
+    num_stage_runs: int = 10
+    batch_sizes: List[int] = [1, 2, 4, 8, 16]
+    windows_ms: List[float] = [10.0, 50.0, 200.0]
+
+
+async def measure_throughput(
+    speech_rec: SpeechRecognition, audio_path: Path, config: BatchingConfig, num_requests: int
+) -> float:
+    executor = InferenceExecutor()
+    try:
+        registry = ModelRegistry()
+        handle = registry.register(ModelName.SPEECH_RECOGNITION, lambda: speech_rec)
+        async_speech_rec = AsyncSpeechRecognition(handle, executor, config)
+        start = time.perf_counter()
+        await asyncio.gather(*(async_speech_rec.gen_transcription(audio_path) for _ in range(num_requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        executor.shutdown()
+    return num_requests / elapsed
+
+
+def print_stage_timings(speech_rec: SpeechRecognition, audio_path: Path, num_runs: int) -> None:
+    speech_rec.timings.reset()
+    for _ in range(num_runs):
+        speech_rec.gen_transcription(audio_path)
+
+    stage_timings = speech_rec.timings.get_mean_ms()
+    total = sum(stage_timings.values())
+    print(f"{'stage':>10} | {'mean, ms':>10} | {'share':>10}")
+    for stage, mean_ms in stage_timings.items():
+        print(f"{stage:>10} | {mean_ms:>10.1f} | {mean_ms / total:>10.1%}")
+    print()
+
+
+def main() -> None:
+    args = Arguments(underscores_to_dashes=True).parse_args()
+    speech_rec = SpeechRecognition(model_path=args.model_path, processor_path=args.model_path, whisper=True)
+
+    # Warm up the model so the first configuration is not penalized
+    speech_rec.gen_transcription(args.audio_path)
+
+    print_stage_timings(speech_rec, args.audio_path, args.num_stage_runs)
+
+    print(f"{'batch size':>10} | {'window, ms':>10} | {'requests/s':>10}")
+    for batch_size in args.batch_sizes:
+        for window_ms in args.windows_ms:
+            config = BatchingConfig(max_batch_size=batch_size, max_wait_ms=window_ms)
+            throughput = asyncio.run(measure_throughput(speech_rec, args.audio_path, config, args.num_requests))
+            print(f"{batch_size:>10} | {window_ms:>10.1f} | {throughput:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from math import gcd
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union, cast
+
+import numpy as np
+import soundfile as sf
+import torch
+from librosa.filters import mel
+from scipy.signal import resample_poly
+
+SAMPLE_RATE = 16000
+
+# Whisper feature extraction parameters
+N_FFT = 400
+HOP_LENGTH = 160
+WINDOW_SAMPLES = 30 * SAMPLE_RATE
+
+
+class StageTimings:
+    """
+    Thread-safe collection of per-stage latencies
+    """
+
+    def __init__(self) -> None:
+        self._timings: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, duration_s: float) -> None:
+        with self._lock:
+            self._timings[stage].append(duration_s)
+
+    def get_mean_ms(self) -> Dict[str, float]:
+        """
+        Get the mean latency of every stage
+        Returns:
+            Dict[str, float]: the map of stage names to mean latencies in milliseconds
+        """
+        with self._lock:
+            return {stage: 1000 * float(np.mean(timings)) for stage, timings in self._timings.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._timings.clear()
+
+
+@contextmanager
+def measure_stage(stage: str, timings: Optional[StageTimings] = None) -> Iterator[None]:
+    """
+    Log the latency of the stage and add it to the timings
+    Args:
+        stage: name of the stage
+        timings: timings to add the latency to
+    """
+    start = time.perf_counter()
+    yield
+    duration_s = time.perf_counter() - start
+    logging.debug("Speech recognition stage %s took %.1f ms", stage, 1000 * duration_s)
+    if timings is not None:
+        timings.add(stage, duration_s)
+
+
+def decode_audio(source: Union[str, BinaryIO], timings: Optional[StageTimings] = None) -> np.ndarray:
+    """
+    Decode WAV, OGG Vorbis or OGG Opus audio in memory to a 16 kHz mono float32 waveform
+    Args:
+        source: path to the file or in-memory encoded audio
+        timings: timings to add the decode and resample latencies to
+    Returns:
+        np.ndarray: waveform
+    """
+    with measure_stage("decode", timings):
+        audio, sample_rate = sf.read(source, dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+
+    with measure_stage("resample", timings):
+        if sample_rate != SAMPLE_RATE:
+            divisor = gcd(SAMPLE_RATE, sample_rate)
+            audio = resample_poly(audio, SAMPLE_RATE // divisor, sample_rate // divisor)
+    return cast(np.ndarray, audio.astype(np.float32, copy=False))
+
+
+class LogMelExtractor:
+    """
+    Whisper log-mel spectrogram computed with torch. The window and the mel filterbank are built once
+    """
+
+    def __init__(self, n_mels: int = 80, device: str = "cpu") -> None:
+        self.n_mels = n_mels
+        self.device = device
+        self._window = torch.hann_window(N_FFT, device=device)
+        mel_filters = mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=n_mels)
+        self._mel_filters = torch.from_numpy(mel_filters).to(device)
+
+    def __call__(self, audio_inputs: List[np.ndarray]) -> torch.Tensor:
+        """
+        Compute features of waveforms padded or trimmed to the 30 s window
+        Args:
+            audio_inputs: 16 kHz waveforms
+        Returns:
+            torch.Tensor: features of shape (batch, n_mels, 3000)
+        """
+        batch = np.zeros((len(audio_inputs), WINDOW_SAMPLES), dtype=np.float32)
+        for i, audio_input in enumerate(audio_inputs):
+            audio_input = audio_input[:WINDOW_SAMPLES]
+            batch[i, : len(audio_input)] = audio_input
+
+        waveforms = torch.from_numpy(batch).to(self.device)
+        stft = torch.stft(waveforms, N_FFT, HOP_LENGTH, window=self._window, return_complex=True)
+        magnitudes = stft[..., :-1].abs() ** 2
+
+        log_spec = torch.clamp(self._mel_filters @ magnitudes, min=1e-10).log10()
+        # Dynamic range is limited to 80 dB below the loudest frame of every sample
+        log_spec = torch.maximum(log_spec, log_spec.amax(dim=(1, 2), keepdim=True) - 8.0)
+        return (log_spec + 4.0) / 4.0
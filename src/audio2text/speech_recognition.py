@@ -1,11 +1,10 @@
 import os
-import time
+import re
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, cast
+from typing import BinaryIO, Iterator, List, Optional, TypeAlias, Union, cast
 
-import librosa
 import numpy as np
-import soundfile as sf
 import torch
 import tqdm
 from datasets import load_dataset
@@ -13,12 +12,77 @@ from jiwer import cer, wer
 from scipy.io.wavfile import write
 from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor, WhisperForConditionalGeneration, WhisperProcessor
 
+from src.audio2text.features import SAMPLE_RATE, LogMelExtractor, StageTimings, decode_audio, measure_stage
+
+AudioSource: TypeAlias = Union[Path, BinaryIO]
+
+DEFAULT_MODEL_PATH = "openai/whisper-small"
+
+
+@dataclass
+class LongFormConfig:
+    """
+    Long-form transcription configuration. Chunks should fit into the 30 s Whisper window
+    """
+
+    chunk_length_s: float = 30.0
+    overlap_s: float = 5.0
+    batch_size: int = 4
+
+
+def split_audio(audio_input: np.ndarray, chunk_length_s: float, overlap_s: float) -> List[np.ndarray]:
+    """Splits a 16 kHz waveform into chunks, every chunk overlaps the previous one by `overlap_s` seconds."""
+    if not 0 <= overlap_s < chunk_length_s:
+        raise ValueError(f"Overlap of {overlap_s} s does not fit into chunks of {chunk_length_s} s")
+
+    chunk_length = int(chunk_length_s * SAMPLE_RATE)
+    overlap = int(overlap_s * SAMPLE_RATE)
+    # The last chunk starts before the end of the audio which is not covered by the previous chunk
+    starts = range(0, max(len(audio_input) - overlap, 1), chunk_length - overlap)
+    return [audio_input[start : start + chunk_length] for start in starts]
+
+
+def get_chunk_batches(chunks: List[np.ndarray], batch_size: int) -> List[List[np.ndarray]]:
+    """Groups chunks into batches. The first chunk is transcribed alone, so the first text is ready after one chunk."""
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be positive, got {batch_size}")
+    if not chunks:
+        return []
+    return [chunks[:1]] + [chunks[i : i + batch_size] for i in range(1, len(chunks), batch_size)]
+
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def merge_transcriptions(left: str, right: str, max_overlap_words: int = 20) -> str:
+    """
+    Joins transcriptions of overlapping chunks at the longest run of words they share.
+    A word cut by a chunk boundary may be transcribed differently, so one boundary word on each side can be skipped.
+    """
+    left_words, right_words = left.split(), right.split()
+    left_normalized = [_normalize_word(word) for word in left_words]
+    right_normalized = [_normalize_word(word) for word in right_words]
+
+    for size in range(min(len(left_words), len(right_words), max_overlap_words), 0, -1):
+        for left_skip in (0, 1):
+            for right_skip in (0, 1):
+                if (left_skip or right_skip) and size < 2:
+                    continue
+                left_end = len(left_words) - left_skip
+                left_part = left_normalized[left_end - size : left_end]
+                right_part = right_normalized[right_skip : right_skip + size]
+                if len(left_part) == len(right_part) == size and left_part == right_part:
+                    return " ".join(left_words[:left_end] + right_words[right_skip + size :])
+
+    return " ".join(left_words + right_words)
+
 
 class SpeechRecognition:
     def __init__(
         self,
-        model_path: str = "openai/whisper-small",
-        processor_path: str = "openai/whisper-small",
+        model_path: str = DEFAULT_MODEL_PATH,
+        processor_path: str = DEFAULT_MODEL_PATH,
         whisper: bool = True,
     ):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -32,6 +96,10 @@ class SpeechRecognition:
 
         self.model = model_class.from_pretrained(model_path).to(self.device)
         self.processor = processor_class.from_pretrained(processor_path)
+        self.timings = StageTimings()
+        self.feature_extractor: Optional[LogMelExtractor] = None
+        if whisper:
+            self.feature_extractor = LogMelExtractor(self.model.config.num_mel_bins, self.device)
 
     def load_data_golos(self, path_to_audio: str) -> List[str]:
         """Loads test dataset from GOLOS and saves audio samples to files."""
@@ -53,26 +121,37 @@ class SpeechRecognition:
             transcriptions.append(transcription)
         return transcriptions
 
-    def gen_transcription(self, path_to_file: Path) -> str:
-        """Generates a transcription for a single audio file."""
-        if not path_to_file.is_file():
+    def gen_transcription(self, path_to_file: AudioSource) -> str:
+        """Generates a transcription for a single audio file or an in-memory encoded audio."""
+        if isinstance(path_to_file, Path) and not path_to_file.is_file():
             raise FileNotFoundError(f"File '{path_to_file}' not found")
 
         if self.whisper:
             return self._gen_transcription_whisper(path_to_file)
         return self._gen_transcription_wav2vec(path_to_file)
 
-    def _gen_transcription_wav2vec(self, path_to_file: Path) -> str:
-        speech_array, _ = librosa.load(path_to_file, sr=16_000)
-        inputs = self.processor(speech_array, sampling_rate=16_000, return_tensors="pt", padding=True)
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
-        logits = self.model(inputs.input_values, attention_mask=inputs.attention_mask).logits
-        predicted_ids = torch.argmax(logits, dim=-1)
+    def _gen_transcription_wav2vec(self, path_to_file: AudioSource) -> str:
+        speech_array = self.load_audio(path_to_file, self.timings)
+        with measure_stage("features", self.timings):
+            inputs = self.processor(speech_array, sampling_rate=SAMPLE_RATE, return_tensors="pt", padding=True)
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        with measure_stage("model", self.timings):
+            logits = self.model(inputs.input_values, attention_mask=inputs.attention_mask).logits
+            predicted_ids = torch.argmax(logits, dim=-1)
         decoded = self.processor.batch_decode(predicted_ids)
         transcription = cast(str, decoded[0]) if decoded else ""
         return transcription
 
-    def _gen_transcription_whisper(self, path_to_file: Path) -> str:
+    def _gen_transcription_whisper(self, path_to_file: AudioSource) -> str:
+        audio_input = self.load_audio(path_to_file, self.timings)
+        return self.gen_transcriptions_whisper_batch([audio_input])[0]
+
+    @staticmethod
+    def load_audio(path_to_file: AudioSource, timings: Optional[StageTimings] = None) -> np.ndarray:
+        """Decodes a WAV or OGG file (or an in-memory encoded audio) to a 16 kHz waveform without temporary files."""
+        if not isinstance(path_to_file, Path):
+            return decode_audio(path_to_file, timings)
+
         allowed_formats = {".wav", ".ogg"}
 
         if not path_to_file.is_file():
@@ -82,26 +161,38 @@ class SpeechRecognition:
         if ext not in allowed_formats:
             raise ValueError(f"Unsupported file format '{ext}'. Allowed formats: {', '.join(allowed_formats)}")
 
-        if ext == ".ogg":
-            path_to_file = self._ogg_to_wav(path_to_file)
-
-        audio_input, _ = librosa.load(str(path_to_file), sr=16000)  # Convert Path to string for librosa
-        input_features = self.processor(audio_input, sampling_rate=16000, return_tensors="pt").input_features
-        input_features = input_features.to(self.device)
-        generated_ids = self.model.generate(input_features)
-        decoded = self.processor.decode(generated_ids[0], skip_special_tokens=True)
-        transcription = cast(str, decoded) if decoded else ""
-
-        return transcription
-
-    def _ogg_to_wav(self, path_to_file: Path) -> Path:
-        timestr = time.strftime("%Y%m%d-%H%M%S")
-        data, samplerate = sf.read(path_to_file)
-        tmp_path = Path("data/processed_speech")
-        (tmp_path / "temp").mkdir(parents=True, exist_ok=True)
-        file_name = tmp_path / f"temp/{timestr}_wav_transformed.wav"
-        sf.write(file_name, data, samplerate)
-        return file_name
+        return decode_audio(str(path_to_file), timings)
+
+    def gen_transcription_long_form(
+        self, path_to_file: AudioSource, config: Optional[LongFormConfig] = None
+    ) -> Iterator[str]:
+        """Generates a transcription of audio of any length, yields the text stitched so far after every batch."""
+        config = config or LongFormConfig()
+        if not self.whisper:
+            yield self.gen_transcription(path_to_file)
+            return
+
+        chunks = split_audio(self.load_audio(path_to_file, self.timings), config.chunk_length_s, config.overlap_s)
+        transcription = ""
+        for batch in get_chunk_batches(chunks, config.batch_size):
+            for chunk_transcription in self.gen_transcriptions_whisper_batch(batch):
+                transcription = merge_transcriptions(transcription, chunk_transcription)
+            yield transcription
+
+    def gen_transcriptions_whisper_batch(self, audio_inputs: List[np.ndarray]) -> List[str]:
+        """Generates transcriptions for several 16 kHz waveforms with a single batched Whisper call."""
+        if not self.whisper or self.feature_extractor is None:
+            raise ValueError("Batched transcription is only supported by Whisper models")
+        if not audio_inputs:
+            return []
+
+        # Every waveform is padded to the 30 s window, so the features stack into one tensor
+        with measure_stage("features", self.timings):
+            input_features = self.feature_extractor(audio_inputs).to(self.model.dtype)
+        with measure_stage("model", self.timings):
+            generated_ids = self.model.generate(input_features)
+        decoded = self.processor.batch_decode(generated_ids, skip_special_tokens=True)
+        return [cast(str, transcription) if transcription else "" for transcription in decoded]
 
     def calc_test_metrics(self, real_transcriptions: List[str], generated_transcriptions: List[str]) -> None:
         """Calculates Word Error Rate (WER) and Character Error Rate (CER)."""
@@ -0,0 +1,100 @@
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+from src.audio2text.speech_recognition import AudioSource
+from src.cache.disk_cache import DiskCache
+from src.cache.lru_cache import CacheStats, LRUCache
+
+
+def get_audio_hash(audio: AudioSource) -> str:
+    """
+    Get the content hash of the encoded audio. The position of an in-memory buffer is restored
+    Args:
+        audio: path to the file or in-memory encoded audio
+    Returns:
+        str: hex digest of the audio content
+    """
+    digest = hashlib.sha256()
+    if isinstance(audio, Path):
+        with open(audio, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    position = audio.tell()
+    audio.seek(0)
+    for block in iter(lambda: audio.read(1 << 20), b""):
+        digest.update(block)
+    audio.seek(position)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Transcriptions keyed by the audio identity and the model identity.
+    Recent transcriptions are kept in memory, the rest are read from a size-bounded folder which survives restarts
+    """
+
+    def __init__(
+        self,
+        folder: Path,
+        model_id: str,
+        memory_size: int = 1024,
+        disk_size_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        """
+        Args:
+            folder: folder of the on-disk store
+            model_id: identity of the speech recognition model, transcriptions of other models are not reused
+            memory_size: number of transcriptions kept in memory
+            disk_size_bytes: size of the on-disk store
+        """
+        self._model_id = model_id
+        self._memory = LRUCache[str, str](memory_size)
+        self._disk = DiskCache(folder, disk_size_bytes)
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def get_key(self, audio: AudioSource, file_unique_id: Optional[str] = None) -> str:
+        """
+        Get the cache key of the audio. Telegram `file_unique_id` is the same for forwarded copies of a file,
+        so it is used instead of hashing the content when it is known
+        Args:
+            audio: path to the file or in-memory encoded audio
+            file_unique_id: Telegram file identifier
+        Returns:
+            str: cache key
+        """
+        audio_id = f"telegram:{file_unique_id}" if file_unique_id else f"sha256:{get_audio_hash(audio)}"
+        return f"{self._model_id}/{audio_id}"
+
+    def get(self, key: str) -> Optional[str]:
+        transcription = self._memory.get(key)
+        if transcription is None:
+            value = self._disk.get(key)
+            if value is not None:
+                transcription = value.decode()
+                self._memory.put(key, transcription)
+
+        with self._lock:
+            if transcription is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+        logging.info("Transcription cache hit, hit rate: %.2f", self.stats.hit_rate)
+        return transcription
+
+    def put(self, key: str, transcription: str) -> None:
+        self._memory.put(key, transcription)
+        self._disk.put(key, transcription.encode())
+
+    @property
+    def memory_stats(self) -> CacheStats:
+        return self._memory.stats
+
+    @property
+    def disk_stats(self) -> CacheStats:
+        return self._disk.stats
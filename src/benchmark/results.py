@@ -0,0 +1,104 @@
+import json
+import os
+import platform
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+@dataclass
+class CaseResult:
+    """
+    Timings of a benchmark case over the repeats
+    """
+
+    median_ms: float
+    min_ms: float
+    repeats: int
+
+
+@dataclass
+class Comparison:
+    """
+    Change of the median time of a case relative to the baseline
+    """
+
+    name: str
+    baseline_ms: float
+    current_ms: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current_ms / self.baseline_ms if self.baseline_ms else float("inf")
+
+    def is_regression(self, threshold: float) -> bool:
+        return self.ratio > 1 + threshold
+
+
+def get_host_info() -> Dict[str, object]:
+    """
+    Get the host description stored with the results, timings of different hosts are not comparable
+    """
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def save_results(path: Path, results: Dict[str, CaseResult]) -> None:
+    """
+    Save the results to a JSON file, which can be used as a baseline
+    Args:
+        path: JSON file path
+        results: map of case names to results
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": get_host_info(),
+        "results": {name: asdict(result) for name, result in sorted(results.items())},
+    }
+    path.write_text(json.dumps(data, indent=2) + "\n")
+
+
+def load_results(path: Path) -> Dict[str, CaseResult]:
+    """
+    Load the results saved by `save_results`
+    Args:
+        path: JSON file path
+    Returns:
+        Dict[str, CaseResult]: map of case names to results
+    """
+    data = json.loads(path.read_text())
+    return {name: CaseResult(**result) for name, result in data["results"].items()}
+
+
+def compare_results(baseline: Dict[str, CaseResult], current: Dict[str, CaseResult]) -> List[Comparison]:
+    """
+    Compare the median times of the cases present in both results
+    Args:
+        baseline: baseline results
+        current: current results
+    Returns:
+        List[Comparison]: comparisons in the order of the current results
+    """
+    return [
+        Comparison(name, baseline[name].median_ms, result.median_ms)
+        for name, result in current.items()
+        if name in baseline
+    ]
+
+
+def format_comparison(comparison: Comparison, threshold: float) -> str:
+    status: Optional[str] = None
+    if comparison.is_regression(threshold):
+        status = "REGRESSION"
+    elif comparison.ratio < 1 - threshold:
+        status = "improvement"
+    return (
+        f"{comparison.name:<40} {comparison.baseline_ms:>10.2f} ms -> {comparison.current_ms:>10.2f} ms "
+        f"({comparison.ratio:.2f}x){f'  {status}' if status else ''}"
+    )
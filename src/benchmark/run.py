@@ -0,0 +1,204 @@
+import io
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from tap import Tap
+
+from src.audio2text.features import LogMelExtractor, decode_audio
+from src.audio2text.speech_recognition import merge_transcriptions
+from src.benchmark.results import (
+    CaseResult,
+    compare_results,
+    format_comparison,
+    load_results,
+    save_results,
+)
+from src.benchmark.synthetic import (
+    get_synthetic_audio,
+    get_synthetic_captions,
+    get_synthetic_image,
+    get_synthetic_mask,
+    get_synthetic_sticker,
+    get_synthetic_transcriptions,
+    get_synthetic_wav,
+)
+from src.image_processing.command import Command, CommandParameters
+from src.image_processing.command_parser.command_parser import ParserParameters
+from src.image_processing.command_parser.language_package import LanguageType
+from src.image_processing.command_parser.pattern_command_parser import PatternCommandParser
+from src.image_processing.kernels.kernel import Kernel
+from src.image_processing.kernels.kernel_map import get_kernel_map
+from src.image_processing.kernels.kernel_types import KernelTypes
+from src.image_statistics import ImageStatistics
+from src.sticker_generator.sticker_generator import StickerGenerator
+from src.utils import get_average_brightness, get_contrast, get_level_of_detail, get_saturation
+
+
+class Arguments(Tap):
+    output: Optional[Path] = None  # Save the results to this JSON file, e.g. to create a baseline
+    baseline: Optional[Path] = None  # Compare the results to this JSON file
+    threshold: float = 0.1  # Relative slowdown of the median time which is reported as a regression
+    cases: List[str] = []  # Only run the cases whose names start with one of these prefixes
+    repeats: int = 7
+    width: int = 2000
+    height: int = 1500
+    num_captions: int = 1000
+    audio_duration_s: float = 30.0
+
+
+# Representative parameters of every kernel of the kernel map
+KERNEL_PARAMETERS: Dict[KernelTypes, CommandParameters] = {
+    KernelTypes.RESIZE: CommandParameters(width="1024", height="768"),
+    KernelTypes.ROTATE: CommandParameters(angle="90"),
+    KernelTypes.CONTRAST: CommandParameters(step="20"),
+    KernelTypes.CROP: CommandParameters(width="1000", height="800"),
+    KernelTypes.GRAYSCALE: CommandParameters(),
+    KernelTypes.INVERT: CommandParameters(),
+    KernelTypes.BLUR: CommandParameters(step="9"),
+    KernelTypes.SHARPEN: CommandParameters(step="1"),
+}
+
+
+@dataclass
+class BenchmarkCase:
+    """
+    Workload of a single measurement, its inputs are prepared in advance
+    """
+
+    name: str
+    func: Callable[[], object]
+
+
+def apply_kernel(kernel: type[Kernel], image: np.ndarray, parameters: CommandParameters) -> np.ndarray:
+    # Crop and rotate return views, the copy is taken as it is when the result is converted to PIL
+    return np.ascontiguousarray(kernel.process(image=image, params=parameters))
+
+
+def parse_captions(parser: PatternCommandParser, captions: List[str]) -> List[List[Command]]:
+    return [parser.parse_text(caption, ParserParameters()) for caption in captions]
+
+
+def get_kernel_cases(args: Arguments) -> List[BenchmarkCase]:
+    image = np.ascontiguousarray(get_synthetic_image(args.height, args.width).array)
+    cases = []
+    for kernel_type, kernel in get_kernel_map().items():
+        if kernel_type not in KERNEL_PARAMETERS:
+            raise ValueError(f"No benchmark parameters for {kernel_type}")
+        cases.append(
+            BenchmarkCase(
+                f"kernel.{kernel_type.value}", partial(apply_kernel, kernel, image, KERNEL_PARAMETERS[kernel_type])
+            )
+        )
+    return cases
+
+
+def get_parser_cases(args: Arguments) -> List[BenchmarkCase]:
+    captions = get_synthetic_captions(args.num_captions)
+    return [
+        BenchmarkCase(
+            f"parser.pattern.{language.value}", partial(parse_captions, PatternCommandParser(language), captions)
+        )
+        for language in LanguageType
+    ]
+
+
+def get_statistics_cases(args: Arguments) -> List[BenchmarkCase]:
+    image = get_synthetic_image(args.height, args.width).to_pil()
+    image_statistics = ImageStatistics()
+    return [
+        BenchmarkCase("statistics.utils.brightness", lambda: get_average_brightness(image)),
+        BenchmarkCase("statistics.utils.contrast", lambda: get_contrast(image)),
+        BenchmarkCase("statistics.utils.saturation", lambda: get_saturation(image)),
+        BenchmarkCase("statistics.utils.level_of_detail", lambda: get_level_of_detail(image)),
+        BenchmarkCase("statistics.engine", lambda: image_statistics.compute(image)),
+    ]
+
+
+def get_sticker_cases(args: Arguments) -> List[BenchmarkCase]:
+    # pylint: disable=protected-access
+    alpha = np.full((args.height, args.width), 255, dtype=np.uint8)
+    image = np.dstack([get_synthetic_image(args.height, args.width).array, alpha])
+    raw_mask = get_synthetic_mask(args.height, args.width)
+    mask = StickerGenerator._postprocess_mask(raw_mask)
+    sticker = get_synthetic_sticker(args.height // 2, args.width // 2)
+    return [
+        BenchmarkCase("sticker.postprocess_mask", lambda: StickerGenerator._postprocess_mask(raw_mask)),
+        BenchmarkCase("sticker.apply_mask", lambda: StickerGenerator._apply_mask(image, mask)),
+        BenchmarkCase("sticker.resize_to_sticker", lambda: StickerGenerator._resize_to_sticker(sticker)),
+    ]
+
+
+def get_audio_cases(args: Arguments) -> List[BenchmarkCase]:
+    audio = get_synthetic_audio(args.audio_duration_s)
+    extractor = LogMelExtractor()
+    wav = get_synthetic_wav(args.audio_duration_s)
+    transcriptions = get_synthetic_transcriptions(20)
+
+    def merge_chunks() -> str:
+        text = transcriptions[0]
+        for transcription in transcriptions[1:]:
+            text = merge_transcriptions(text, transcription)
+        return text
+
+    return [
+        BenchmarkCase("audio.log_mel", lambda: extractor([audio])),
+        BenchmarkCase("audio.decode_resample", lambda: decode_audio(io.BytesIO(wav))),
+        BenchmarkCase("audio.merge_transcriptions", merge_chunks),
+    ]
+
+
+def get_benchmark_cases(args: Arguments) -> List[BenchmarkCase]:
+    cases = []
+    for get_cases in (get_kernel_cases, get_parser_cases, get_statistics_cases, get_sticker_cases, get_audio_cases):
+        cases.extend(get_cases(args))
+    return cases
+
+
+def measure(func: Callable[[], object], repeats: int) -> CaseResult:
+    # The first call warms up the caches and the lazily compiled patterns
+    func()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return CaseResult(median_ms=float(np.median(timings)) * 1000, min_ms=float(np.min(timings)) * 1000, repeats=repeats)
+
+
+def main() -> None:
+    logging.disable(logging.INFO)
+    args = Arguments(underscores_to_dashes=True).parse_args()
+
+    results: Dict[str, CaseResult] = {}
+    for case in get_benchmark_cases(args):
+        if args.cases and not any(case.name.startswith(prefix) for prefix in args.cases):
+            continue
+        result = measure(case.func, args.repeats)
+        results[case.name] = result
+        print(f"{case.name:<40} median: {result.median_ms:>10.2f} ms, min: {result.min_ms:.2f} ms")
+
+    if args.output is not None:
+        save_results(args.output, results)
+        print(f"Results are saved to {args.output}")
+
+    if args.baseline is None:
+        return
+
+    comparisons = compare_results(load_results(args.baseline), results)
+    print(f"Comparison to {args.baseline}, threshold: {args.threshold:.0%}")
+    for comparison in comparisons:
+        print(format_comparison(comparison, args.threshold))
+    regressions = [comparison.name for comparison in comparisons if comparison.is_regression(args.threshold)]
+    if regressions:
+        print(f"{len(regressions)} regressions: {regressions}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import io
+from typing import List
+
+import cv2
+import numpy as np
+import soundfile as sf
+from PIL import Image
+
+from src.audio2text.features import SAMPLE_RATE
+from src.image_processing.benchmark import get_synthetic_image
+from src.image_processing.command_parser.benchmark import get_caption_corpus
+
+
+def get_synthetic_mask(height: int, width: int) -> np.ndarray:
+    """
+    Get a raw segmentation mask of an object in the image center with noisy edges, as SAM predicts it
+    """
+    rng = np.random.default_rng(0)
+    mask = np.zeros((height, width), dtype=np.float32)
+    cv2.ellipse(mask, (width // 2, height // 2), (width // 3, height // 3), 0, 0, 360, 1.0, -1)
+    mask += rng.normal(0, 0.2, mask.shape).astype(np.float32)
+    return cv2.GaussianBlur(mask, (7, 7), 0)
+
+
+def get_synthetic_sticker(height: int, width: int) -> Image.Image:
+    """
+    Get a cropped RGBA object, as it is passed to the sticker resize
+    """
+    image = get_synthetic_image(height, width).array
+    alpha = (get_synthetic_mask(height, width) > 0.5).astype(np.uint8) * 255
+    return Image.fromarray(np.dstack([image, alpha]), mode="RGBA")
+
+
+def get_synthetic_audio(duration_s: float, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Get a waveform of a few harmonics with varying loudness and background noise
+    """
+    rng = np.random.default_rng(0)
+    time = np.arange(int(duration_s * sample_rate), dtype=np.float32) / sample_rate
+    waveform = sum(
+        np.sin(2 * np.pi * frequency * time) / (index + 1) for index, frequency in enumerate([220, 440, 880])
+    )
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 0.5 * time)
+    noise = rng.normal(0, 0.05, time.shape).astype(np.float32)
+    return np.asarray(0.3 * envelope * waveform + noise, dtype=np.float32)
+
+
+def get_synthetic_wav(duration_s: float, sample_rate: int = 44100) -> bytes:
+    """
+    Get the synthetic waveform encoded as a 16-bit WAV file, as voice messages are recorded at other sample rates
+    """
+    buffer = io.BytesIO()
+    sf.write(buffer, get_synthetic_audio(duration_s, sample_rate), sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def get_synthetic_captions(size: int) -> List[str]:
+    """
+    Get random captions of one to four commands in both languages
+    """
+    return get_caption_corpus(size)
+
+
+def get_synthetic_transcriptions(num_chunks: int, words_per_chunk: int = 60, overlap_words: int = 8) -> List[str]:
+    """
+    Get transcriptions of consecutive chunks which share `overlap_words` words at their boundaries
+    """
+    rng = np.random.default_rng(0)
+    vocabulary = [f"word{index}" for index in range(500)]
+    step = words_per_chunk - overlap_words
+    words = [str(word) for word in rng.choice(vocabulary, step * num_chunks + overlap_words)]
+    return [" ".join(words[index * step : index * step + words_per_chunk]) for index in range(num_chunks)]
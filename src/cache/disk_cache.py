@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.cache.lru_cache import CacheStats
+
+# Age of a temporary file after which its writer is considered dead, a value is written in a fraction of a second
+STALE_TEMPORARY_FILE_AGE_S = 60 * 60
+
+
+class DiskCache:
+    """
+    Size-bounded store of byte values in a folder, so cached values survive restarts.
+    Every value is a separate file, the least recently used files are deleted above `max_size_bytes`
+    """
+
+    def __init__(self, folder: Path, max_size_bytes: int) -> None:
+        self._folder = folder
+        self._max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+        self._folder.mkdir(parents=True, exist_ok=True)
+        self._remove_stale_temporary_files()
+        # File name -> size, ordered by the last access time
+        self._sizes: Dict[str, int] = {}
+        for path in sorted(self._folder.glob("*.bin"), key=lambda path: path.stat().st_mtime):
+            self._sizes[path.name] = path.stat().st_size
+
+    def _remove_stale_temporary_files(self) -> None:
+        """
+        Remove the temporary files left behind by processes which died while a value was written.
+        Other processes may share the folder, so recent files are kept as they may still be written
+        """
+        min_mtime = time.time() - STALE_TEMPORARY_FILE_AGE_S
+        for path in self._folder.glob("*.tmp"):
+            try:
+                if path.stat().st_mtime < min_mtime:
+                    path.unlink()
+            except FileNotFoundError:
+                # The writer has renamed or removed the file meanwhile
+                continue
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Get the cached value and mark it as recently used
+        Args:
+            key: cache key
+        Returns:
+            Optional[bytes]: the cached value or None if the key is not cached
+        """
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def get_path(self, key: str) -> Optional[Path]:
+        """
+        Get the file of the cached value and mark it as recently used, so the value can be memory-mapped.
+        The file stays readable through an open handle or a memory map even if it is evicted later
+        Args:
+            key: cache key
+        Returns:
+            Optional[Path]: the path to the cached value or None if the key is not cached
+        """
+        name = self._get_file_name(key)
+        with self._lock:
+            if name not in self._sizes:
+                self.stats.misses += 1
+                return None
+            self._sizes[name] = self._sizes.pop(name)
+
+        path = self._folder / name
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._sizes.pop(name, None)
+                self.stats.misses += 1
+            return None
+
+        with self._lock:
+            self.stats.hits += 1
+        return path
+
+    def put(self, key: str, value: bytes) -> None:
+        """
+        Store the value, deleting the least recently used values if the cache exceeds its size
+        Args:
+            key: cache key
+            value: value to store
+        """
+        if len(value) > self._max_size_bytes:
+            return
+
+        name = self._get_file_name(key)
+        # The value is written to a temporary file first, so readers never see a partially written file
+        with tempfile.NamedTemporaryFile(dir=self._folder, suffix=".tmp", delete=False) as tmp_file:
+            tmp_file.write(value)
+        os.replace(tmp_file.name, self._folder / name)
+
+        with self._lock:
+            self._sizes.pop(name, None)
+            self._sizes[name] = len(value)
+            self._evict()
+
+    def _evict(self) -> None:
+        total_size = sum(self._sizes.values())
+        while total_size > self._max_size_bytes:
+            name = next(iter(self._sizes))
+            total_size -= self._sizes.pop(name)
+            try:
+                (self._folder / name).unlink()
+            except FileNotFoundError:
+                logging.warning("Cached file %s was already deleted", name)
+
+    @staticmethod
+    def _get_file_name(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest() + ".bin"
@@ -0,0 +1,77 @@
+import multiprocessing
+import resource
+import time
+from dataclasses import replace
+from typing import Dict, List, Tuple
+
+from tap import Tap
+
+from src.image_generation.generation import (
+    GenerationParameters,
+    GenerationProfile,
+    SchedulerType,
+    StableDiffusionPipeline,
+    get_cpu_generation_profile,
+)
+
+
+class Arguments(Tap):
+    prompt: str = "Astronaut in a jungle, cold color palette, muted colors, detailed, 8k"
+    model_path: str = "stable-diffusion-v1-5/stable-diffusion-v1-5"
+    num_inference_steps: int = 20
+    seed: int = 0
+    num_threads: List[int] = []  # Thread counts to compare, the torch default is used if empty
+
+
+def get_profiles(num_inference_steps: int, num_threads: List[int]) -> Dict[str, GenerationProfile]:
+    """
+    Get the baseline profile, the baseline with every single option enabled and the CPU profile
+    """
+    baseline = GenerationProfile(num_inference_steps=num_inference_steps)
+    profiles = {
+        "baseline": baseline,
+        "attention slicing": replace(baseline, attention_slicing=True),
+        "vae slicing": replace(baseline, vae_slicing=True),
+        "vae tiling": replace(baseline, vae_tiling=True),
+        "channels last": replace(baseline, channels_last=True),
+        "bf16 autocast": replace(baseline, bf16_autocast=True),
+        "dpm solver": replace(baseline, scheduler=SchedulerType.DPM_SOLVER),
+        "dpm solver, half steps": replace(
+            baseline, scheduler=SchedulerType.DPM_SOLVER, num_inference_steps=num_inference_steps // 2
+        ),
+        "cpu profile": get_cpu_generation_profile(),
+    }
+    for threads in num_threads:
+        profiles[f"{threads} threads"] = replace(baseline, num_threads=threads)
+    return profiles
+
+
+def run_profile(model_path: str, profile: GenerationProfile, prompt: str, seed: int) -> Tuple[float, float]:
+    """
+    Measure a single profile. It runs in a separate process, so the peak memory is not shared
+    Returns:
+        Tuple[float, float]: latency in seconds and peak resident memory in MB
+    """
+    pipeline = StableDiffusionPipeline(model_path, profile)
+
+    start = time.perf_counter()
+    pipeline.generate_image(prompt, GenerationParameters(seed=seed))
+    latency = time.perf_counter() - start
+
+    # ru_maxrss is reported in kilobytes on Linux
+    return latency, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    args = Arguments(underscores_to_dashes=True).parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'profile':>24} | {'steps':>5} | {'latency, s':>10} | {'peak RSS, MB':>12}")
+    for name, profile in get_profiles(args.num_inference_steps, args.num_threads).items():
+        with context.Pool(1) as pool:
+            latency, peak_memory_mb = pool.apply(run_profile, (args.model_path, profile, args.prompt, args.seed))
+        print(f"{name:>24} | {profile.num_inference_steps:>5} | {latency:>10.1f} | {peak_memory_mb:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,219 @@
+import logging
+import os
+from contextlib import nullcontext
+from dataclasses import dataclass
+from enum import Enum
+from typing import ContextManager, Optional, cast
+
 import torch
-from diffusers import DiffusionPipeline
+from diffusers import (
+    DiffusionPipeline,
+    DPMSolverMultistepScheduler,
+    EulerAncestralDiscreteScheduler,
+    EulerDiscreteScheduler,
+)
 from PIL import Image
 
+from src.image_generation.job import GenerationCancelledError, GenerationJob, JobStatus
+
+DEFAULT_MODEL_PATH = "stable-diffusion-v1-5/stable-diffusion-v1-5"
+
+
+class SchedulerType(Enum):
+    DEFAULT = "default"
+    DPM_SOLVER = "dpm_solver"
+    EULER = "euler"
+    EULER_ANCESTRAL = "euler_ancestral"
+
+
+SCHEDULERS = {
+    SchedulerType.DPM_SOLVER: DPMSolverMultistepScheduler,
+    SchedulerType.EULER: EulerDiscreteScheduler,
+    SchedulerType.EULER_ANCESTRAL: EulerAncestralDiscreteScheduler,
+}
+
+
+@dataclass
+class GenerationProfile:
+    """
+    Execution options of the pipeline. The defaults keep the diffusers defaults
+    """
+
+    attention_slicing: bool = False
+    vae_tiling: bool = False
+    vae_slicing: bool = False
+    channels_last: bool = False
+    bf16_autocast: bool = False
+    num_threads: Optional[int] = None
+    scheduler: SchedulerType = SchedulerType.DEFAULT
+    num_inference_steps: int = 50
+
+
+@dataclass(frozen=True)
+class GenerationParameters:
+    """
+    Parameters of a single generation. The same seed and parameters give the same image
+    """
+
+    seed: Optional[int] = None  # A random seed is used if it is not set
+    num_inference_steps: Optional[int] = None  # The step count of the profile is used if it is not set
+    guidance_scale: float = 7.5
+    width: int = 512
+    height: int = 512
+
+    def __post_init__(self) -> None:
+        if self.width % 8 or self.height % 8:
+            raise ValueError(f"Image size must be divisible by 8, got {self.width}x{self.height}")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize the prompt the way the CLIP tokenizer does: case and repeated whitespace do not change the image
+    """
+    return " ".join(prompt.lower().split())
+
+
+def get_cpu_generation_profile() -> GenerationProfile:
+    """
+    Get the profile for CPU-only hosts: lower peak memory, a multistep scheduler which needs fewer steps
+    and bfloat16 autocast if the CPU supports it natively
+    """
+    return GenerationProfile(
+        attention_slicing=True,
+        vae_slicing=True,
+        channels_last=True,
+        bf16_autocast=is_bf16_supported("cpu"),
+        scheduler=SchedulerType.DPM_SOLVER,
+        num_inference_steps=25,
+    )
+
+
+def get_generation_profile_from_env() -> GenerationProfile:
+    """
+    Get the generation profile selected by `IMAGE_GENERATION_PROFILE` (`default` or `cpu`) environment variable
+    with overrides from `IMAGE_GENERATION_STEPS` and `IMAGE_GENERATION_THREADS`
+    Returns:
+        GenerationProfile: generation profile
+    """
+    profile = GenerationProfile()
+    if os.environ.get("IMAGE_GENERATION_PROFILE") == "cpu":
+        profile = get_cpu_generation_profile()
+    steps = os.environ.get("IMAGE_GENERATION_STEPS")
+    if steps:
+        profile.num_inference_steps = int(steps)
+    threads = os.environ.get("IMAGE_GENERATION_THREADS")
+    if threads:
+        profile.num_threads = int(threads)
+    return profile
+
+
+def is_bf16_supported(device: str) -> bool:
+    """
+    Check if the device runs bfloat16 natively, emulated bfloat16 is slower than float32
+    """
+    if device == "cuda":
+        return bool(torch.cuda.is_bf16_supported())
+    return bool(getattr(torch.cpu, "_is_avx512_bf16_supported", lambda: False)())
+
 
 class StableDiffusionPipeline:
-    def __init__(self, model_path: str = "stable-diffusion-v1-5/stable-diffusion-v1-5"):
+    def __init__(
+        self,
+        model_path: str = DEFAULT_MODEL_PATH,
+        profile: Optional[GenerationProfile] = None,
+    ):
+        """
+        Args:
+            model_path: path or hub name of the diffusion model
+            profile: execution options of the pipeline
+        """
         self._model_path = model_path
         self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._profile = profile or GenerationProfile()
+
+        if self._profile.num_threads is not None:
+            # The thread count is shared by the whole process
+            torch.set_num_threads(self._profile.num_threads)
+
         self._pipeline = DiffusionPipeline.from_pretrained(self._model_path).to(self._device)
+        self._apply_profile()
+        # The negative prompt is always empty, so its embedding is computed once
+        self._negative_prompt_embeds = self._encode_prompt("")
+
+    @property
+    def profile(self) -> GenerationProfile:
+        return self._profile
+
+    def _apply_profile(self) -> None:
+        profile = self._profile
+        if profile.scheduler != SchedulerType.DEFAULT:
+            scheduler_class = SCHEDULERS[profile.scheduler]
+            self._pipeline.scheduler = scheduler_class.from_config(self._pipeline.scheduler.config)
+        if profile.attention_slicing:
+            self._pipeline.enable_attention_slicing()
+        if profile.vae_slicing:
+            self._pipeline.enable_vae_slicing()
+        if profile.vae_tiling:
+            self._pipeline.enable_vae_tiling()
+        if profile.channels_last:
+            self._pipeline.unet.to(memory_format=torch.channels_last)
+            self._pipeline.vae.to(memory_format=torch.channels_last)
+        if profile.bf16_autocast and not is_bf16_supported(self._device):
+            logging.warning("bfloat16 is emulated on %s, autocast may be slower than float32", self._device)
+
+    def _get_autocast(self) -> ContextManager:
+        if self._profile.bf16_autocast:
+            return torch.autocast(device_type=self._device, dtype=torch.bfloat16)
+        return nullcontext()
+
+    def _encode_prompt(self, prompt: str) -> torch.Tensor:
+        with torch.no_grad(), self._get_autocast():
+            prompt_embeds, _ = self._pipeline.encode_prompt(
+                prompt, self._device, num_images_per_prompt=1, do_classifier_free_guidance=False
+            )
+        return cast(torch.Tensor, prompt_embeds)
+
+    def generate_image(
+        self,
+        prompt: str,
+        parameters: Optional[GenerationParameters] = None,
+        job: Optional[GenerationJob] = None,
+    ) -> Image.Image:
+        """
+        Generate an image for the prompt
+        Args:
+            prompt: text prompt
+            parameters: seed, step count, guidance and size of the image
+            job: job which receives the progress, the generation stops at the next step if the job is cancelled
+        Returns:
+            Image.Image: generated image
+        """
+        parameters = parameters or GenerationParameters()
+        if job is None:
+            job = GenerationJob(prompt)
+
+        num_inference_steps = parameters.num_inference_steps or self._profile.num_inference_steps
+        # Latents are sampled on CPU, so a seed gives the same image on every device
+        generator = torch.Generator("cpu").manual_seed(parameters.seed) if parameters.seed is not None else None
 
-    def generate_image(self, prompt: str) -> Image.Image:
-        image: Image.Image = self._pipeline(prompt).images[0]
+        job.start(num_inference_steps)
+        try:
+            with self._get_autocast():
+                image: Image.Image = self._pipeline(
+                    prompt,
+                    negative_prompt_embeds=self._negative_prompt_embeds,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=parameters.guidance_scale,
+                    width=parameters.width,
+                    height=parameters.height,
+                    generator=generator,
+                    callback_on_step_end=job.on_step_end,
+                ).images[0]
+        except GenerationCancelledError:
+            logging.info("Generation job %s is cancelled at step %d", job.job_id, job.step)
+            raise
+        except Exception:
+            job.finish(JobStatus.FAILED)
+            raise
+        job.finish(JobStatus.DONE)
         return image
@@ -0,0 +1,100 @@
+import hashlib
+import io
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from src.cache.disk_cache import DiskCache
+from src.cache.lru_cache import CacheStats, LRUCache
+from src.image_generation.generation import GenerationParameters, GenerationProfile, normalize_prompt
+
+
+def get_prompt_seed(prompt: str) -> int:
+    """
+    Get a seed derived from the normalized prompt, so identical prompts give the same image
+    """
+    digest = hashlib.sha256(normalize_prompt(prompt).encode()).digest()
+    return int.from_bytes(digest[:4], "little")
+
+
+class GenerationCache:
+    """
+    Generated images keyed by the normalized prompt, the generation parameters and the model identity.
+    Only seeded generations are cached, images of random seeds are never requested again.
+    Recent images are kept in memory, the rest are read from a size-bounded folder of PNG files which survives restarts
+    """
+
+    def __init__(  # pylint: disable=too-many-positional-arguments, too-many-arguments
+        self,
+        folder: Path,
+        model_id: str,
+        profile: GenerationProfile,
+        memory_size: int = 32,
+        disk_size_bytes: int = 512 * 1024 * 1024,
+    ) -> None:
+        """
+        Args:
+            folder: folder of the on-disk store
+            model_id: identity of the diffusion model, images of other models are not reused
+            profile: generation profile of the pipeline, its scheduler, step count and precision change the image
+            memory_size: number of images kept in memory
+            disk_size_bytes: size of the on-disk store
+        """
+        self._model_id = f"{model_id}/{profile.scheduler.value}/bf16={profile.bf16_autocast}"
+        self._default_steps = profile.num_inference_steps
+        self._memory = LRUCache[str, Image.Image](memory_size)
+        self._disk = DiskCache(folder, disk_size_bytes)
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def get_key(self, prompt: str, parameters: GenerationParameters) -> Optional[str]:
+        """
+        Get the cache key of the generation
+        Args:
+            prompt: text prompt
+            parameters: generation parameters
+        Returns:
+            Optional[str]: cache key or None if the generation is not seeded
+        """
+        if parameters.seed is None:
+            return None
+        steps = parameters.num_inference_steps or self._default_steps
+        return (
+            f"{self._model_id}/seed={parameters.seed}/steps={steps}/guidance={parameters.guidance_scale}/"
+            f"size={parameters.width}x{parameters.height}/{normalize_prompt(prompt)}"
+        )
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        image = self._memory.get(key)
+        if image is None:
+            value = self._disk.get(key)
+            if value is not None:
+                image = Image.open(io.BytesIO(value))
+                image.load()
+                self._memory.put(key, image)
+
+        with self._lock:
+            if image is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+        logging.info("Generation cache hit, hit rate: %.2f", self.stats.hit_rate)
+        # Callers get a copy, so the cached image is never modified
+        return image.copy()
+
+    def put(self, key: str, image: Image.Image) -> None:
+        self._memory.put(key, image.copy())
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        self._disk.put(key, buffer.getvalue())
+
+    @property
+    def memory_stats(self) -> CacheStats:
+        return self._memory.stats
+
+    @property
+    def disk_stats(self) -> CacheStats:
+        return self._disk.stats
@@ -0,0 +1,77 @@
+import threading
+import uuid
+from enum import Enum
+from typing import Any, Dict, Optional
+
+
+class GenerationCancelledError(Exception):
+    """
+    Raised in the worker when the generation job is cancelled
+    """
+
+
+class JobStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+
+class GenerationJob:
+    """
+    Progress and cancellation state of a single generation, shared by the worker running the pipeline
+    and the event loop reporting the progress. The pipeline stops at the next denoising step after cancellation
+    """
+
+    def __init__(self, prompt: str, job_id: Optional[str] = None) -> None:
+        self.job_id = job_id or uuid.uuid4().hex[:16]
+        self.prompt = prompt
+        self.status = JobStatus.PENDING
+        self.step = 0
+        self.total_steps = 0
+        self._cancelled = threading.Event()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.CANCELLED, JobStatus.FAILED)
+
+    @property
+    def progress(self) -> float:
+        return self.step / self.total_steps if self.total_steps else 0.0
+
+    def cancel(self) -> None:
+        """
+        Request the cancellation. A pending job does not start, a running job stops at the next step
+        """
+        self._cancelled.set()
+
+    def start(self, total_steps: int) -> None:
+        """
+        Mark the job as running in the worker
+        Args:
+            total_steps: number of denoising steps
+        """
+        self._raise_if_cancelled()
+        self.total_steps = total_steps
+        self.status = JobStatus.RUNNING
+
+    def finish(self, status: JobStatus) -> None:
+        self.status = status
+
+    def on_step_end(self, _pipeline: Any, step: int, _timestep: Any, callback_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Callback for `callback_on_step_end` of diffusers pipelines
+        """
+        self.step = step + 1
+        self._raise_if_cancelled()
+        return callback_kwargs
+
+    def _raise_if_cancelled(self) -> None:
+        if self.is_cancelled:
+            self.status = JobStatus.CANCELLED
+            raise GenerationCancelledError(f"Generation job {self.job_id} is cancelled")
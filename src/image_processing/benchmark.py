@@ -0,0 +1,175 @@
+import os
+import time
+import tracemalloc
+from typing import Callable, List
+
+import cv2
+import numpy as np
+from tap import Tap
+
+from src.image_processing.command import Command, CommandParameters
+from src.image_processing.image_buffer import ChannelOrder, ImageBuffer
+from src.image_processing.image_processor import ImageProcessor
+from src.image_processing.kernels.kernel_types import KernelTypes
+from src.image_processing.tiled_executor import TilingConfig
+from src.inference.executor import ExecutorType
+
+
+class Arguments(Tap):
+    width: int = 4000
+    height: int = 3000
+    repeats: int = 5
+    memory_limit_mb: int = 32  # Working memory of the tiled processor
+    max_workers: int = os.cpu_count() or 1  # Largest number of tile workers of the scaling benchmark
+
+
+def get_synthetic_image(height: int, width: int) -> ImageBuffer:
+    """
+    Get a smooth random RGB image, so interpolation differences are comparable to real photos
+    """
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+    return ImageBuffer(cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC), ChannelOrder.RGB)
+
+
+def get_benchmark_queues() -> List[List[Command]]:
+    return [
+        [
+            Command(KernelTypes.ROTATE, CommandParameters(angle="90")),
+            Command(KernelTypes.RESIZE, CommandParameters(width="800", height="600")),
+            Command(KernelTypes.CROP, CommandParameters(width="400", height="300")),
+        ],
+        [
+            Command(KernelTypes.ROTATE, CommandParameters(angle="180")),
+            Command(KernelTypes.CROP, CommandParameters(width="2001", height="1501")),
+            Command(KernelTypes.ROTATE, CommandParameters(angle="-90")),
+        ],
+        [
+            Command(KernelTypes.RESIZE, CommandParameters(width="6000", height="4500")),
+            Command(KernelTypes.ROTATE, CommandParameters(angle="90")),
+            Command(KernelTypes.RESIZE, CommandParameters(width="1024", height="768")),
+        ],
+        [
+            Command(KernelTypes.CONTRAST, CommandParameters(step="20")),
+            Command(KernelTypes.INVERT, CommandParameters()),
+            Command(KernelTypes.CONTRAST, CommandParameters(step="-10")),
+        ],
+        [
+            Command(KernelTypes.BLUR, CommandParameters(step="5")),
+            Command(KernelTypes.BLUR, CommandParameters(step="9")),
+            Command(KernelTypes.GRAYSCALE, CommandParameters()),
+        ],
+        [
+            Command(KernelTypes.CONTRAST, CommandParameters(step="0")),
+            Command(KernelTypes.INVERT, CommandParameters()),
+            Command(KernelTypes.ROTATE, CommandParameters(angle="0")),
+            Command(KernelTypes.INVERT, CommandParameters()),
+        ],
+    ]
+
+
+def measure(func: Callable[[], object], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def get_scaling_queue() -> List[Command]:
+    """
+    Get a queue of neighbourhood and pointwise kernels, which is streamed as a whole
+    """
+    return [
+        Command(KernelTypes.BLUR, CommandParameters(step="9")),
+        Command(KernelTypes.SHARPEN, CommandParameters(step="1")),
+        Command(KernelTypes.CONTRAST, CommandParameters(step="20")),
+        Command(KernelTypes.RESIZE, CommandParameters(width="2000", height="1500")),
+    ]
+
+
+def measure_scaling(image: ImageBuffer, args: Arguments) -> None:
+    """
+    Print the speedup of the tile workers over a single worker for every number of workers up to `max_workers`
+    """
+    command_queue = get_scaling_queue()
+    print(f"Tile workers on {os.cpu_count()} cores: {[command.kernel_type.value for command in command_queue]}")
+    num_workers_list = sorted({2**power for power in range(args.max_workers.bit_length())} | {args.max_workers})
+
+    single_worker_time = None
+    for executor_type in ExecutorType:
+        for num_workers in num_workers_list:
+            config = TilingConfig(args.memory_limit_mb * 1024 * 1024, num_workers, executor_type)
+            processor = ImageProcessor(optimize=True, tiling=config)
+            # pylint: disable=protected-access, cell-var-from-loop
+            # The first call starts the worker pool
+            processor._apply_commands(image, command_queue)
+            elapsed = measure(lambda: processor._apply_commands(image, command_queue), args.repeats)
+            processor._tiled_executor.shutdown()  # type: ignore[union-attr]
+            if single_worker_time is None:
+                single_worker_time = elapsed
+            print(
+                f"    {executor_type.value} x{num_workers}: {elapsed * 1000:.1f} ms, "
+                f"speedup: {single_worker_time / elapsed:.2f}x"
+            )
+
+
+def measure_peak_memory(func: Callable[[], ImageBuffer]) -> int:
+    """
+    Get the peak of the memory allocated by the call, including the output
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    args = Arguments(underscores_to_dashes=True).parse_args()
+    image = get_synthetic_image(args.height, args.width)
+
+    sequential_processor = ImageProcessor(optimize=False)
+    optimized_processor = ImageProcessor(optimize=True)
+    tiled_processor = ImageProcessor(optimize=True, tiling=TilingConfig(args.memory_limit_mb * 1024 * 1024))
+
+    for command_queue in get_benchmark_queues():
+        # pylint: disable=protected-access, cell-var-from-loop
+        sequential = sequential_processor._apply_commands(image, command_queue)
+        optimized = optimized_processor._apply_commands(image, command_queue)
+        difference = np.abs(
+            np.asarray(sequential.to_pil(), dtype=np.int16) - np.asarray(optimized.to_pil(), dtype=np.int16)
+        )
+        is_tiled_equal = np.array_equal(
+            np.asarray(optimized.to_pil()), np.asarray(tiled_processor._apply_commands(image, command_queue).to_pil())
+        )
+
+        # Views are materialized, as they are when the result is converted to PIL
+        sequential_time = measure(
+            lambda: sequential_processor._apply_commands(image, command_queue).to_pil(), args.repeats
+        )
+        optimized_time = measure(
+            lambda: optimized_processor._apply_commands(image, command_queue).to_pil(), args.repeats
+        )
+        tiled_time = measure(lambda: tiled_processor._apply_commands(image, command_queue).to_pil(), args.repeats)
+        optimized_memory = measure_peak_memory(lambda: optimized_processor._apply_commands(image, command_queue))
+        tiled_memory = measure_peak_memory(lambda: tiled_processor._apply_commands(image, command_queue))
+
+        print([f"{command.kernel_type.value} {command.parameters}" for command in command_queue])
+        print(
+            f"    sequential: {sequential_time * 1000:.1f} ms, optimized: {optimized_time * 1000:.1f} ms, "
+            f"speedup: {sequential_time / optimized_time:.2f}x, "
+            f"mean abs difference: {difference.mean():.3f}, max abs difference: {difference.max()}"
+        )
+        print(
+            f"    tiled: {tiled_time * 1000:.1f} ms, peak memory: {optimized_memory / 2**20:.0f} MB whole, "
+            f"{tiled_memory / 2**20:.0f} MB tiled, equal to whole: {is_tiled_equal}"
+        )
+
+    measure_scaling(image, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import logging
+from typing import Callable, Dict, List, Optional, TypeAlias
+
+from src.image_processing.command import Command
+from src.image_processing.command_optimizer.filter_fusion import fuse_linear_filters
+from src.image_processing.command_optimizer.geometric_fusion import fuse_geometric_commands
+from src.image_processing.command_optimizer.grayscale_hoisting import hoist_grayscale
+from src.image_processing.command_optimizer.noop_elimination import remove_noop_commands
+from src.image_processing.command_optimizer.operations import GrayscaleOperation, ImageOperation, KernelOperation
+from src.image_processing.command_optimizer.pointwise_fusion import fuse_pointwise_commands
+from src.image_processing.kernels.kernel import Kernel
+from src.image_processing.kernels.kernel_types import KernelTypes
+
+OptimizationPass: TypeAlias = Callable[[List[ImageOperation]], List[ImageOperation]]
+
+
+def get_default_passes() -> List[OptimizationPass]:
+    """
+    Get the optimization passes in the order they are applied
+    Returns:
+        List[OptimizationPass]: optimization passes
+    """
+    return [
+        remove_noop_commands,
+        hoist_grayscale,
+        fuse_geometric_commands,
+        fuse_pointwise_commands,
+        fuse_linear_filters,
+    ]
+
+
+class CommandOptimizer:
+    """
+    Turns a command queue into a shorter list of operations with the same result
+    """
+
+    def __init__(
+        self, kernel_map: Dict[KernelTypes, type[Kernel]], passes: Optional[List[OptimizationPass]] = None
+    ) -> None:
+        self._kernel_map = kernel_map
+        self._passes = get_default_passes() if passes is None else passes
+
+    def optimize(self, command_queue: List[Command]) -> List[ImageOperation]:
+        """
+        Optimize the command queue
+        Args:
+            command_queue: list of commands
+        Returns:
+            List[ImageOperation]: operations to apply in order
+        """
+        operations: List[ImageOperation] = [
+            self._create_operation(command) for command in command_queue if command.kernel_type in self._kernel_map
+        ]
+        for optimization_pass in self._passes:
+            operations = optimization_pass(operations)
+
+        if len(operations) != len(command_queue):
+            logging.info("Optimized %d commands into %s", len(command_queue), operations)
+        return operations
+
+    def _create_operation(self, command: Command) -> KernelOperation:
+        if command.kernel_type == KernelTypes.GRAYSCALE:
+            return GrayscaleOperation(self._kernel_map[command.kernel_type], command)
+        return KernelOperation(self._kernel_map[command.kernel_type], command)
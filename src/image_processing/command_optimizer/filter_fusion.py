@@ -0,0 +1,86 @@
+import logging
+from typing import List
+
+import cv2
+import numpy as np
+
+from src.image_processing.command import Command
+from src.image_processing.command_optimizer.operations import ImageOperation, KernelOperation
+from src.image_processing.kernels.kernel_types import KernelTypes
+
+
+def get_blur_kernel(command: Command) -> np.ndarray:
+    """
+    Get the 1D Gaussian kernel used by BlurImage
+    Args:
+        command: blur command
+    Returns:
+        np.ndarray: column vector kernel
+    """
+    ksize = int(command.parameters.step)
+    if ksize % 2 == 0:
+        ksize += 1
+    return cv2.getGaussianKernel(ksize, 0)
+
+
+def _is_valid_blur(command: Command) -> bool:
+    return command.kernel_type == KernelTypes.BLUR and int(command.parameters.step) >= 0
+
+
+class FilterOperation(ImageOperation):
+    """
+    Several Gaussian blurs applied as a single separable convolution
+    """
+
+    def __init__(self, commands: List[Command]) -> None:
+        self._commands = commands
+
+        kernel = np.ones(1)
+        for command in commands:
+            kernel = np.convolve(kernel, get_blur_kernel(command).ravel())
+        self._kernel = kernel.reshape(-1, 1)
+
+    @property
+    def commands(self) -> List[Command]:
+        return self._commands
+
+    @property
+    def kernel(self) -> np.ndarray:
+        return self._kernel
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        logging.info("Applying fused filter commands: %s", [command.kernel_type for command in self._commands])
+        return cv2.sepFilter2D(image, -1, self._kernel, self._kernel)
+
+    def __repr__(self) -> str:
+        return f"FilterOperation({[command.kernel_type.value for command in self._commands]})"
+
+
+def fuse_linear_filters(operations: List[ImageOperation]) -> List[ImageOperation]:
+    """
+    Compose runs of consecutive blurs into one separable convolution.
+    Sharpening is left as is: it saturates its output, and a composed non-separable kernel is slower
+    than a blur followed by the 3x3 sharpen kernel
+    Args:
+        operations: operations of the command queue
+    Returns:
+        List[ImageOperation]: optimized operations
+    """
+    optimized: List[ImageOperation] = []
+    run: List[KernelOperation] = []
+
+    def flush_run() -> None:
+        if len(run) > 1:
+            optimized.append(FilterOperation([operation.command for operation in run]))
+        else:
+            optimized.extend(run)
+        run.clear()
+
+    for operation in operations:
+        if isinstance(operation, KernelOperation) and _is_valid_blur(operation.command):
+            run.append(operation)
+            continue
+        flush_run()
+        optimized.append(operation)
+    flush_run()
+    return optimized
@@ -0,0 +1,239 @@
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+from src.image_processing.command import Command
+from src.image_processing.command_optimizer.operations import ImageOperation, KernelOperation
+from src.image_processing.kernels.kernel_types import KernelTypes
+from src.image_processing.kernels.rotate import ROTATIONS
+
+GEOMETRIC_KERNELS = {KernelTypes.RESIZE, KernelTypes.ROTATE, KernelTypes.CROP}
+
+# Output rows resampled at once, so the coordinate maps stay in the cache
+_WARP_ROWS = 16
+
+# Rotation angle -> linear part of the output-to-source mapping
+_ROTATIONS: Dict[int, Tuple[Tuple[int, int], Tuple[int, int]]] = {
+    90: ((0, 1), (-1, 0)),
+    -90: ((0, -1), (1, 0)),
+    180: ((-1, 0), (0, -1)),
+}
+
+
+def _get_command_transform(command: Command, height: int, width: int) -> Tuple[np.ndarray, int, int]:
+    """
+    Get the 3x3 matrix which maps output pixel coordinates of the command to its input pixel coordinates
+    Args:
+        command: geometric command
+        height: input height
+        width: input width
+    Returns:
+        Tuple[np.ndarray, int, int]: matrix, output height and output width
+    """
+    params = command.parameters
+    if command.kernel_type == KernelTypes.ROTATE:
+        angle = int(params.angle)
+        if angle not in _ROTATIONS:
+            return np.eye(3), height, width
+        row_x, row_y = _ROTATIONS[angle]
+        # Translation keeps the rotated image inside the positive quadrant (see cv2.rotate)
+        offset_x = (width - 1) * (row_x[0] < 0 or row_x[1] < 0)
+        offset_y = (height - 1) * (row_y[0] < 0 or row_y[1] < 0)
+        matrix = np.array([[*row_x, offset_x], [*row_y, offset_y], [0, 0, 1]], dtype=np.float64)
+        if angle == 180:
+            return matrix, height, width
+        return matrix, width, height
+
+    out_width, out_height = int(params.width), int(params.height)
+    if command.kernel_type == KernelTypes.RESIZE:
+        # Pixel centers are aligned the same way as in cv2.resize
+        scale_x, scale_y = width / out_width, height / out_height
+        matrix = np.array(
+            [[scale_x, 0, 0.5 * scale_x - 0.5], [0, scale_y, 0.5 * scale_y - 0.5], [0, 0, 1]], dtype=np.float64
+        )
+        return matrix, out_height, out_width
+
+    # Crop around the image center as CropImage does
+    matrix = np.array(
+        [[1, 0, width // 2 - out_width // 2], [0, 1, height // 2 - out_height // 2], [0, 0, 1]], dtype=np.float64
+    )
+    return matrix, out_height, out_width
+
+
+def _is_pixel_permutation(matrix: np.ndarray) -> bool:
+    """
+    Check if the transform only moves whole pixels, so no resampling is required
+    """
+    return bool(np.allclose(matrix[:2, 2], np.round(matrix[:2, 2])) and np.isin(matrix[:2, :2], (-1, 0, 1)).all())
+
+
+def _is_fusable(command: Command) -> bool:
+    if command.kernel_type not in GEOMETRIC_KERNELS:
+        return False
+    if command.kernel_type == KernelTypes.ROTATE:
+        return True
+    return int(command.parameters.width) > 0 and int(command.parameters.height) > 0
+
+
+def warp_affine(  # pylint: disable=too-many-positional-arguments, too-many-arguments
+    image: np.ndarray,
+    matrix: np.ndarray,
+    height: int,
+    width: int,
+    start: int = 0,
+    source_origin: Tuple[int, int] = (0, 0),
+) -> np.ndarray:
+    """
+    Resample the image with the 2x3 matrix which maps output pixel coordinates to source pixel coordinates.
+    The coordinates are computed in the whole output and shifted by whole pixels, so a band of output rows
+    resampled from a region of the source is the same as these rows of the whole output
+    Args:
+        image: source image or its region
+        matrix: 2x3 matrix
+        height: number of output rows
+        width: output width
+        start: first output row
+        source_origin: column and row of the source where the image starts
+    Returns:
+        np.ndarray: output rows from `start` to `start + height`
+    """
+    columns = np.arange(width, dtype=np.float64)
+    rows = np.arange(start, start + height, dtype=np.float64)[:, None]
+    column_x, column_y = (matrix[0, 0] * columns).astype(np.float32), (matrix[1, 0] * columns).astype(np.float32)
+    row_x = (matrix[0, 1] * rows + matrix[0, 2]).astype(np.float32)
+    row_y = (matrix[1, 1] * rows + matrix[1, 2]).astype(np.float32)
+
+    output = np.empty((height, width, *image.shape[2:]), dtype=image.dtype)
+    for chunk_start in range(0, height, _WARP_ROWS):
+        chunk = slice(chunk_start, min(height, chunk_start + _WARP_ROWS))
+        map_x, map_y = column_x + row_x[chunk], column_y + row_y[chunk]
+        # Subtracting whole pixels is exact, so the interpolation weights do not depend on the source region
+        map_x -= source_origin[0]
+        map_y -= source_origin[1]
+        warped = cv2.remap(image, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        output[chunk] = warped.reshape(output[chunk].shape)
+    return output
+
+
+def apply_transform_as_slice(image: np.ndarray, matrix: np.ndarray, height: int, width: int) -> Optional[np.ndarray]:
+    """
+    Apply the transform as a view of the source image if it only moves whole pixels
+    Returns:
+        Optional[np.ndarray]: view of the source image or None if the transform needs resampling
+    """
+    if not _is_pixel_permutation(matrix):
+        return None
+
+    linear = matrix[:, :2]
+
+    quarter_turns = None
+    if np.array_equal(linear, np.eye(2)):
+        quarter_turns = 0
+    for angle, rotation_linear in _ROTATIONS.items():
+        if np.array_equal(linear, rotation_linear):
+            quarter_turns = ROTATIONS[angle]
+    if quarter_turns is None:
+        return None
+
+    corners = np.array([[0, 0, 1], [width - 1, height - 1, 1]], dtype=np.float64)
+    source_corners = np.round(corners @ matrix.T).astype(int)
+    x_start, y_start = source_corners.min(axis=0)
+    x_stop, y_stop = source_corners.max(axis=0) + 1
+    if x_start < 0 or y_start < 0 or x_stop > image.shape[1] or y_stop > image.shape[0]:
+        return None
+
+    return np.rot90(image[y_start:y_stop, x_start:x_stop], quarter_turns)
+
+
+class AffineOperation(ImageOperation):
+    """
+    Several geometric commands folded into a single resampling of the source image
+    """
+
+    def __init__(self, commands: List[Command]) -> None:
+        self._commands = commands
+
+    @property
+    def commands(self) -> List[Command]:
+        return self._commands
+
+    def get_transforms(self, height: int, width: int) -> List[Tuple[np.ndarray, int, int]]:
+        """
+        Get the matrices which map output pixel coordinates to source pixel coordinates.
+        A crop which reaches outside of a transformed image replicates its border, so it starts a new transform.
+        A resize starts a new transform after a crop or another resize: a single resampling differs from two
+        consecutive ones (details lost by a downscale are not restored by a later upscale), and the resize of
+        a cropped image replicates the border of the crop instead of reading the pixels around it
+        Args:
+            height: source height
+            width: source width
+        Returns:
+            List[Tuple[np.ndarray, int, int]]: 2x3 matrices with output heights and widths, in order of application
+        """
+        transforms = []
+        matrix = np.eye(3)
+        # Kernel types of the commands folded into the current transform
+        folded_kernels: Set[KernelTypes] = set()
+        for command in self._commands:
+            is_barrier = command.kernel_type == KernelTypes.RESIZE and bool(
+                folded_kernels & {KernelTypes.RESIZE, KernelTypes.CROP}
+            )
+            if command.kernel_type == KernelTypes.CROP and not np.array_equal(matrix, np.eye(3)):
+                crop_width, crop_height = int(command.parameters.width), int(command.parameters.height)
+                is_barrier = crop_width > width or crop_height > height
+            if is_barrier:
+                transforms.append((matrix[:2], height, width))
+                matrix = np.eye(3)
+                folded_kernels.clear()
+
+            command_matrix, height, width = _get_command_transform(command, height, width)
+            matrix = matrix @ command_matrix
+            folded_kernels.add(command.kernel_type)
+        transforms.append((matrix[:2], height, width))
+        return transforms
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        logging.info("Applying fused geometric commands: %s", [command.kernel_type for command in self._commands])
+        for matrix, height, width in self.get_transforms(image.shape[0], image.shape[1]):
+            image = self._apply_transform(image, matrix, height, width)
+        return image
+
+    @staticmethod
+    def _apply_transform(image: np.ndarray, matrix: np.ndarray, height: int, width: int) -> np.ndarray:
+        sliced = apply_transform_as_slice(image, matrix, height, width)
+        if sliced is not None:
+            return sliced
+        return warp_affine(image, matrix, height, width)
+
+    def __repr__(self) -> str:
+        return f"AffineOperation({[command.kernel_type.value for command in self._commands]})"
+
+
+def fuse_geometric_commands(operations: List[ImageOperation]) -> List[ImageOperation]:
+    """
+    Fold runs of consecutive geometric commands into single affine operations
+    Args:
+        operations: operations of the command queue
+    Returns:
+        List[ImageOperation]: optimized operations
+    """
+    optimized: List[ImageOperation] = []
+    run: List[KernelOperation] = []
+
+    def flush_run() -> None:
+        if len(run) > 1:
+            optimized.append(AffineOperation([operation.command for operation in run]))
+        else:
+            optimized.extend(run)
+        run.clear()
+
+    for operation in operations:
+        if isinstance(operation, KernelOperation) and _is_fusable(operation.command):
+            run.append(operation)
+            continue
+        flush_run()
+        optimized.append(operation)
+    flush_run()
+    return optimized
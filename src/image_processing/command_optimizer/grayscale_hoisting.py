@@ -0,0 +1,41 @@
+from typing import List
+
+from src.image_processing.command_optimizer.operations import ImageOperation, KernelOperation
+from src.image_processing.kernels.kernel_types import KernelTypes
+
+# Kernels which are linear per channel and do not saturate, so they commute with the grayscale conversion
+# up to rounding. Contrast and sharpen saturate each channel separately and must stay in place
+GRAYSCALE_COMMUTING_KERNELS = {
+    KernelTypes.INVERT,
+    KernelTypes.ROTATE,
+    KernelTypes.CROP,
+    KernelTypes.RESIZE,
+    KernelTypes.BLUR,
+}
+
+
+def _commutes_with_grayscale(operation: ImageOperation) -> bool:
+    return isinstance(operation, KernelOperation) and operation.command.kernel_type in GRAYSCALE_COMMUTING_KERNELS
+
+
+def _is_grayscale(operation: ImageOperation) -> bool:
+    return isinstance(operation, KernelOperation) and operation.command.kernel_type == KernelTypes.GRAYSCALE
+
+
+def hoist_grayscale(operations: List[ImageOperation]) -> List[ImageOperation]:
+    """
+    Move grayscale conversions before the kernels they commute with, so these kernels process
+    one channel instead of three
+    Args:
+        operations: operations of the command queue
+    Returns:
+        List[ImageOperation]: optimized operations
+    """
+    optimized: List[ImageOperation] = []
+    for operation in operations:
+        position = len(optimized)
+        if _is_grayscale(operation):
+            while position > 0 and _commutes_with_grayscale(optimized[position - 1]):
+                position -= 1
+        optimized.insert(position, operation)
+    return optimized
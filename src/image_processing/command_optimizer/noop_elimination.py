@@ -0,0 +1,45 @@
+import logging
+from typing import List
+
+from src.image_processing.command import Command
+from src.image_processing.command_optimizer.operations import ImageOperation, KernelOperation
+from src.image_processing.kernels.kernel_types import KernelTypes
+from src.image_processing.kernels.rotate import ROTATIONS
+
+
+def is_noop_command(command: Command) -> bool:
+    """
+    Check if the command leaves the image unchanged
+    Args:
+        command: command to check
+    Returns:
+        bool: True if the command is a no-op
+    """
+    params = command.parameters
+    if command.kernel_type == KernelTypes.CONTRAST:
+        return int(params.step) == 0
+    if command.kernel_type == KernelTypes.ROTATE:
+        # RotateImage keeps the image as is for unsupported angles
+        return int(params.angle) not in ROTATIONS
+    if command.kernel_type == KernelTypes.BLUR:
+        # Even sizes are rounded up, so steps 0 and 1 both give a 1x1 kernel
+        return int(params.step) in (0, 1)
+    return False
+
+
+def remove_noop_commands(operations: List[ImageOperation]) -> List[ImageOperation]:
+    """
+    Drop commands which leave the image unchanged, such as `contrast by 0` or `rotate by 0`.
+    Inversions which cancel each other are dropped by the pointwise fusion pass
+    Args:
+        operations: operations of the command queue
+    Returns:
+        List[ImageOperation]: optimized operations
+    """
+    optimized = []
+    for operation in operations:
+        if isinstance(operation, KernelOperation) and is_noop_command(operation.command):
+            logging.info("Dropping no-op command: %s", operation)
+            continue
+        optimized.append(operation)
+    return optimized
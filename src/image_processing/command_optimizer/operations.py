@@ -0,0 +1,91 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import List
+
+import cv2
+import numpy as np
+
+from src.image_processing.command import Command
+from src.image_processing.image_buffer import ChannelOrder, ImageBuffer
+from src.image_processing.kernels.kernel import Kernel
+
+
+class ImageOperation(ABC):
+    """
+    Single step of an optimized command queue
+    """
+
+    @abstractmethod
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        """
+        Apply the operation to the image
+        Args:
+            image: np.ndarray image
+        Returns:
+            image: np.ndarray image
+        """
+
+    def apply_buffer(self, image: ImageBuffer) -> ImageBuffer:
+        """
+        Apply the operation to the image buffer. Operations treat all channels alike unless they override it
+        Args:
+            image: ImageBuffer image
+        Returns:
+            image: ImageBuffer image
+        """
+        return image.with_array(self.apply(image.array))
+
+    @property
+    @abstractmethod
+    def commands(self) -> List[Command]:
+        """
+        Commands implemented by the operation
+        """
+
+
+class KernelOperation(ImageOperation):
+    """
+    Operation which runs a single kernel
+    """
+
+    def __init__(self, kernel: type[Kernel], command: Command) -> None:
+        self._kernel = kernel
+        self._command = command
+
+    @property
+    def commands(self) -> List[Command]:
+        return [self._command]
+
+    @property
+    def command(self) -> Command:
+        return self._command
+
+    @property
+    def kernel(self) -> type[Kernel]:
+        return self._kernel
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        logging.info("Applying command: %s with parameters: %s", self._command.kernel_type, self._command.parameters)
+        return self._kernel.process(image=image, params=self._command.parameters)
+
+    def apply_buffer(self, image: ImageBuffer) -> ImageBuffer:
+        if self._kernel.channel_order is not None:
+            image = image.to(self._kernel.channel_order)
+        return image.with_array(self.apply(image.array))
+
+    def __repr__(self) -> str:
+        return f"KernelOperation({self._command.kernel_type.value}, {self._command.parameters})"
+
+
+class GrayscaleOperation(KernelOperation):
+    """
+    Grayscale conversion which reads the channels in their current order instead of swapping them first
+    """
+
+    def apply_buffer(self, image: ImageBuffer) -> ImageBuffer:
+        if image.channel_order == ChannelOrder.GRAY:
+            return image
+
+        logging.info("Applying command: %s with parameters: %s", self.command.kernel_type, self.command.parameters)
+        code = cv2.COLOR_RGB2GRAY if image.channel_order == ChannelOrder.RGB else cv2.COLOR_BGR2GRAY
+        return ImageBuffer(cv2.cvtColor(image.array, code), ChannelOrder.GRAY)
@@ -0,0 +1,80 @@
+import logging
+from typing import List
+
+import cv2
+import numpy as np
+
+from src.image_processing.command import Command
+from src.image_processing.command_optimizer.operations import ImageOperation, KernelOperation
+from src.image_processing.kernels.kernel_types import KernelTypes
+
+# Kernels which map every channel value independently, so they can be replaced by a lookup table
+POINTWISE_KERNELS = {KernelTypes.CONTRAST, KernelTypes.INVERT}
+
+_IDENTITY_TABLE = np.arange(256, dtype=np.uint8).reshape(1, 256)
+
+
+class LookupTableOperation(ImageOperation):
+    """
+    Several pointwise commands applied as a single lookup table
+    """
+
+    def __init__(self, operations: List[KernelOperation]) -> None:
+        self._commands = [operation.command for operation in operations]
+
+        # Running the kernels over all possible values gives a table which matches them exactly
+        table = _IDENTITY_TABLE
+        for operation in operations:
+            table = operation.kernel.process(image=table, params=operation.command.parameters)
+        self._table = table
+
+    @property
+    def commands(self) -> List[Command]:
+        return self._commands
+
+    @property
+    def table(self) -> np.ndarray:
+        return self._table
+
+    def is_identity(self) -> bool:
+        return bool(np.array_equal(self._table, _IDENTITY_TABLE))
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        logging.info("Applying fused pointwise commands: %s", [command.kernel_type for command in self._commands])
+        return cv2.LUT(image, self._table)
+
+    def __repr__(self) -> str:
+        return f"LookupTableOperation({[command.kernel_type.value for command in self._commands]})"
+
+
+def fuse_pointwise_commands(operations: List[ImageOperation]) -> List[ImageOperation]:
+    """
+    Combine runs of consecutive pointwise commands into one lookup table and drop the runs which
+    cancel out, such as a double inversion
+    Args:
+        operations: operations of the command queue
+    Returns:
+        List[ImageOperation]: optimized operations
+    """
+    optimized: List[ImageOperation] = []
+    run: List[KernelOperation] = []
+
+    def flush_run() -> None:
+        if len(run) > 1:
+            lookup_table = LookupTableOperation(run)
+            if lookup_table.is_identity():
+                logging.info("Dropping pointwise commands which cancel out: %s", run)
+            else:
+                optimized.append(lookup_table)
+        else:
+            optimized.extend(run)
+        run.clear()
+
+    for operation in operations:
+        if isinstance(operation, KernelOperation) and operation.command.kernel_type in POINTWISE_KERNELS:
+            run.append(operation)
+            continue
+        flush_run()
+        optimized.append(operation)
+    flush_run()
+    return optimized
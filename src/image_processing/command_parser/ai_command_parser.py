@@ -1,12 +1,15 @@
+import copy
 import json
 import logging
 import re
-from typing import Dict, List, Union
+import threading
+from typing import Dict, List, Optional, Tuple, Union
 
 import torch
 from PIL import Image
-from transformers import pipeline
+from transformers import DynamicCache, pipeline
 
+from src.cache.lru_cache import CacheStats
 from src.image_processing.command import Command, CommandParameters
 from src.image_processing.command_parser.command_parser import CommandParser, ParserParameters
 from src.image_processing.command_parser.language_package import (
@@ -16,14 +19,13 @@ from src.image_processing.command_parser.language_package import (
     get_language_package,
 )
 from src.image_processing.kernels.kernel_types import KernelTypes
-from src.utils import (
-    get_average_brightness,
-    get_color_space,
-    get_contrast,
-    get_image_size,
-    get_level_of_detail,
-    get_saturation,
-)
+from src.image_statistics import ImageStatistics
+
+Messages = List[Dict[str, str]]
+
+MAX_NEW_TOKENS = 256
+
+IMAGE_STATISTICS = ImageStatistics()
 
 
 def process_json_text(input_text: str) -> str:
@@ -72,28 +74,108 @@ class AICommandParser(CommandParser):
         self._prompter = AIPrompter(language)
         self._json_pattern = re.compile(r".*(?P<json>\[.*\]).*")
 
-        self._image_parameters: ImageParameters = {}
-
         self._model_name = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
         self._pipeline = pipeline(
             "text-generation", model=self._model_name, torch_dtype=torch.float16, device_map="auto"
         )
+        # Past key values of the system prompt per number of few-shot samples, the language is fixed per parser
+        self._prefix_caches: Dict[int, Tuple[torch.Tensor, DynamicCache]] = {}
+        # The parser is called from the executor workers, so the caches are filled and counted under the lock
+        self._prefix_lock = threading.Lock()
+        self.prefix_cache_stats = CacheStats()
+
+    def _get_system_messages(self, num_few_shot_samples: int) -> Messages:
+        return [{"role": "system", "content": self._prompter.prepare_prompt(num_few_shot_samples)}]
+
+    def _tokenize(self, messages: Messages, add_generation_prompt: bool) -> torch.Tensor:
+        tokenizer = self._pipeline.tokenizer
+        prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=add_generation_prompt)
+        input_ids: torch.Tensor = tokenizer(prompt, return_tensors="pt").input_ids
+        return input_ids.to(self._pipeline.model.device)
+
+    def _get_prefix_cache(self, num_few_shot_samples: int) -> Tuple[torch.Tensor, DynamicCache]:
+        """
+        Get the tokens of the system prompt and their past key values, running the prefill on first use
+        """
+        with self._prefix_lock:
+            if num_few_shot_samples not in self._prefix_caches:
+                prefix_ids = self._tokenize(
+                    self._get_system_messages(num_few_shot_samples), add_generation_prompt=False
+                )
+                prefix_cache = DynamicCache()
+                with torch.no_grad():
+                    self._pipeline.model(prefix_ids, past_key_values=prefix_cache, use_cache=True)
+                self._prefix_caches[num_few_shot_samples] = (prefix_ids, prefix_cache)
+            return self._prefix_caches[num_few_shot_samples]
+
+    def _generate(
+        self,
+        messages: Messages,
+        num_few_shot_samples: int,
+        max_new_tokens: int = MAX_NEW_TOKENS,
+        use_prefix_cache: bool = True,
+    ) -> str:
+        """
+        Generate the reply to the chat. The prefill over the system prompt is skipped if the prompt
+        starts with the tokens of the cached system prompt
+        """
+        input_ids = self._tokenize(messages, add_generation_prompt=True)
+
+        past_key_values = None
+        if use_prefix_cache:
+            prefix_ids, prefix_cache = self._get_prefix_cache(num_few_shot_samples)
+            num_prefix_tokens = prefix_ids.shape[1]
+            is_hit = input_ids.shape[1] > num_prefix_tokens and torch.equal(
+                input_ids[:, :num_prefix_tokens], prefix_ids
+            )
+            with self._prefix_lock:
+                if is_hit:
+                    self.prefix_cache_stats.hits += 1
+                else:
+                    self.prefix_cache_stats.misses += 1
+                num_misses = self.prefix_cache_stats.misses
+            if is_hit:
+                # Generation appends to the cache, so every request gets its own copy
+                past_key_values = copy.deepcopy(prefix_cache)
+            else:
+                logging.warning(
+                    "The prompt does not start with the cached system prompt, running the full prefill. "
+                    "Mismatches so far: %d",
+                    num_misses,
+                )
+
+        with torch.no_grad():
+            output_ids = self._pipeline.model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
+                max_new_tokens=max_new_tokens,
+                pad_token_id=self._pipeline.tokenizer.eos_token_id,
+            )
+        generated_text: str = self._pipeline.tokenizer.decode(
+            output_ids[0, input_ids.shape[1] :], skip_special_tokens=True
+        )
+        return generated_text
 
-    def _get_llm_output(self, input_text: str, num_few_shot_samples: int = -1) -> List[Dict[str, Union[str, Dict]]]:
-        messages = []
-
-        messages.append({"role": "system", "content": self._prompter.prepare_prompt(num_few_shot_samples)})
-        if self._image_parameters:
-            image_prompt = self._language_package.get_image_analysis_prompt(self._image_parameters)
+    def _get_messages(
+        self, input_text: str, num_few_shot_samples: int = -1, image_parameters: Optional[ImageParameters] = None
+    ) -> Messages:
+        messages = self._get_system_messages(num_few_shot_samples)
+        if image_parameters:
+            image_prompt = self._language_package.get_image_analysis_prompt(image_parameters)
 
             messages.append({"role": "system", "content": image_prompt})
 
         messages.append({"role": "user", "content": input_text})
+        return messages
 
-        prompt = self._pipeline.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        outputs = self._pipeline(prompt)
+    def _get_llm_output(
+        self, input_text: str, num_few_shot_samples: int = -1, image_parameters: Optional[ImageParameters] = None
+    ) -> List[Dict[str, Union[str, Dict]]]:
+        messages = self._get_messages(input_text, num_few_shot_samples, image_parameters)
+        generated_text = self._generate(messages, num_few_shot_samples)
 
-        processed_text = process_json_text(outputs[0]["generated_text"])
+        processed_text = process_json_text(generated_text)
         logging.info("Received from LLM: %s", processed_text)
 
         processed_text_match = self._json_pattern.match(processed_text)
@@ -103,11 +185,26 @@ class AICommandParser(CommandParser):
         raise ValueError(f"Failed to parse text: {input_text}")
 
     def parse_text(self, text: str, parser_parameters: ParserParameters) -> List[Command]:
+        image_parameters = None
         if parser_parameters.analyze_image and parser_parameters.image_to_analyze is not None:
-            self._image_parameters = self._analyze_image(parser_parameters.image_to_analyze)
-            logging.info("Original image parameters: %s", self._image_parameters)
-
-        json_command = self._get_llm_output(text, parser_parameters.num_few_shot_samples)
+            image_parameters = self._analyze_image(parser_parameters.image_to_analyze)
+            logging.info("Original image parameters: %s", image_parameters)
+
+        return self.parse_text_with_image_parameters(text, parser_parameters.num_few_shot_samples, image_parameters)
+
+    def parse_text_with_image_parameters(
+        self, text: str, num_few_shot_samples: int = -1, image_parameters: Optional[ImageParameters] = None
+    ) -> List[Command]:
+        """
+        Parse text with the already analyzed image parameters
+        Args:
+            text (str): text to parse
+            num_few_shot_samples (int): number of few-shot examples in the prompt, -1 for all
+            image_parameters (Optional[ImageParameters]): parameters of the original image
+        Returns:
+            List[Command]: list of commands
+        """
+        json_command = self._get_llm_output(text, num_few_shot_samples, image_parameters)
 
         commands = []
         for command in json_command:
@@ -117,18 +214,16 @@ class AICommandParser(CommandParser):
             if not isinstance(parameters, dict):
                 raise ValueError(f"Failed to parse parameters: {parameters}")
 
-            command_parameters = CommandParameters(**parameters)
+            # The LLM may invent parameters, only the ones of CommandParameters are kept
+            unknown_keys = set(parameters) - set(CommandParameters.get_keys())
+            if unknown_keys:
+                logging.warning("Ignoring unknown parameters of %s: %s", kernel_type, sorted(unknown_keys))
+            command_parameters = CommandParameters(
+                **{key: value for key, value in parameters.items() if key not in unknown_keys}
+            )
             commands.append(Command(kernel_type, command_parameters))
         return commands
 
     @staticmethod
     def _analyze_image(image: Image.Image) -> ImageParameters:
-        image_parameters: ImageParameters = {
-            "original_size": get_image_size(image),
-            "average_brightness": get_average_brightness(image),
-            "contrast": get_contrast(image),
-            "color_space": get_color_space(image),
-            "saturation": get_saturation(image),
-            "level_of_detail": get_level_of_detail(image),
-        }
-        return image_parameters
+        return IMAGE_STATISTICS.compute(image)
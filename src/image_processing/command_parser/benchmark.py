@@ -0,0 +1,155 @@
+import random
+import re
+import time
+from typing import List
+
+import numpy as np
+from tap import Tap
+
+from src.image_processing.command import Command, CommandParameters
+from src.image_processing.command_parser.ai_command_parser import AICommandParser
+from src.image_processing.command_parser.command_grammar import get_command_grammar
+from src.image_processing.command_parser.language_package import LanguageType, get_language_package
+
+
+class Arguments(Tap):
+    language: str = LanguageType.EN.value
+    captions: List[str] = [
+        "Blur by 5 and invert colors",
+        "Make the photo look vintage and a bit brighter",
+        "Rotate by 90 degrees, then crop to 300x400",
+    ]
+    num_few_shot_samples: List[int] = [0, -1]
+    repeats: int = 5
+    corpus_size: int = 20000  # Number of captions in the pattern parsing throughput benchmark
+    skip_ttft: bool = False  # Only run the pattern parsing benchmark, the LLM is not loaded
+
+
+CORPUS_COMMANDS = {
+    LanguageType.EN: [
+        "blur by {value}",
+        "contrast by {value}",
+        "crop to {value}x{value}",
+        "black and white",
+        "invert colors",
+        "resize to {value}x{value}",
+        "rotate image by {value} degrees",
+        "sharpen by {value}",
+        "make it look vintage",
+    ],
+    LanguageType.RU: [
+        "размытие с радиусом {value}",
+        "изменить контрастность на {value}",
+        "обрезать до {value}x{value}",
+        "преобразовать в черно-белый",
+        "инвертировать цвета",
+        "изменить размер до {value}x{value}",
+        "повернуть на {value} градусов",
+        "повысить резкость на {value}",
+        "сделать в стиле ретро",
+    ],
+}
+CORPUS_CONNECTORS = {LanguageType.EN: [" and ", ", then ", ", "], LanguageType.RU: [" и ", ", затем ", ", "]}
+
+
+def get_caption_corpus(size: int) -> List[str]:
+    """
+    Get random captions of one to four commands in both languages
+    """
+    rng = random.Random(0)
+    corpus = []
+    for _ in range(size):
+        language = rng.choice(list(CORPUS_COMMANDS))
+        commands = [
+            command.format(value=rng.randint(1, 500))
+            for command in rng.sample(CORPUS_COMMANDS[language], rng.randint(1, 4))
+        ]
+        caption = commands[0]
+        for command in commands[1:]:
+            caption += rng.choice(CORPUS_CONNECTORS[language]) + command
+        corpus.append(caption.capitalize())
+    return corpus
+
+
+def parse_text_per_pattern(text: str, language: LanguageType) -> List[Command]:
+    """
+    Reference parser with one scan per pattern, commands are grouped by kernel type
+    """
+    text = text.lower()
+    commands = []
+    for kernel_type, pattern in get_language_package(language).get_patters().items():
+        for match in re.finditer(pattern, text):
+            commands.append(Command(kernel_type, CommandParameters(**match.groupdict())))
+    return commands
+
+
+def compare_pattern_throughput(corpus: List[str]) -> None:
+    grammar = get_command_grammar()
+    num_mismatches = 0
+    for caption in corpus:
+        parsed_caption = grammar.parse(caption)
+        reference = parse_text_per_pattern(caption, parsed_caption.language)
+        num_mismatches += sorted(map(repr, parsed_caption.commands)) != sorted(map(repr, reference))
+
+    start = time.perf_counter()
+    for caption in corpus:
+        for language in LanguageType:
+            parse_text_per_pattern(caption, language)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for caption in corpus:
+        grammar.parse(caption)
+    grammar_time = time.perf_counter() - start
+
+    print(f"Pattern parsing of {len(corpus)} captions, both languages:")
+    print(f"  per pattern scans:  {len(corpus) / reference_time:>10.0f} captions/s")
+    print(f"  combined grammar:   {len(corpus) / grammar_time:>10.0f} captions/s")
+    print(f"  speedup {reference_time / grammar_time:.2f}x, captions with different commands: {num_mismatches}")
+
+
+def measure_ttft(
+    parser: AICommandParser, caption: str, num_few_shot_samples: int, use_prefix_cache: bool, repeats: int
+) -> float:
+    """
+    Measure the time to the first generated token of the caption
+    Returns:
+        float: median latency in seconds
+    """
+    # pylint: disable=protected-access
+    messages = parser._get_messages(caption, num_few_shot_samples)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parser._generate(messages, num_few_shot_samples, max_new_tokens=1, use_prefix_cache=use_prefix_cache)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main() -> None:
+    args = Arguments(underscores_to_dashes=True).parse_args()
+    compare_pattern_throughput(get_caption_corpus(args.corpus_size))
+    if args.skip_ttft:
+        return
+
+    parser = AICommandParser(LanguageType(args.language))
+    print(f"\n{'few-shot':>8} | {'full prefill, ms':>16} | {'cached prefix, ms':>17} | {'speedup':>7} | caption")
+    for num_few_shot_samples in args.num_few_shot_samples:
+        # The first call runs the prefill over the system prompt, it is not measured
+        # pylint: disable=protected-access
+        parser._get_prefix_cache(num_few_shot_samples)
+        for caption in args.captions:
+            full_ttft = measure_ttft(
+                parser, caption, num_few_shot_samples, use_prefix_cache=False, repeats=args.repeats
+            )
+            cached_ttft = measure_ttft(
+                parser, caption, num_few_shot_samples, use_prefix_cache=True, repeats=args.repeats
+            )
+            print(
+                f"{num_few_shot_samples:>8} | {1000 * full_ttft:>16.1f} | {1000 * cached_ttft:>17.1f} | "
+                f"{full_ttft / cached_ttft:>6.2f}x | {caption}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Tuple
+
+from src.image_processing.command import Command, CommandParameters
+from src.image_processing.command_parser.language_package import LanguageType, get_language_package
+from src.image_processing.kernels.kernel_types import KernelTypes
+
+_GROUP_SEPARATOR = "__"
+_NAMED_GROUP_PATTERN = re.compile(r"\(\?P<(\w+)>")
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+@dataclass
+class ParsedCaption:
+    """
+    Commands of a caption in the order they appear in the text
+    """
+
+    language: LanguageType
+    commands: List[Command]
+    uncovered_words: List[str]  # Words which are not matched by any pattern except connector words
+
+
+class CommandGrammar:
+    """
+    Patterns of all language packages compiled into a single regex, so a caption is scanned once.
+    Every pattern is wrapped into a group named after its language and kernel type,
+    and the parameter groups are prefixed with that name, so they do not clash between alternatives
+    """
+
+    def __init__(self, languages: Tuple[LanguageType, ...] = tuple(LanguageType)) -> None:
+        alternatives = []
+        self._rules: Dict[str, Tuple[LanguageType, KernelTypes]] = {}
+        # Rule name -> (group name, parameter name) of its parameter groups
+        self._parameter_groups: Dict[str, List[Tuple[str, str]]] = {}
+        self._connector_words: Dict[LanguageType, FrozenSet[str]] = {}
+        for language in languages:
+            language_package = get_language_package(language)
+            self._connector_words[language] = frozenset(language_package.get_connector_words())
+            for kernel_type, pattern in language_package.get_patters().items():
+                rule_name = f"{language.value}_{kernel_type.value}"
+                self._rules[rule_name] = (language, kernel_type)
+                self._parameter_groups[rule_name] = [
+                    (f"{rule_name}{_GROUP_SEPARATOR}{name}", name) for name in _NAMED_GROUP_PATTERN.findall(pattern)
+                ]
+                prefixed_pattern = _NAMED_GROUP_PATTERN.sub(rf"(?P<{rule_name}{_GROUP_SEPARATOR}\1>", pattern)
+                alternatives.append(f"(?P<{rule_name}>{prefixed_pattern})")
+        self._pattern = re.compile("|".join(alternatives))
+
+    def parse(self, text: str, default_language: LanguageType = LanguageType.EN) -> ParsedCaption:
+        """
+        Parse the caption in one pass. The language with more matched commands wins,
+        commands of the other language are ignored
+        Args:
+            text: caption
+            default_language: language of the caption if no command is matched or the languages are tied
+        Returns:
+            ParsedCaption: language, commands and unmatched words of the caption
+        """
+        text = text.lower()
+
+        matches: Dict[LanguageType, List[Tuple[re.Match, str]]] = {}
+        for match in self._pattern.finditer(text):
+            # The rule group encloses its parameter groups, so it is the last one to close
+            rule_name = match.lastgroup
+            assert rule_name is not None
+            matches.setdefault(self._rules[rule_name][0], []).append((match, rule_name))
+
+        language = max(
+            matches,
+            key=lambda candidate: (len(matches[candidate]), candidate == default_language),
+            default=default_language,
+        )
+
+        commands = []
+        is_covered = [False] * len(text)
+        for match, rule_name in matches.get(language, []):
+            parameters = {
+                name: match.group(group_name)
+                for group_name, name in self._parameter_groups[rule_name]
+                if match.group(group_name) is not None
+            }
+            commands.append(Command(self._rules[rule_name][1], CommandParameters(**parameters)))
+            is_covered[match.start() : match.end()] = [True] * (match.end() - match.start())
+
+        connector_words = self._connector_words.get(language, frozenset())
+        uncovered_words = [
+            word.group()
+            for word in _WORD_PATTERN.finditer(text)
+            if not is_covered[word.start()] and word.group() not in connector_words
+        ]
+        return ParsedCaption(language, commands, uncovered_words)
+
+
+@lru_cache(maxsize=None)
+def get_command_grammar() -> CommandGrammar:
+    """
+    Get the grammar of all languages, it is compiled on first use and shared by the parsers
+    """
+    return CommandGrammar()
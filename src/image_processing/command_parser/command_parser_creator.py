@@ -1,18 +1,24 @@
 from enum import Enum
-from typing import Type
+from typing import Dict, Type
 
 from src.image_processing.command_parser.ai_command_parser import AICommandParser
 from src.image_processing.command_parser.command_parser import CommandParser
 from src.image_processing.command_parser.pattern_command_parser import PatternCommandParser
+from src.image_processing.command_parser.tiered_command_parser import TieredCommandParser
 
 
 class CommandParserTypes(Enum):
     PATTERN = "pattern"
     AI = "ai"
+    TIERED = "tiered"
 
 
 def get_command_parser(command_parser: CommandParserTypes) -> Type[CommandParser]:
-    parser_map = {CommandParserTypes.PATTERN: PatternCommandParser, CommandParserTypes.AI: AICommandParser}
+    parser_map: Dict[CommandParserTypes, Type[CommandParser]] = {
+        CommandParserTypes.PATTERN: PatternCommandParser,
+        CommandParserTypes.AI: AICommandParser,
+        CommandParserTypes.TIERED: TieredCommandParser,
+    }
     if command_parser not in parser_map:
         raise ValueError(f"Unsupported command parser: {command_parser}")
     return parser_map[command_parser]
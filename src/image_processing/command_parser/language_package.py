@@ -20,6 +20,13 @@ class LanguagePackage(ABC):
     @abstractmethod
     def get_patters() -> Dict[KernelTypes, str]: ...
 
+    @staticmethod
+    @abstractmethod
+    def get_connector_words() -> Collection[str]:
+        """
+        Words which join commands in a caption and do not change the image
+        """
+
     @staticmethod
     @abstractmethod
     def get_basic_prompt(kernel_keys: List[str], command_keys: List[str]) -> str: ...
@@ -48,6 +55,10 @@ class LanguagePackageEN(LanguagePackage):
             KernelTypes.SHARPEN: r"sharpen by (?P<step>-?\d+)",
         }
 
+    @staticmethod
+    def get_connector_words() -> Collection[str]:
+        return {"and", "then", "also", "after", "that", "please", "the", "image", "photo", "picture", "it"}
+
     @staticmethod
     def get_basic_prompt(kernel_keys: List[str], command_keys: List[str]) -> str:
         return f"""
@@ -103,6 +114,10 @@ class LanguagePackageRU(LanguagePackage):
             KernelTypes.SHARPEN: r"повысить резкость на (?P<step>-?\d+)",
         }
 
+    @staticmethod
+    def get_connector_words() -> Collection[str]:
+        return {"и", "затем", "потом", "также", "после", "этого", "пожалуйста", "изображение", "фото", "картинку"}
+
     @staticmethod
     def get_basic_prompt(kernel_keys: List[str], command_keys: List[str]) -> str:
         return f"""
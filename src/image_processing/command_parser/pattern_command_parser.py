@@ -1,24 +1,36 @@
-import re
-from typing import List
+from typing import List, Tuple
 
-from src.image_processing.command import Command, CommandParameters
+from src.image_processing.command import Command
+from src.image_processing.command_parser.command_grammar import ParsedCaption, get_command_grammar
 from src.image_processing.command_parser.command_parser import CommandParser, ParserParameters
 
 
 class PatternCommandParser(CommandParser):
     """
-    Command parser based on patterns
+    Command parser based on patterns. The language of the caption is detected by the patterns,
+    the parser language is used if no pattern matches
     """
 
     def parse_text(self, text: str, _: ParserParameters) -> List[Command]:
-        text = text.lower()
+        return self.parse_caption(text).commands
 
-        patterns = self._language_package.get_patters()
-        commands_list = []
-        for command_type, pattern in patterns.items():
-            matches = re.finditer(pattern, text)
-            for match in matches:
-                parameters = CommandParameters(**match.groupdict())
-                command = Command(command_type, parameters)
-                commands_list.append(command)
-        return commands_list
+    def parse_text_with_coverage(self, text: str) -> Tuple[List[Command], List[str]]:
+        """
+        Parse text and find the words which are not matched by any pattern
+        Args:
+            text (str): text to parse
+        Returns:
+            Tuple[List[Command], List[str]]: list of commands and the unmatched words except connector words
+        """
+        caption = self.parse_caption(text)
+        return caption.commands, caption.uncovered_words
+
+    def parse_caption(self, text: str) -> ParsedCaption:
+        """
+        Parse text in a single pass over the combined patterns of all languages
+        Args:
+            text (str): text to parse
+        Returns:
+            ParsedCaption: detected language, commands in text order and unmatched words
+        """
+        return get_command_grammar().parse(text, self._language)
@@ -0,0 +1,125 @@
+import copy
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from src.cache.lru_cache import CacheStats, LRUCache
+from src.image_processing.command import Command
+from src.image_processing.command_parser.ai_command_parser import AICommandParser
+from src.image_processing.command_parser.command_parser import CommandParser, ParserParameters
+from src.image_processing.command_parser.language_package import LanguageType
+from src.image_processing.command_parser.pattern_command_parser import PatternCommandParser
+
+ParseKey = Tuple[str, int, str]
+
+
+@dataclass
+class TierStats:
+    """
+    Number of captions parsed by a tier and the time spent in it
+    """
+
+    calls: int = 0
+    total_time_s: float = 0.0
+
+    @property
+    def mean_ms(self) -> float:
+        return 1000 * self.total_time_s / self.calls if self.calls else 0.0
+
+
+class TieredCommandParser(CommandParser):
+    """
+    Command parser which runs the patterns first and falls back to the LLM only for captions
+    the patterns do not understand. LLM results are memoized by the normalized caption and the image parameters.
+    The LLM is loaded on the first fallback
+    """
+
+    def __init__(self, language: LanguageType = LanguageType.EN, memo_size: int = 1024) -> None:
+        """
+        Args:
+            language: language of the captions
+            memo_size: number of LLM parse results kept in memory
+        """
+        super().__init__(language)
+        self._pattern_parser = PatternCommandParser(language)
+        self._ai_parser: Optional[AICommandParser] = None
+        # The LLM pipeline is not thread-safe, so it is created and called under the lock
+        self._ai_lock = threading.Lock()
+        self._memo = LRUCache[ParseKey, List[Command]](memo_size)
+        self._stats_lock = threading.Lock()
+        self.pattern_stats = TierStats()
+        self.ai_stats = TierStats()
+
+    @property
+    def memo_stats(self) -> CacheStats:
+        return self._memo.stats
+
+    def parse_text(self, text: str, parser_parameters: ParserParameters) -> List[Command]:
+        start = time.perf_counter()
+        commands, uncovered_words = self._pattern_parser.parse_text_with_coverage(text)
+        self._add_timing(self.pattern_stats, start)
+        if commands and not uncovered_words:
+            self._log_stats("pattern")
+            return commands
+        logging.info("Patterns do not cover the caption, unmatched words: %s", uncovered_words)
+
+        key = self._get_key(text, parser_parameters)
+        memoized_commands = self._memo.get(key)
+        if memoized_commands is not None:
+            self._log_stats("memo")
+            return copy.deepcopy(memoized_commands)
+
+        start = time.perf_counter()
+        try:
+            ai_commands = self._parse_with_ai(text, parser_parameters.num_few_shot_samples, key)
+        except (ValueError, KeyError, TypeError):
+            logging.exception("LLM failed to parse the caption, using the pattern result")
+            return commands
+        finally:
+            self._add_timing(self.ai_stats, start)
+
+        self._memo.put(key, copy.deepcopy(ai_commands))
+        self._log_stats("llm")
+        return ai_commands
+
+    @staticmethod
+    def _get_key(text: str, parser_parameters: ParserParameters) -> ParseKey:
+        image_parameters = ""
+        if parser_parameters.analyze_image and parser_parameters.image_to_analyze is not None:
+            # pylint: disable=protected-access
+            image_parameters = json.dumps(
+                AICommandParser._analyze_image(parser_parameters.image_to_analyze), sort_keys=True
+            )
+        return " ".join(text.lower().split()), parser_parameters.num_few_shot_samples, image_parameters
+
+    def _parse_with_ai(self, text: str, num_few_shot_samples: int, key: ParseKey) -> List[Command]:
+        image_parameters = json.loads(key[2]) if key[2] else None
+        with self._ai_lock:
+            if self._ai_parser is None:
+                logging.info("Loading the LLM command parser")
+                self._ai_parser = AICommandParser(self._language)
+            return self._ai_parser.parse_text_with_image_parameters(text, num_few_shot_samples, image_parameters)
+
+    def _add_timing(self, stats: TierStats, start: float) -> None:
+        with self._stats_lock:
+            stats.calls += 1
+            stats.total_time_s += time.perf_counter() - start
+
+    def _log_stats(self, tier: str) -> None:
+        with self._stats_lock:
+            num_captions = self.pattern_stats.calls
+            # Every caption which is not covered by the patterns is looked up in the memo
+            num_fallbacks = self.memo_stats.hits + self.memo_stats.misses
+            logging.info(
+                "Caption parsed by %s tier. Pattern tier: %.2f of captions, %.2f ms mean. "
+                "LLM tier: %d calls, %.0f ms mean. Memo hit rate: %.2f",
+                tier,
+                (num_captions - num_fallbacks) / num_captions if num_captions else 0.0,
+                self.pattern_stats.mean_ms,
+                self.ai_stats.calls,
+                self.ai_stats.mean_ms,
+                self.memo_stats.hit_rate,
+            )
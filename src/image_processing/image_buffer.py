@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+from enum import Enum
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+class ChannelOrder(Enum):
+    """
+    Channel order of the image data
+    """
+
+    RGB = "rgb"
+    BGR = "bgr"
+    GRAY = "gray"
+
+
+@dataclass(frozen=True)
+class ImageBuffer:
+    """
+    Image data together with its channel order. The data may be a non-contiguous view,
+    channels are swapped only when a kernel requires a specific order.
+    """
+
+    array: np.ndarray
+    channel_order: ChannelOrder
+
+    @classmethod
+    def from_pil(cls, image: Image.Image) -> "ImageBuffer":
+        """
+        Wrap PIL image data without swapping channels
+        Args:
+            image: PIL opened image
+        Returns:
+            ImageBuffer: RGB or grayscale image buffer
+        """
+        if image.mode == "L":
+            return cls(np.asarray(image), ChannelOrder.GRAY)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return cls(np.asarray(image), ChannelOrder.RGB)
+
+    def to_pil(self) -> Image.Image:
+        """
+        Convert the buffer to PIL format
+        Returns:
+            image: PIL format image
+        """
+        if self.channel_order == ChannelOrder.BGR:
+            return Image.fromarray(cv2.cvtColor(self.array, cv2.COLOR_BGR2RGB))
+        return Image.fromarray(np.ascontiguousarray(self.array))
+
+    def to(self, channel_order: ChannelOrder) -> "ImageBuffer":
+        """
+        Get the buffer in the requested channel order. Grayscale buffers are returned as is
+        Args:
+            channel_order: requested channel order
+        Returns:
+            ImageBuffer: buffer in the requested order
+        """
+        if self.channel_order in (channel_order, ChannelOrder.GRAY):
+            return self
+        if channel_order == ChannelOrder.GRAY:
+            raise ValueError("Color channels can only be dropped by the grayscale kernel")
+        return ImageBuffer(np.ascontiguousarray(self.array[..., ::-1]), channel_order)
+
+    def with_array(self, array: np.ndarray) -> "ImageBuffer":
+        """
+        Wrap the output of a kernel applied to this buffer
+        Args:
+            array: kernel output
+        Returns:
+            ImageBuffer: buffer with the same channel order, or grayscale if the output has a single channel
+        """
+        if array.ndim == 2:
+            return ImageBuffer(array, ChannelOrder.GRAY)
+        return ImageBuffer(array, self.channel_order)
@@ -1,12 +1,14 @@
-import logging
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 from PIL import Image
 
+from src.image_processing.command_optimizer.command_optimizer import CommandOptimizer
+from src.image_processing.command_optimizer.operations import ImageOperation
 from src.image_processing.command_parser.command_parser import Command
+from src.image_processing.image_buffer import ChannelOrder, ImageBuffer
 from src.image_processing.kernels.kernel_map import get_kernel_map
-from src.utils import cv2_to_pil, pil_to_cv2
+from src.image_processing.tiled_executor import TiledExecutor, TilingConfig, get_halo
 
 
 class ImageProcessor:
@@ -14,8 +16,15 @@ class ImageProcessor:
     ImageProcessor class.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, optimize: bool = True, tiling: Optional[TilingConfig] = None) -> None:
+        """
+        Args:
+            optimize: fuse and drop commands of the queue before applying them
+            tiling: process the image in row bands within the memory limit, the whole image is processed if None
+        """
         self._kernel_map = get_kernel_map()
+        self._optimizer = CommandOptimizer(self._kernel_map, passes=None if optimize else [])
+        self._tiled_executor = TiledExecutor(tiling) if tiling is not None else None
 
     def get_processed_image(self, image: Image.Image, command_queue: List[Command]) -> Image.Image:
         """
@@ -26,23 +35,69 @@ class ImageProcessor:
         Returns:
             image: PIL opened image
         """
-        inner_image_representation = pil_to_cv2(image)
+        inner_image_representation = ImageBuffer.from_pil(image)
         inner_image_representation = self._apply_commands(inner_image_representation, command_queue)
 
-        output_image = cv2_to_pil(inner_image_representation)
+        output_image = inner_image_representation.to_pil()
         return output_image
 
-    def _apply_commands(self, image: np.ndarray, command_queue: List[Command]) -> np.ndarray:
+    def get_processed_images(self, images: List[Image.Image], command_queue: List[Command]) -> List[Image.Image]:
+        """
+        Get processed images by the same commands. The queue is optimized once, and images of the same size
+        are processed as a single stacked image when every operation is pointwise
+        Args:
+            images: PIL opened images
+            command_queue: list of commands
+        Returns:
+            images: PIL opened images in the order of the input
+        """
+        operations = self._optimizer.optimize(command_queue)
+        buffers = [ImageBuffer.from_pil(image) for image in images]
+
+        groups: Dict[Tuple[Tuple[int, ...], ChannelOrder], List[int]] = {}
+        for index, buffer in enumerate(buffers):
+            groups.setdefault((buffer.array.shape, buffer.channel_order), []).append(index)
+
+        # Pointwise operations do not read neighbouring rows, so images stacked along the rows do not affect each other
+        is_pointwise = bool(operations) and all(get_halo(operation) == 0 for operation in operations)
+        output_buffers: List[Optional[ImageBuffer]] = [None] * len(buffers)
+        for indices in groups.values():
+            if not is_pointwise or len(indices) == 1:
+                for index in indices:
+                    output_buffers[index] = self._apply_operations(buffers[index], operations)
+                continue
+
+            stacked = ImageBuffer(
+                np.concatenate([buffers[index].array for index in indices]), buffers[indices[0]].channel_order
+            )
+            output = self._apply_operations(stacked, operations)
+            for index, array in zip(indices, np.split(output.array, len(indices))):
+                output_buffers[index] = output.with_array(array)
+
+        return [buffer.to_pil() for buffer in output_buffers if buffer is not None]
+
+    def _apply_commands(self, image: ImageBuffer, command_queue: List[Command]) -> ImageBuffer:
         """
         Apply commands to the image
         Args:
-            image: np.ndarray image
+            image: ImageBuffer image
             command_queue: list of commands
         Returns:
-            image: np.ndarray image
+            image: ImageBuffer image
+        """
+        return self._apply_operations(image, self._optimizer.optimize(command_queue))
+
+    def _apply_operations(self, image: ImageBuffer, operations: List[ImageOperation]) -> ImageBuffer:
+        """
+        Apply optimized operations to the image
+        Args:
+            image: ImageBuffer image
+            operations: operations of the optimized command queue
+        Returns:
+            image: ImageBuffer image
         """
-        for command in command_queue:
-            if command.kernel_type in self._kernel_map:
-                logging.info("Applying command: %s with parameters: %s", command.kernel_type, command.parameters)
-                image = self._kernel_map[command.kernel_type].process(image=image, params=command.parameters)
+        if self._tiled_executor is not None:
+            return self._tiled_executor.apply(image, operations)
+        for operation in operations:
+            image = operation.apply_buffer(image)
         return image
@@ -13,14 +13,18 @@ class CropImage(Kernel):
     @staticmethod
     def process(image: np.ndarray, params: CommandParameters) -> np.ndarray:
         """
-        Crop image
+        Crop image around its center
         Args:
             image: np.ndarray image
             params: CommandParameters
         Returns:
-            image: np.ndarray image
+            image: np.ndarray image, a view of the input if the crop fits into it
         """
         width, height = int(params.width), int(params.height)
-        x, y = image.shape[1] // 2, image.shape[0] // 2
-        image = cv2.getRectSubPix(image, (width, height), (x, y))
+        x, y = image.shape[1] // 2 - width // 2, image.shape[0] // 2 - height // 2
+        if x >= 0 and y >= 0 and x + width <= image.shape[1] and y + height <= image.shape[0]:
+            return image[y : y + height, x : x + width]
+
+        # Replicate the border for crops larger than the image
+        image = cv2.getRectSubPix(image, (width, height), (x + (width - 1) / 2, y + (height - 1) / 2))
         return image
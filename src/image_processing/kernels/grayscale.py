@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 
 from src.image_processing.command import CommandParameters
+from src.image_processing.image_buffer import ChannelOrder
 from src.image_processing.kernels.kernel import Kernel
 
 
@@ -10,6 +11,8 @@ class GrayscaleImage(Kernel):
     Convert image to grayscale
     """
 
+    channel_order = ChannelOrder.BGR
+
     @staticmethod
     def process(image: np.ndarray, params: CommandParameters) -> np.ndarray:
         """
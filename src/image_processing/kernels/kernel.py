@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 
 import numpy as np
 
 from src.image_processing.command import CommandParameters
+from src.image_processing.image_buffer import ChannelOrder
 
 
 class Kernel(ABC):
@@ -10,6 +12,9 @@ class Kernel(ABC):
     Kernel interface for image processing
     """
 
+    # Channel order the kernel expects, None if it treats all channels alike
+    channel_order: Optional[ChannelOrder] = None
+
     @staticmethod
     @abstractmethod
     def process(image: np.ndarray, params: CommandParameters) -> np.ndarray:
@@ -1,9 +1,11 @@
-import cv2
 import numpy as np
 
 from src.image_processing.command import CommandParameters
 from src.image_processing.kernels.kernel import Kernel
 
+# Rotation angle -> number of counter-clockwise quarter turns
+ROTATIONS = {90: -1, -90: 1, 180: 2}
+
 
 class RotateImage(Kernel):
     """
@@ -18,14 +20,12 @@ class RotateImage(Kernel):
             image: np.ndarray image
             params: CommandParameters
         Returns:
-            image: np.ndarray image
+            image: np.ndarray view of the rotated image
         """
-        rotations = {90: cv2.ROTATE_90_CLOCKWISE, -90: cv2.ROTATE_90_COUNTERCLOCKWISE, 180: cv2.ROTATE_180}
-
         angle = int(params.angle)
 
-        if angle not in rotations:
+        if angle not in ROTATIONS:
             print("Invalid angle")
             return image
 
-        return cv2.rotate(image, rotations[angle])
+        return np.rot90(image, ROTATIONS[angle])
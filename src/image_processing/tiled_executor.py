@@ -0,0 +1,579 @@
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from src.image_processing.command_optimizer.filter_fusion import FilterOperation, get_blur_kernel
+from src.image_processing.command_optimizer.geometric_fusion import (
+    AffineOperation,
+    apply_transform_as_slice,
+    warp_affine,
+)
+from src.image_processing.command_optimizer.operations import ImageOperation, KernelOperation
+from src.image_processing.command_optimizer.pointwise_fusion import POINTWISE_KERNELS, LookupTableOperation
+from src.image_processing.image_buffer import ChannelOrder, ImageBuffer
+from src.image_processing.kernels.kernel_types import KernelTypes
+from src.inference.executor import ExecutorType
+
+# Rows read on each side of an output row by the kernels with a fixed neighbourhood
+_KERNEL_HALOS = {
+    **{kernel_type: 0 for kernel_type in POINTWISE_KERNELS},
+    KernelTypes.GRAYSCALE: 0,
+    KernelTypes.SHARPEN: 1,
+}
+
+
+@dataclass
+class TilingConfig:
+    """
+    Configuration of the tiled execution
+    """
+
+    # Working memory of the row bands, the input and the output images are not included
+    memory_limit_bytes: int = 256 * 1024 * 1024
+    # Workers which process the bands in parallel, they share the memory limit and the concurrent requests
+    num_workers: int = 1
+    executor_type: ExecutorType = ExecutorType.THREAD
+
+
+def get_tiling_config_from_env() -> Optional[TilingConfig]:
+    """
+    Get the tiling configuration with the memory limit from `IMAGE_PROCESSING_MEMORY_LIMIT_MB`, the number
+    of workers from `IMAGE_PROCESSING_TILE_WORKERS` and the worker type from `IMAGE_PROCESSING_TILE_EXECUTOR`
+    environment variables.
+    A zero memory limit disables tiling
+    Returns:
+        Optional[TilingConfig]: tiling configuration or None if tiling is disabled
+    """
+    memory_limit_mb = int(os.environ.get("IMAGE_PROCESSING_MEMORY_LIMIT_MB", "256"))
+    if memory_limit_mb <= 0:
+        return None
+    return TilingConfig(
+        memory_limit_bytes=memory_limit_mb * 1024 * 1024,
+        num_workers=int(os.environ.get("IMAGE_PROCESSING_TILE_WORKERS", "1")),
+        executor_type=ExecutorType(os.environ.get("IMAGE_PROCESSING_TILE_EXECUTOR", ExecutorType.THREAD.value)),
+    )
+
+
+def get_halo(operation: ImageOperation) -> Optional[int]:
+    """
+    Get the number of neighbouring rows the operation reads on each side of an output row
+    Args:
+        operation: image operation
+    Returns:
+        Optional[int]: halo in rows or None if the operation does not work row by row
+    """
+    if isinstance(operation, LookupTableOperation):
+        return 0
+    if isinstance(operation, FilterOperation):
+        return int(operation.kernel.shape[0] // 2)
+    if not isinstance(operation, KernelOperation):
+        return None
+
+    command = operation.command
+    if command.kernel_type in _KERNEL_HALOS:
+        return _KERNEL_HALOS[command.kernel_type]
+    if command.kernel_type == KernelTypes.BLUR and int(command.parameters.step) >= 0:
+        return int(get_blur_kernel(command).shape[0] // 2)
+    return None
+
+
+class RowStage(ABC):
+    """
+    Step of the tiled pipeline which produces any band of rows of its output on request
+    """
+
+    def __init__(self, height: int, width: int, bytes_per_pixel: int) -> None:
+        self.height = height
+        self.width = width
+        # Upper bound of a single pixel size, kernels only keep or drop channels
+        self.bytes_per_pixel = bytes_per_pixel
+
+    def get_row_bytes(self, num_rows: int) -> int:
+        return num_rows * self.width * self.bytes_per_pixel
+
+    @abstractmethod
+    def get_rows(self, start: int, stop: int) -> ImageBuffer:
+        """
+        Get the output rows from `start` to `stop`
+        """
+
+    @abstractmethod
+    def estimate_bytes(self, start: int, stop: int) -> int:
+        """
+        Estimate the working memory of producing the output rows from `start` to `stop`
+        """
+
+
+class ArrayStage(RowStage):
+    """
+    Image which is already in memory
+    """
+
+    def __init__(self, image: ImageBuffer) -> None:
+        array = image.array
+        super().__init__(array.shape[0], array.shape[1], array.itemsize * (array.shape[2] if array.ndim == 3 else 1))
+        self.image = image
+
+    def get_rows(self, start: int, stop: int) -> ImageBuffer:
+        return ImageBuffer(self.image.array[start:stop], self.image.channel_order)
+
+    def estimate_bytes(self, start: int, stop: int) -> int:
+        return 0
+
+
+class LocalStage(RowStage):
+    """
+    Pointwise or neighbourhood operation applied to overlapping bands. Every band is extended by the halo,
+    so the kept rows see the same neighbourhood as in the whole image, and the image borders stay the same
+    """
+
+    def __init__(self, operation: ImageOperation, halo: int, upstream: RowStage) -> None:
+        super().__init__(upstream.height, upstream.width, upstream.bytes_per_pixel)
+        self._operation = operation
+        self._halo = halo
+        self._upstream = upstream
+
+    def _get_source_rows(self, start: int, stop: int) -> Tuple[int, int]:
+        return max(0, start - self._halo), min(self.height, stop + self._halo)
+
+    def get_rows(self, start: int, stop: int) -> ImageBuffer:
+        source_start, source_stop = self._get_source_rows(start, stop)
+        band = self._operation.apply_buffer(self._upstream.get_rows(source_start, source_stop))
+        return band.with_array(band.array[start - source_start : stop - source_start])
+
+    def estimate_bytes(self, start: int, stop: int) -> int:
+        source_start, source_stop = self._get_source_rows(start, stop)
+        return self._upstream.estimate_bytes(source_start, source_stop) + 2 * self.get_row_bytes(
+            source_stop - source_start
+        )
+
+
+class ResizeStage(RowStage):
+    """
+    Resize applied to bands of whole row units. A unit maps `source_unit` input rows to `output_unit` output rows
+    with the same scale as the whole image, so cv2.resize computes the same coefficients for every row
+    """
+
+    def __init__(self, operation: KernelOperation, upstream: RowStage) -> None:
+        parameters = operation.command.parameters
+        super().__init__(int(parameters.height), int(parameters.width), upstream.bytes_per_pixel)
+        self._upstream = upstream
+
+        num_units = math.gcd(upstream.height, self.height)
+        self.source_unit = upstream.height // num_units
+        self.output_unit = self.height // num_units
+        # Linear interpolation reads one row beyond the unit on each side, at least two rows are kept in the halo
+        self._halo_units = math.ceil(2 / self.source_unit)
+        self._num_units = num_units
+
+    def _get_unit_range(self, start: int, stop: int) -> Tuple[int, int]:
+        first_unit = max(0, start // self.output_unit - self._halo_units)
+        last_unit = min(self._num_units, math.ceil(stop / self.output_unit) + self._halo_units)
+        return first_unit, last_unit
+
+    def get_rows(self, start: int, stop: int) -> ImageBuffer:
+        first_unit, last_unit = self._get_unit_range(start, stop)
+        source = self._upstream.get_rows(first_unit * self.source_unit, last_unit * self.source_unit)
+        band = cv2.resize(source.array, (self.width, (last_unit - first_unit) * self.output_unit))
+        offset = first_unit * self.output_unit
+        return source.with_array(band[start - offset : stop - offset])
+
+    def estimate_bytes(self, start: int, stop: int) -> int:
+        first_unit, last_unit = self._get_unit_range(start, stop)
+        return self._upstream.estimate_bytes(
+            first_unit * self.source_unit, last_unit * self.source_unit
+        ) + self.get_row_bytes((last_unit - first_unit) * self.output_unit)
+
+
+class CropStage(RowStage):
+    """
+    Crop inside the image, which only selects rows and columns of the input
+    """
+
+    def __init__(self, operation: KernelOperation, upstream: RowStage) -> None:
+        parameters = operation.command.parameters
+        super().__init__(int(parameters.height), int(parameters.width), upstream.bytes_per_pixel)
+        self._upstream = upstream
+        # Offsets of the crop around the image center as in CropImage
+        self._x = upstream.width // 2 - self.width // 2
+        self._y = upstream.height // 2 - self.height // 2
+
+    @staticmethod
+    def is_inside(operation: KernelOperation, upstream: RowStage) -> bool:
+        width, height = int(operation.command.parameters.width), int(operation.command.parameters.height)
+        return 0 < width <= upstream.width and 0 < height <= upstream.height
+
+    def get_rows(self, start: int, stop: int) -> ImageBuffer:
+        band = self._upstream.get_rows(self._y + start, self._y + stop)
+        return band.with_array(band.array[:, self._x : self._x + self.width])
+
+    def estimate_bytes(self, start: int, stop: int) -> int:
+        return self._upstream.estimate_bytes(self._y + start, self._y + stop)
+
+
+class WarpStage(RowStage):
+    """
+    Affine transform given by the matrix which maps output pixels to source pixels, e.g. a rotation or fused
+    geometric commands. Every band is resampled from the source region its pixels map to
+    """
+
+    def __init__(self, matrix: np.ndarray, height: int, width: int, upstream: RowStage) -> None:
+        super().__init__(height, width, upstream.bytes_per_pixel)
+        self._matrix = matrix
+        self._upstream = upstream
+
+    @staticmethod
+    def is_streamable(matrix: np.ndarray, upstream: RowStage) -> bool:
+        """
+        Check if a band reads a limited number of source rows. After a quarter turn every band reads all source rows,
+        which is only cheap if the source is already in memory
+        """
+        return isinstance(upstream, ArrayStage) or matrix[1, 0] == 0
+
+    def _get_source_region(self, start: int, stop: int) -> Tuple[int, int, int, int]:
+        corners = np.array(
+            [[0, start, 1], [self.width - 1, start, 1], [0, stop - 1, 1], [self.width - 1, stop - 1, 1]],
+            dtype=np.float64,
+        )
+        source_corners = corners @ self._matrix.T
+        # Linear interpolation reads the next source pixel, one more is kept for the rounding of the coordinates
+        x_start, y_start = np.floor(source_corners.min(axis=0)).astype(int) - 1
+        x_stop, y_stop = np.floor(source_corners.max(axis=0)).astype(int) + 2
+        # Pixels outside of the source replicate its border, so the region keeps a row and a column at least
+        x_start = min(max(0, x_start), self._upstream.width - 1)
+        y_start = min(max(0, y_start), self._upstream.height - 1)
+        x_stop = max(min(self._upstream.width, x_stop), x_start + 1)
+        y_stop = max(min(self._upstream.height, y_stop), y_start + 1)
+        return int(x_start), int(x_stop), int(y_start), int(y_stop)
+
+    def get_rows(self, start: int, stop: int) -> ImageBuffer:
+        x_start, x_stop, y_start, y_stop = self._get_source_region(start, stop)
+        source = self._upstream.get_rows(y_start, y_stop)
+        region = source.array[:, x_start:x_stop]
+        # Whole pixel moves are exact in the coordinates of the band
+        matrix = self._matrix.copy()
+        matrix[:, 2] += matrix[:, 1] * start - (x_start, y_start)
+        band = apply_transform_as_slice(region, matrix, stop - start, self.width)
+        if band is None:
+            band = warp_affine(region, self._matrix, stop - start, self.width, start, (x_start, y_start))
+        return source.with_array(band)
+
+    def estimate_bytes(self, start: int, stop: int) -> int:
+        x_start, x_stop, y_start, y_stop = self._get_source_region(start, stop)
+        # OpenCV copies a region with negative strides, e.g. of a rotated view
+        region_bytes = (y_stop - y_start) * (x_stop - x_start) * self.bytes_per_pixel
+        return self._upstream.estimate_bytes(y_start, y_stop) + region_bytes + self.get_row_bytes(stop - start)
+
+
+class SharedImage:
+    """
+    Image in shared memory, which worker processes read and write without pickling the pixels
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype: np.dtype, channel_order: ChannelOrder) -> None:
+        self._shape = shape
+        self._dtype = np.dtype(dtype)
+        self._channel_order = channel_order
+        self._memory: Optional[SharedMemory] = SharedMemory(
+            create=True, size=max(1, math.prod(shape) * self._dtype.itemsize)
+        )
+        self._name = self._memory.name
+
+    @classmethod
+    def from_buffer(cls, image: ImageBuffer) -> "SharedImage":
+        shared_image = cls(image.array.shape, image.array.dtype, image.channel_order)
+        shared_image.to_buffer().array[:] = image.array
+        return shared_image
+
+    def to_buffer(self) -> ImageBuffer:
+        """
+        Get the buffer which views the shared memory, it is valid until the image is closed
+        """
+        if self._memory is None:
+            self._memory = SharedMemory(name=self._name)
+        array: np.ndarray = np.ndarray(self._shape, self._dtype, buffer=self._memory.buf)
+        return ImageBuffer(array, self._channel_order)
+
+    def close(self, unlink: bool = False) -> None:
+        if self._memory is None:
+            return
+        self._memory.close()
+        if unlink:
+            self._memory.unlink()
+        self._memory = None
+
+    def __getstate__(self) -> dict:
+        # Only the name of the memory block is sent to the workers
+        return {**self.__dict__, "_memory": None}
+
+
+class _OpenCVThreadLimit:
+    """
+    Caps the threads OpenCV starts for every call while bands run in worker threads, so OpenCV threads do not
+    multiply with the tile workers. The setting is shared by the process, it is restored when the last
+    concurrent run finishes
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._num_runs = 0
+        self._saved_num_threads = 0
+
+    @contextmanager
+    def limit(self, num_threads: int) -> Iterator[None]:
+        with self._lock:
+            if self._num_runs == 0:
+                self._saved_num_threads = cv2.getNumThreads()
+                cv2.setNumThreads(min(num_threads, self._saved_num_threads))
+            self._num_runs += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._num_runs -= 1
+                if self._num_runs == 0:
+                    cv2.setNumThreads(self._saved_num_threads)
+
+
+_OPENCV_THREAD_LIMIT = _OpenCVThreadLimit()
+
+
+def _initialize_worker() -> None:
+    # Parallelism comes from the worker processes, so OpenCV does not start its own threads in each of them
+    cv2.setNumThreads(1)
+
+
+def _process_bands(
+    config: TilingConfig,
+    source: SharedImage,
+    operations: List[ImageOperation],
+    output: SharedImage,
+    bands: List[Tuple[int, int]],
+) -> None:
+    """
+    Write the bands of the streamed operations applied to the shared source into the shared output
+    """
+    try:
+        executor = TiledExecutor(TilingConfig(config.memory_limit_bytes))
+        stage = executor.create_streamed_stages(source.to_buffer(), operations)
+        output_array = output.to_buffer().array
+        for start, stop in bands:
+            output_array[start:stop] = stage.get_rows(start, stop).array
+    finally:
+        source.close()
+        output.close()
+
+
+class TiledExecutor:
+    """
+    Applies operations to bands of rows, so the intermediate images of the queue are not materialized.
+    Bands are as tall as the memory limit allows. Pointwise and neighbourhood kernels, resizes, crops inside
+    the image, rotations and fused geometric commands are streamed; other operations are applied to their whole
+    input, which is computed band by band. A quarter turn reads all rows of its input for every band, so
+    the input of a quarter turn which follows streamed operations is computed band by band and kept in memory.
+    The output matches the operations applied to the whole image.
+
+    Bands are independent, so they are processed by a pool of threads, as OpenCV releases the GIL, or of processes,
+    which read the source and write the output through shared memory. The pool is shared by concurrent requests.
+    OpenCV threads are capped while the bands run in parallel, so the workers do not oversubscribe the CPU
+    """
+
+    def __init__(self, config: Optional[TilingConfig] = None) -> None:
+        self._config = config or TilingConfig()
+        if self._config.num_workers < 1:
+            raise ValueError(f"num_workers must be positive, got {self._config.num_workers}")
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+
+    def apply(self, image: ImageBuffer, operations: List[ImageOperation]) -> ImageBuffer:
+        """
+        Apply the operations to the image
+        Args:
+            image: ImageBuffer image
+            operations: operations to apply in order
+        Returns:
+            image: ImageBuffer image
+        """
+        # Operations streamed from the last image in memory
+        source = image
+        streamed_operations: List[ImageOperation] = []
+        stage: RowStage = ArrayStage(image)
+        for operation in operations:
+            next_stage = self._create_stage(operation, stage)
+            if next_stage is None and streamed_operations:
+                # Some operations are only streamed from an image in memory
+                source = self._run(source, streamed_operations, stage)
+                streamed_operations = []
+                stage = ArrayStage(source)
+                next_stage = self._create_stage(operation, stage)
+            if next_stage is None:
+                source = operation.apply_buffer(source)
+                next_stage = ArrayStage(source)
+            else:
+                streamed_operations.append(operation)
+            stage = next_stage
+        return self._run(source, streamed_operations, stage)
+
+    def create_streamed_stages(self, image: ImageBuffer, operations: List[ImageOperation]) -> RowStage:
+        """
+        Create the stages of operations which are all streamed
+        Args:
+            image: ImageBuffer image
+            operations: streamed operations
+        Returns:
+            RowStage: last stage
+        """
+        stage: RowStage = ArrayStage(image)
+        for operation in operations:
+            next_stage = self._create_stage(operation, stage)
+            if next_stage is None:
+                raise ValueError(f"{operation} is not applied by row bands")
+            stage = next_stage
+        return stage
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker pool
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _run(self, source: ImageBuffer, operations: List[ImageOperation], stage: RowStage) -> ImageBuffer:
+        """
+        Compute the output of the stage, which streams the operations from the source, band by band
+        """
+        if not operations:
+            return source
+
+        num_workers = self._config.num_workers
+        band_rows = self._get_band_rows(stage, self._config.memory_limit_bytes // num_workers)
+        if num_workers > 1:
+            # Every worker gets a band at least
+            band_rows = min(band_rows, math.ceil(stage.height / num_workers))
+        logging.info("Processing %d rows in bands of %d rows", stage.height, band_rows)
+
+        # The first band gives the channel order and the data type of the output
+        first_band = stage.get_rows(0, band_rows)
+        output = first_band.with_array(
+            np.empty((stage.height, *first_band.array.shape[1:]), dtype=first_band.array.dtype)
+        )
+        output.array[:band_rows] = first_band.array
+        del first_band
+
+        bands = [(start, min(stage.height, start + band_rows)) for start in range(band_rows, stage.height, band_rows)]
+        if num_workers == 1 or not bands:
+            for start, stop in bands:
+                output.array[start:stop] = stage.get_rows(start, stop).array
+        elif self._config.executor_type == ExecutorType.PROCESS:
+            self._run_in_processes(source, operations, output, bands)
+        else:
+
+            def process_band(band: Tuple[int, int]) -> None:
+                output.array[band[0] : band[1]] = stage.get_rows(*band).array
+
+            # The CPUs are split between the tile workers
+            with _OPENCV_THREAD_LIMIT.limit(max(1, (os.cpu_count() or 1) // num_workers)):
+                list(self._get_executor().map(process_band, bands))
+        return output
+
+    def _run_in_processes(
+        self, source: ImageBuffer, operations: List[ImageOperation], output: ImageBuffer, bands: List[Tuple[int, int]]
+    ) -> None:
+        shared_source = SharedImage.from_buffer(source)
+        shared_output = SharedImage(output.array.shape, output.array.dtype, output.channel_order)
+        try:
+            futures = [
+                self._get_executor().submit(
+                    _process_bands, self._config, shared_source, operations, shared_output, worker_bands
+                )
+                for worker_bands in self._split_bands(bands)
+            ]
+            for future in futures:
+                future.result()
+            # Rows of the first band are already in the output
+            first_row = bands[0][0]
+            output.array[first_row:] = shared_output.to_buffer().array[first_row:]
+        finally:
+            shared_source.close(unlink=True)
+            shared_output.close(unlink=True)
+
+    def _split_bands(self, bands: List[Tuple[int, int]]) -> Iterator[List[Tuple[int, int]]]:
+        # Each worker process gets a contiguous run of bands
+        num_workers = min(self._config.num_workers, len(bands))
+        for index in range(num_workers):
+            yield bands[index * len(bands) // num_workers : (index + 1) * len(bands) // num_workers]
+
+    def _get_executor(self) -> Executor:
+        with self._executor_lock:
+            if self._executor is None:
+                if self._config.executor_type == ExecutorType.PROCESS:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self._config.num_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_initialize_worker,
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._config.num_workers, thread_name_prefix="image_tiles"
+                    )
+            return self._executor
+
+    def _create_stage(self, operation: ImageOperation, upstream: RowStage) -> Optional[RowStage]:
+        """
+        Create the stage which streams the operation
+        Returns:
+            Optional[RowStage]: stage or None if the operation is applied to the whole image
+        """
+        halo = get_halo(operation)
+        if halo is not None:
+            return LocalStage(operation, halo, upstream)
+
+        if isinstance(operation, KernelOperation):
+            if operation.command.kernel_type == KernelTypes.RESIZE and self._is_resize_tileable(operation, upstream):
+                return ResizeStage(operation, upstream)
+            if operation.command.kernel_type == KernelTypes.CROP and CropStage.is_inside(operation, upstream):
+                return CropStage(operation, upstream)
+            if operation.command.kernel_type == KernelTypes.ROTATE:
+                return self._create_warp_stages(AffineOperation(operation.commands), upstream)
+        if isinstance(operation, AffineOperation):
+            return self._create_warp_stages(operation, upstream)
+        return None
+
+    @staticmethod
+    def _create_warp_stages(operation: AffineOperation, upstream: RowStage) -> Optional[RowStage]:
+        stage = upstream
+        for matrix, height, width in operation.get_transforms(upstream.height, upstream.width):
+            if not WarpStage.is_streamable(matrix, stage):
+                return None
+            stage = WarpStage(matrix, height, width, stage)
+        return stage
+
+    def _is_resize_tileable(self, operation: KernelOperation, upstream: RowStage) -> bool:
+        if int(operation.command.parameters.width) <= 0 or int(operation.command.parameters.height) <= 0:
+            return False
+        stage = ResizeStage(operation, upstream)
+        # A single unit of the resize with its halo must fit into the memory limit
+        return stage.estimate_bytes(0, stage.output_unit) <= self._config.memory_limit_bytes
+
+    @staticmethod
+    def _get_band_rows(stage: RowStage, memory_limit_bytes: int) -> int:
+        band_rows = stage.height
+        while band_rows > 1:
+            start = max(0, stage.height // 2 - band_rows // 2)
+            if stage.estimate_bytes(start, start + band_rows) <= memory_limit_bytes:
+                break
+            band_rows //= 2
+        return band_rows
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.image_processing.command_parser.language_package import ImageParameters
+
+DETAIL_TILE_SIZE = 64
+
+
+def _to_rgb_array(image: Image.Image) -> np.ndarray:
+    return np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+
+
+def _get_mean_saturation(rgb: np.ndarray) -> float:
+    # Saturation channel of the PIL HSV conversion used by `utils.get_saturation`, which truncates unlike OpenCV
+    max_channel = rgb.max(axis=2).astype(np.uint16)
+    saturation = (max_channel - rgb.min(axis=2)) * 255 // np.maximum(max_channel, 1)
+    return float(saturation.mean())
+
+
+class ImageStatistics:
+    """
+    Computes the image parameters used by the image-aware command parsing in one pass over a bounded number of pixels.
+    Brightness, contrast and saturation are estimated on a nearest-neighbour subsample of at most `max_side` pixels
+    per side, which keeps the pixel distribution unlike averaging. The Laplacian changes with the scale, so the level
+    of detail is estimated on a grid of full resolution tiles with the same pixel budget.
+    Images within the budget and images thinner than a tile are analyzed as a whole
+    """
+
+    def __init__(self, max_side: int = 512, max_workers: Optional[int] = None) -> None:
+        """
+        Args:
+            max_side: maximum side of the subsample the statistics are computed on
+            max_workers: number of threads of the batch API, OpenCV releases the GIL
+        """
+        if max_side < DETAIL_TILE_SIZE:
+            raise ValueError(f"max_side must be at least {DETAIL_TILE_SIZE}, got {max_side}")
+        self._max_side = max_side
+        self._max_workers = max_workers
+
+    def compute(self, image: Image.Image) -> ImageParameters:
+        """
+        Get the parameters of the image
+        Args:
+            image: PIL image
+        Returns:
+            ImageParameters: original size, average brightness, contrast, color space, saturation and level of detail
+        """
+        is_within_budget = max(image.size) <= self._max_side
+
+        sample = _to_rgb_array(image if is_within_budget else self._get_subsample(image))
+        # The grayscale array of the sample is shared by the brightness, the contrast and the level of detail
+        grayscale_sample = cv2.cvtColor(sample, cv2.COLOR_RGB2GRAY)
+        brightness, contrast = cv2.meanStdDev(grayscale_sample)
+        saturation = _get_mean_saturation(sample)
+
+        if is_within_budget:
+            laplacian = cv2.Laplacian(grayscale_sample, cv2.CV_32F)
+        elif min(image.size) < DETAIL_TILE_SIZE:
+            # Tiles do not fit into a thin image, it has less than DETAIL_TILE_SIZE pixels per unit of its length
+            laplacian = cv2.Laplacian(cv2.cvtColor(_to_rgb_array(image), cv2.COLOR_RGB2GRAY), cv2.CV_32F)
+        else:
+            laplacian = self._get_tiles_laplacian(image)
+        _, laplacian_stddev = cv2.meanStdDev(laplacian)
+
+        image_parameters: ImageParameters = {
+            "original_size": {"width": image.width, "height": image.height},
+            "average_brightness": float(brightness[0, 0]),
+            "contrast": float(contrast[0, 0]),
+            "color_space": image.mode,
+            "saturation": saturation,
+            "level_of_detail": float(laplacian_stddev[0, 0] ** 2),
+        }
+        return image_parameters
+
+    def compute_batch(self, images: Sequence[Image.Image]) -> List[ImageParameters]:
+        """
+        Get the parameters of many images in parallel threads
+        Args:
+            images: PIL images
+        Returns:
+            List[ImageParameters]: parameters in the order of the images
+        """
+        if len(images) <= 1:
+            return [self.compute(image) for image in images]
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            return list(executor.map(self.compute, images))
+
+    def _get_subsample(self, image: Image.Image) -> Image.Image:
+        scale = self._max_side / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.Resampling.NEAREST)
+
+    def _get_tiles_laplacian(self, image: Image.Image) -> np.ndarray:
+        """
+        Get the Laplacian of evenly spaced full resolution tiles, without the tile borders
+        """
+        num_tiles = self._max_side // DETAIL_TILE_SIZE
+        lefts = np.linspace(0, image.width - DETAIL_TILE_SIZE, num_tiles).astype(int)
+        tops = np.linspace(0, image.height - DETAIL_TILE_SIZE, num_tiles).astype(int)
+        tiles = [
+            _to_rgb_array(image.crop((left, top, left + DETAIL_TILE_SIZE, top + DETAIL_TILE_SIZE)))
+            for top in tops
+            for left in lefts
+        ]
+        # Tiles are stacked into a single column, so the Laplacian runs once. Rows next to the seams are dropped
+        grayscale_tiles = cv2.cvtColor(np.concatenate(tiles), cv2.COLOR_RGB2GRAY)
+        laplacian = cv2.Laplacian(grayscale_tiles, cv2.CV_32F)
+        laplacian = laplacian.reshape(len(tiles), DETAIL_TILE_SIZE, DETAIL_TILE_SIZE)[:, 1:-1, 1:-1]
+        return np.ascontiguousarray(laplacian)
@@ -0,0 +1,233 @@
+import asyncio
+from typing import AsyncIterator, Callable, Generic, List, Optional, Tuple, TypeVar
+
+import numpy as np
+from PIL import Image
+
+from src.audio2text.speech_recognition import (
+    AudioSource,
+    LongFormConfig,
+    SpeechRecognition,
+    get_chunk_batches,
+    merge_transcriptions,
+    split_audio,
+)
+from src.audio2text.transcription_cache import TranscriptionCache
+from src.image_generation.generation import GenerationParameters, StableDiffusionPipeline
+from src.image_generation.generation_cache import GenerationCache
+from src.image_generation.job import GenerationJob, JobStatus
+from src.image_processing.command import Command
+from src.image_processing.command_parser.command_parser import CommandParser, ParserParameters
+from src.image_processing.image_processor import ImageProcessor
+from src.inference.batching import BatchingConfig, MicroBatcher
+from src.inference.executor import InferenceExecutor
+from src.inference.model_registry import ModelHandle
+from src.sticker_generator.sticker_generator import StickerGenerator
+
+ModelT = TypeVar("ModelT")
+T = TypeVar("T")
+
+
+class AsyncModel(Generic[ModelT]):
+    """
+    Base class for awaitable model wrappers backed by the inference executor.
+    The model is acquired from the registry inside the worker, so it is loaded off the event loop on first use.
+    """
+
+    def __init__(self, model: ModelHandle[ModelT], executor: InferenceExecutor) -> None:
+        self._model = model
+        self._executor = executor
+
+    @property
+    def model(self) -> ModelHandle[ModelT]:
+        return self._model
+
+    async def _run(self, func: Callable[[ModelT], T]) -> T:
+        return await self._executor.run(self._model.model_name, self._model.call, func)
+
+
+class AsyncSpeechRecognition(AsyncModel[SpeechRecognition]):
+    def __init__(  # pylint: disable=too-many-positional-arguments, too-many-arguments
+        self,
+        model: ModelHandle[SpeechRecognition],
+        executor: InferenceExecutor,
+        batching: Optional[BatchingConfig] = None,
+        long_form: Optional[LongFormConfig] = None,
+        cache: Optional[TranscriptionCache] = None,
+    ) -> None:
+        """
+        Args:
+            model: speech recognition model handle
+            executor: inference executor
+            batching: micro-batching configuration, only supported by Whisper models
+            long_form: long-form transcription configuration
+            cache: cache of transcriptions
+        """
+        super().__init__(model, executor)
+        self._long_form = long_form or LongFormConfig()
+        self._cache = cache
+        self._batcher: Optional[MicroBatcher[np.ndarray, str]] = None
+        if batching is not None:
+            self._batcher = MicroBatcher(self._gen_transcriptions_batch, executor, model.model_name, batching)
+
+    @property
+    def batcher(self) -> Optional[MicroBatcher[np.ndarray, str]]:
+        return self._batcher
+
+    @property
+    def cache(self) -> Optional[TranscriptionCache]:
+        return self._cache
+
+    async def gen_transcription(self, path_to_file: AudioSource, file_unique_id: Optional[str] = None) -> str:
+        """
+        Args:
+            path_to_file: path to the file or in-memory encoded audio
+            file_unique_id: Telegram file identifier used as the cache key instead of the content hash
+        """
+        cache_key, transcription = await self._get_cached(path_to_file, file_unique_id)
+        if transcription is not None:
+            return transcription
+
+        transcription = await self._transcribe(path_to_file)
+        await self._put_cached(cache_key, transcription)
+        return transcription
+
+    async def gen_transcription_long_form(
+        self, path_to_file: AudioSource, file_unique_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Transcribe audio of any length chunk by chunk, yielding the text stitched so far.
+        The next batch of chunks is already running while the caller handles the partial text
+        """
+        cache_key, transcription = await self._get_cached(path_to_file, file_unique_id)
+        if transcription is not None:
+            yield transcription
+            return
+
+        is_whisper = await self._run(lambda model: model.whisper)
+        if not is_whisper:
+            # The cache is already checked, so the audio is transcribed directly
+            transcription = await self._transcribe(path_to_file)
+            await self._put_cached(cache_key, transcription)
+            yield transcription
+            return
+
+        audio_input = await asyncio.to_thread(SpeechRecognition.load_audio, path_to_file)
+        chunks = split_audio(audio_input, self._long_form.chunk_length_s, self._long_form.overlap_s)
+        batches = get_chunk_batches(chunks, self._long_form.batch_size)
+
+        pending = [asyncio.ensure_future(self._run_batch(batch)) for batch in batches[:1]]
+        transcription = ""
+        try:
+            for next_batch in batches[1:] + [[]]:
+                chunk_transcriptions = await pending.pop()
+                if next_batch:
+                    pending.append(asyncio.ensure_future(self._run_batch(next_batch)))
+                for chunk_transcription in chunk_transcriptions:
+                    transcription = merge_transcriptions(transcription, chunk_transcription)
+                yield transcription
+        finally:
+            for task in pending:
+                task.cancel()
+
+        await self._put_cached(cache_key, transcription)
+
+    async def _transcribe(self, path_to_file: AudioSource) -> str:
+        if self._batcher is None:
+            return await self._run(lambda model: model.gen_transcription(path_to_file))
+        audio_input = await asyncio.to_thread(SpeechRecognition.load_audio, path_to_file)
+        return await self._batcher.submit(audio_input)
+
+    async def _get_cached(
+        self, path_to_file: AudioSource, file_unique_id: Optional[str]
+    ) -> Tuple[Optional[str], Optional[str]]:
+        if self._cache is None:
+            return None, None
+        cache_key = await asyncio.to_thread(self._cache.get_key, path_to_file, file_unique_id)
+        return cache_key, await asyncio.to_thread(self._cache.get, cache_key)
+
+    async def _put_cached(self, cache_key: Optional[str], transcription: str) -> None:
+        if self._cache is not None and cache_key is not None:
+            await asyncio.to_thread(self._cache.put, cache_key, transcription)
+
+    async def _run_batch(self, audio_inputs: List[np.ndarray]) -> List[str]:
+        return await self._run(lambda model: model.gen_transcriptions_whisper_batch(audio_inputs))
+
+    def _gen_transcriptions_batch(self, audio_inputs: List[np.ndarray]) -> List[str]:
+        return self._model.call(lambda model: model.gen_transcriptions_whisper_batch(audio_inputs))
+
+
+class AsyncImageProcessor(AsyncModel[ImageProcessor]):
+    async def get_processed_image(self, image: Image.Image, command_queue: List[Command]) -> Image.Image:
+        return await self._run(lambda model: model.get_processed_image(image=image, command_queue=command_queue))
+
+    async def get_processed_images(self, images: List[Image.Image], command_queue: List[Command]) -> List[Image.Image]:
+        return await self._run(lambda model: model.get_processed_images(images=images, command_queue=command_queue))
+
+
+class AsyncCommandParser(AsyncModel[CommandParser]):
+    async def parse_text(self, text: str, parser_parameters: ParserParameters) -> List[Command]:
+        return await self._run(lambda model: model.parse_text(text, parser_parameters))
+
+
+class AsyncStickerGenerator(AsyncModel[StickerGenerator]):
+    async def generate_sticker(
+        self, image: Image.Image, point: Optional[Tuple[int, int]] = None
+    ) -> Optional[Image.Image]:
+        return await self._run(lambda model: model.generate_sticker(image, point))
+
+    async def generate_stickers(self, images: List[Image.Image]) -> List[Optional[Image.Image]]:
+        return await self._run(lambda model: model.generate_stickers(images))
+
+
+class AsyncStableDiffusionPipeline(AsyncModel[StableDiffusionPipeline]):
+    def __init__(
+        self,
+        model: ModelHandle[StableDiffusionPipeline],
+        executor: InferenceExecutor,
+        cache: Optional[GenerationCache] = None,
+    ) -> None:
+        """
+        Args:
+            model: stable diffusion pipeline handle
+            executor: inference executor
+            cache: cache of generated images
+        """
+        super().__init__(model, executor)
+        self._cache = cache
+
+    @property
+    def cache(self) -> Optional[GenerationCache]:
+        return self._cache
+
+    async def generate_image(
+        self,
+        prompt: str,
+        parameters: Optional[GenerationParameters] = None,
+        job: Optional[GenerationJob] = None,
+    ) -> Image.Image:
+        """
+        Args:
+            prompt: text prompt
+            parameters: generation parameters, seeded generations are cached
+            job: generation job, it is cancelled if the caller stops waiting, so the worker is freed
+        """
+        parameters = parameters or GenerationParameters()
+        cache_key = self._cache.get_key(prompt, parameters) if self._cache is not None else None
+        if self._cache is not None and cache_key is not None:
+            image = await asyncio.to_thread(self._cache.get, cache_key)
+            if image is not None:
+                if job is not None:
+                    job.finish(JobStatus.DONE)
+                return image
+
+        try:
+            image = await self._run(lambda model: model.generate_image(prompt, parameters, job))
+        except asyncio.CancelledError:
+            if job is not None:
+                job.cancel()
+            raise
+
+        if self._cache is not None and cache_key is not None:
+            await asyncio.to_thread(self._cache.put, cache_key, image)
+        return image
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Generic, List, Optional, Set, Tuple, TypeVar
+
+from src.inference.executor import InferenceExecutor, ModelName
+
+InputT = TypeVar("InputT")
+OutputT = TypeVar("OutputT")
+
+
+@dataclass
+class BatchingConfig:
+    """
+    Micro-batching configuration
+    """
+
+    max_batch_size: int = 8
+    max_wait_ms: float = 50.0
+
+
+@dataclass
+class BatchingStats:
+    """
+    Counters collected by the micro-batcher
+    """
+
+    num_requests: int = 0
+    num_batches: int = 0
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.num_requests / self.num_batches if self.num_batches else 0.0
+
+
+class MicroBatcher(Generic[InputT, OutputT]):
+    """
+    Collects concurrent requests for a short window (or until the batch is full), runs them as one batch
+    in the worker pool of the model and hands every result back to its caller.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[InputT]], List[OutputT]],
+        executor: InferenceExecutor,
+        model_name: ModelName,
+        config: Optional[BatchingConfig] = None,
+    ) -> None:
+        self._batch_fn = batch_fn
+        self._executor = executor
+        self._model_name = model_name
+        self._config = config or BatchingConfig()
+        if self._config.max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be positive, got {self._config.max_batch_size}")
+
+        self._pending: List[Tuple[InputT, "asyncio.Future[OutputT]"]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set["asyncio.Task[None]"] = set()
+        self.stats = BatchingStats()
+
+    async def submit(self, item: InputT) -> OutputT:
+        """
+        Add the item to the current batch and wait for its result
+        Args:
+            item: single request
+        Returns:
+            OutputT: result of the request
+        """
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[OutputT]" = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self._config.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._config.max_wait_ms / 1000, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: List[Tuple[InputT, "asyncio.Future[OutputT]"]]) -> None:
+        self.stats.num_requests += len(batch)
+        self.stats.num_batches += 1
+        logging.info("Running %s batch of size %d", self._model_name.value, len(batch))
+
+        try:
+            results = await self._executor.run(self._model_name, self._batch_fn, [item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Batch of size {len(batch)} produced {len(results)} results")
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(ex)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
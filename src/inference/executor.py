@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from functools import partial
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ExecutorType(Enum):
+    """
+    The list of supported worker pool types. Model pools only run in threads,
+    processes suit stateless work with picklable arguments such as image tiles
+    """
+
+    THREAD = "thread"
+    PROCESS = "process"
+
+
+class ModelName(Enum):
+    """
+    The list of models served by the inference executor
+    """
+
+    SPEECH_RECOGNITION = "speech_recognition"
+    IMAGE_PROCESSING = "image_processing"
+    STICKER_GENERATION = "sticker_generation"
+    IMAGE_GENERATION = "image_generation"
+    COMMAND_PARSING = "command_parsing"
+
+
+@dataclass
+class ExecutorConfig:
+    """
+    Worker pool configuration of a single model
+    """
+
+    max_workers: int = 1
+    executor_type: ExecutorType = ExecutorType.THREAD
+
+
+def get_default_executor_configs() -> Dict[ModelName, ExecutorConfig]:
+    """
+    Get the default worker pool configuration for every model
+    Returns:
+        Dict[ModelName, ExecutorConfig]: the map of model names to pool configurations
+    """
+    return {
+        ModelName.SPEECH_RECOGNITION: ExecutorConfig(max_workers=1),
+        ModelName.IMAGE_PROCESSING: ExecutorConfig(max_workers=2),
+        ModelName.STICKER_GENERATION: ExecutorConfig(max_workers=1),
+        ModelName.IMAGE_GENERATION: ExecutorConfig(max_workers=1),
+        # The LLM tier runs one caption at a time, the second worker keeps pattern parsing responsive
+        ModelName.COMMAND_PARSING: ExecutorConfig(max_workers=2),
+    }
+
+
+def get_executor_configs_from_env() -> Dict[ModelName, ExecutorConfig]:
+    """
+    Get the worker pool configuration with overrides from `<MODEL_NAME>_WORKERS` environment variables
+    Returns:
+        Dict[ModelName, ExecutorConfig]: the map of model names to pool configurations
+    """
+    configs = get_default_executor_configs()
+    for model_name, config in configs.items():
+        max_workers = os.environ.get(f"{model_name.value.upper()}_WORKERS")
+        if max_workers:
+            config.max_workers = int(max_workers)
+    return configs
+
+
+class InferenceExecutor:
+    """
+    Runs blocking model calls in bounded per-model worker pools, so the asyncio event loop stays responsive.
+
+    Model pools are thread pools which share the model instances with the bot. Model wrappers submit closures
+    over the loaded models, which a process pool can neither pickle nor share, so process pools are rejected.
+    """
+
+    def __init__(self, configs: Optional[Dict[ModelName, ExecutorConfig]] = None) -> None:
+        self._configs = get_default_executor_configs()
+        if configs:
+            self._configs.update(configs)
+
+        self._executors: Dict[ModelName, Executor] = {}
+        for model_name, config in self._configs.items():
+            if config.max_workers < 1:
+                raise ValueError(f"max_workers for {model_name} must be positive, got {config.max_workers}")
+            if config.executor_type != ExecutorType.THREAD:
+                raise ValueError(
+                    f"{model_name} is configured with a {config.executor_type.value} pool, model calls only run "
+                    "in thread pools"
+                )
+            self._executors[model_name] = self._create_executor(model_name, config)
+
+    @staticmethod
+    def _create_executor(model_name: ModelName, config: ExecutorConfig) -> Executor:
+        return ThreadPoolExecutor(max_workers=config.max_workers, thread_name_prefix=model_name.value)
+
+    def get_config(self, model_name: ModelName) -> ExecutorConfig:
+        return self._configs[model_name]
+
+    async def run(self, model_name: ModelName, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run a blocking call in the worker pool of the model and wait for its result
+        Args:
+            model_name: model whose pool runs the call
+            func: blocking callable
+            args: positional arguments of the callable
+            kwargs: keyword arguments of the callable
+        Returns:
+            T: the value returned by the callable
+        """
+        if model_name not in self._executors:
+            raise ValueError(f"No worker pool is configured for {model_name}")
+
+        loop = asyncio.get_running_loop()
+        logging.debug("Submitting %s to %s pool", getattr(func, "__name__", func), model_name.value)
+        return await loop.run_in_executor(self._executors[model_name], partial(func, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop all worker pools
+        Args:
+            wait: wait for the running calls to finish
+        """
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait, cancel_futures=True)
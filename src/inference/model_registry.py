@@ -0,0 +1,365 @@
+import gc
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Generic, Iterable, Iterator, List, Optional, Set, TypeVar
+
+import psutil
+import torch
+
+from src.inference.executor import ModelName
+
+ModelT = TypeVar("ModelT")
+T = TypeVar("T")
+
+
+class ModelEventType(Enum):
+    LOAD = "load"
+    UNLOAD = "unload"
+
+
+@dataclass
+class ModelEvent:
+    """
+    Load or unload of a model
+    """
+
+    model_name: ModelName
+    event_type: ModelEventType
+    duration_s: float
+    size_bytes: int
+    reason: str
+
+
+@dataclass
+class RegistryConfig:
+    """
+    Model registry configuration. `None` disables the corresponding eviction policy
+    """
+
+    idle_timeout_s: Optional[float] = 600.0
+    memory_budget_bytes: Optional[int] = None
+    check_interval_s: float = 30.0
+
+
+def get_registry_config_from_env() -> RegistryConfig:
+    """
+    Get the registry configuration with overrides from `MODEL_IDLE_TIMEOUT_S` and `MODEL_MEMORY_BUDGET_MB`
+    environment variables. A zero value disables the corresponding eviction policy
+    Returns:
+        RegistryConfig: registry configuration
+    """
+    config = RegistryConfig()
+    idle_timeout_s = os.environ.get("MODEL_IDLE_TIMEOUT_S")
+    if idle_timeout_s:
+        config.idle_timeout_s = float(idle_timeout_s) or None
+    memory_budget_mb = os.environ.get("MODEL_MEMORY_BUDGET_MB")
+    if memory_budget_mb:
+        config.memory_budget_bytes = int(memory_budget_mb) * 1024 * 1024 or None
+    return config
+
+
+def get_resident_memory() -> int:
+    """
+    Get the resident memory of the process, including the memory allocated by CUDA if it is used
+    Returns:
+        int: memory in bytes
+    """
+    memory = int(psutil.Process().memory_info().rss)
+    if torch.cuda.is_available():
+        memory += int(torch.cuda.memory_allocated())
+    return memory
+
+
+def _find_modules(value: Any, depth: int, visited: Set[int]) -> Iterator[torch.nn.Module]:
+    if id(value) in visited:
+        return
+    visited.add(id(value))
+    if isinstance(value, torch.nn.Module):
+        yield value
+        return
+    if depth == 0 or isinstance(value, (str, bytes, torch.Tensor)):
+        return
+    if isinstance(value, dict):
+        children: Iterable[Any] = value.values()
+    elif isinstance(value, (list, tuple, set)):
+        children = value
+    else:
+        children = getattr(value, "__dict__", {}).values()
+    for child in children:
+        yield from _find_modules(child, depth - 1, visited)
+
+
+def get_model_size(instance: Any, max_depth: int = 4) -> int:
+    """
+    Get the size of the parameters and buffers of the torch modules held by the model. Unlike the change of
+    the resident memory, the size does not include the memory allocated by the other threads during the load.
+    Tensors shared between modules are counted once, models without torch modules have zero size
+    Args:
+        instance: loaded model
+        max_depth: depth of the attributes which are searched for the torch modules
+    Returns:
+        int: size in bytes
+    """
+    tensors: Dict[int, torch.Tensor] = {}
+    for module in _find_modules(instance, max_depth, set()):
+        for tensor in itertools.chain(module.parameters(), module.buffers()):
+            tensors[tensor.data_ptr()] = tensor
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors.values())
+
+
+class _ModelEntry:  # pylint: disable=too-few-public-methods
+    def __init__(self, factory: Callable[[], Any]) -> None:
+        self.factory = factory
+        self.instance: Optional[Any] = None
+        self.size_bytes = 0
+        self.last_used = 0.0
+        self.in_use = 0
+        self.load_lock = threading.Lock()
+
+
+class ModelHandle(Generic[ModelT]):
+    """
+    Typed access to a model registered in the ModelRegistry
+    """
+
+    def __init__(self, registry: "ModelRegistry", model_name: ModelName) -> None:
+        self._registry = registry
+        self._model_name = model_name
+
+    @property
+    def model_name(self) -> ModelName:
+        return self._model_name
+
+    @contextmanager
+    def acquire(self) -> Iterator[ModelT]:
+        """
+        Get the model, loading it on first use. The model is not evicted while it is acquired
+        """
+        with self._registry.acquire(self._model_name) as model:
+            yield model
+
+    def call(self, func: Callable[[ModelT], T]) -> T:
+        """
+        Call the function with the acquired model
+        Args:
+            func: function to call
+        Returns:
+            T: the value returned by the function
+        """
+        with self.acquire() as model:
+            return func(model)
+
+
+class ModelRegistry:
+    """
+    Loads models on first use, tracks the size of their weights and unloads models that have been idle for too long
+    or that push the process over the memory budget.
+    """
+
+    def __init__(self, config: Optional[RegistryConfig] = None) -> None:
+        self._config = config or RegistryConfig()
+        self._entries: Dict[ModelName, _ModelEntry] = {}
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[ModelEvent], None]] = []
+        self.events: Deque[ModelEvent] = deque(maxlen=100)
+
+        self._stop_monitor = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    def register(self, model_name: ModelName, factory: Callable[[], ModelT]) -> ModelHandle[ModelT]:
+        """
+        Register a model without loading it
+        Args:
+            model_name: name of the model
+            factory: callable which loads the model
+        Returns:
+            ModelHandle: typed handle to the model
+        """
+        with self._lock:
+            if model_name in self._entries:
+                raise ValueError(f"Model {model_name} is already registered")
+            self._entries[model_name] = _ModelEntry(factory)
+        return ModelHandle(self, model_name)
+
+    def add_listener(self, listener: Callable[[ModelEvent], None]) -> None:
+        self._listeners.append(listener)
+
+    def is_loaded(self, model_name: ModelName) -> bool:
+        return self._get_entry(model_name).instance is not None
+
+    def get_sizes(self) -> Dict[ModelName, int]:
+        """
+        Get the size of the weights of the loaded models
+        Returns:
+            Dict[ModelName, int]: the map of loaded model names to their sizes in bytes
+        """
+        with self._lock:
+            return {name: entry.size_bytes for name, entry in self._entries.items() if entry.instance is not None}
+
+    @contextmanager
+    def acquire(self, model_name: ModelName) -> Iterator[Any]:
+        """
+        Get the model, loading it on first use. The model is not evicted while it is acquired
+        Args:
+            model_name: name of the model
+        """
+        entry = self._get_entry(model_name)
+        with self._lock:
+            entry.in_use += 1
+        try:
+            yield self._load(model_name, entry)
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    def unload(self, model_name: ModelName, reason: str = "manual") -> bool:
+        """
+        Unload the model if it is loaded and not in use
+        Args:
+            model_name: name of the model
+            reason: reason reported in the unload event
+        Returns:
+            bool: True if the model was unloaded
+        """
+        entry = self._get_entry(model_name)
+        with self._lock:
+            if entry.instance is None or entry.in_use:
+                return False
+            start = time.perf_counter()
+            entry.instance = None
+
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        self._emit(ModelEvent(model_name, ModelEventType.UNLOAD, time.perf_counter() - start, entry.size_bytes, reason))
+        return True
+
+    def evict_idle(self) -> List[ModelName]:
+        """
+        Unload the models which have not been used for longer than the idle timeout
+        Returns:
+            List[ModelName]: unloaded models
+        """
+        if self._config.idle_timeout_s is None:
+            return []
+
+        now = time.monotonic()
+        with self._lock:
+            idle_models = [
+                name
+                for name, entry in self._entries.items()
+                if entry.instance is not None
+                and not entry.in_use
+                and now - entry.last_used > self._config.idle_timeout_s
+            ]
+        return [name for name in idle_models if self.unload(name, reason="idle")]
+
+    def enforce_memory_budget(self, required_bytes: int = 0, keep: Optional[ModelName] = None) -> List[ModelName]:
+        """
+        Unload the least recently used models until the process fits into the memory budget
+        Args:
+            required_bytes: memory which is about to be allocated
+            keep: model which must not be unloaded
+        Returns:
+            List[ModelName]: unloaded models
+        """
+        if self._config.memory_budget_bytes is None:
+            return []
+
+        expected_memory = get_resident_memory() + required_bytes
+        if expected_memory <= self._config.memory_budget_bytes:
+            return []
+
+        with self._lock:
+            candidates = sorted(
+                (
+                    (entry.last_used, name)
+                    for name, entry in self._entries.items()
+                    if name != keep and entry.instance is not None and not entry.in_use
+                ),
+                key=lambda candidate: candidate[0],
+            )
+
+        unloaded = []
+        for _, name in candidates:
+            if expected_memory <= self._config.memory_budget_bytes:
+                break
+            if self.unload(name, reason="memory budget"):
+                expected_memory -= self._entries[name].size_bytes
+                unloaded.append(name)
+
+        if expected_memory > self._config.memory_budget_bytes:
+            logging.warning(
+                "Memory budget of %d bytes is exceeded: %d bytes expected",
+                self._config.memory_budget_bytes,
+                expected_memory,
+            )
+        return unloaded
+
+    def start_monitor(self) -> None:
+        """
+        Start the background thread which evicts idle models
+        """
+        if self._monitor is not None:
+            return
+        self._stop_monitor.clear()
+        self._monitor = threading.Thread(target=self._monitor_loop, name="model_registry", daemon=True)
+        self._monitor.start()
+
+    def stop_monitor(self) -> None:
+        if self._monitor is None:
+            return
+        self._stop_monitor.set()
+        self._monitor.join()
+        self._monitor = None
+
+    def _monitor_loop(self) -> None:
+        while not self._stop_monitor.wait(self._config.check_interval_s):
+            self.evict_idle()
+            self.enforce_memory_budget()
+
+    def _get_entry(self, model_name: ModelName) -> _ModelEntry:
+        if model_name not in self._entries:
+            raise ValueError(f"Model {model_name} is not registered")
+        return self._entries[model_name]
+
+    def _load(self, model_name: ModelName, entry: _ModelEntry) -> Any:
+        with entry.load_lock:
+            if entry.instance is not None:
+                return entry.instance
+
+            self.enforce_memory_budget(required_bytes=entry.size_bytes, keep=model_name)
+
+            start = time.perf_counter()
+            instance = entry.factory()
+            duration_s = time.perf_counter() - start
+
+            with self._lock:
+                entry.instance = instance
+                entry.size_bytes = get_model_size(instance)
+                entry.last_used = time.monotonic()
+
+        self._emit(ModelEvent(model_name, ModelEventType.LOAD, duration_s, entry.size_bytes, "first use"))
+        self.enforce_memory_budget(keep=model_name)
+        return instance
+
+    def _emit(self, event: ModelEvent) -> None:
+        logging.info(
+            "Model %s %s in %.2f s (%.1f MB, %s)",
+            event.model_name.value,
+            "loaded" if event.event_type == ModelEventType.LOAD else "unloaded",
+            event.duration_s,
+            event.size_bytes / 1024 / 1024,
+            event.reason,
+        )
+        self.events.append(event)
+        for listener in self._listeners:
+            listener(event)
@@ -0,0 +1,158 @@
+import multiprocessing
+import resource
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+from tap import Tap
+
+from src.sticker_generator.sticker_generator import (
+    SamModelType,
+    SamPrecision,
+    StickerGenerator,
+    StickerModelConfig,
+)
+from src.utils import cv2_to_pil, pil_to_cv2
+
+
+class Arguments(Tap):
+    images_folder: Path = Path("data/sticker_benchmark")
+    models_folder: Path = Path("models/")
+    model_types: List[str] = [model_type.value for model_type in SamModelType]
+    precisions: List[str] = [precision.value for precision in SamPrecision]
+    repeats: int = 3
+    album_size: int = 0  # Compare sequential and album sticker generation if positive
+    album_model_type: str = SamModelType.VIT_B.value
+
+
+@dataclass
+class BenchmarkResult:
+    encoder_ms: float
+    decoder_ms: float
+    peak_memory_mb: float
+    masks: List[Optional[np.ndarray]]
+
+
+def load_images(images_folder: Path) -> List[np.ndarray]:
+    paths = sorted(path for path in images_folder.iterdir() if path.suffix.lower() in {".jpg", ".jpeg", ".png"})
+    if not paths:
+        raise FileNotFoundError(f"No images found in {images_folder}")
+    return [pil_to_cv2(Image.open(path).convert("RGB")) for path in paths]
+
+
+def get_peak_memory_mb() -> float:
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated() / 1024 / 1024
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_configuration(config: StickerModelConfig, images: List[np.ndarray], repeats: int) -> BenchmarkResult:
+    """
+    Measure a single configuration. It runs in a separate process, so the peak memory is not shared
+    """
+    generator = StickerGenerator(str(config.model_path), config.model_type.value, config.precision)
+
+    encoder_timings, decoder_timings, masks = [], [], []
+    for image in images:
+        height, width = image.shape[:2]
+        for _ in range(repeats):
+            # pylint: disable=protected-access
+            start = time.perf_counter()
+            generator._encode_image(image)
+            encoder_timings.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            mask = generator._predict_mask((width // 2, height // 2))
+            decoder_timings.append(time.perf_counter() - start)
+        masks.append(mask)
+
+    return BenchmarkResult(
+        encoder_ms=1000 * float(np.median(encoder_timings)),
+        decoder_ms=1000 * float(np.median(decoder_timings)),
+        peak_memory_mb=get_peak_memory_mb(),
+        masks=masks,
+    )
+
+
+def compare_album_latency(config: StickerModelConfig, images: List[Image.Image]) -> Tuple[float, float]:
+    """
+    Measure the per-sticker latency of sequential generation and of a single album call.
+    Caches are cleared before every run, so every image is encoded
+    """
+    generator = StickerGenerator(str(config.model_path), config.model_type.value, config.precision)
+
+    def clear_caches() -> None:
+        generator.embedding_cache.clear()
+        generator.sticker_cache.clear()
+
+    # Warm up the model so the first run is not penalized
+    generator.generate_sticker(images[0])
+    clear_caches()
+
+    start = time.perf_counter()
+    for image in images:
+        generator.generate_sticker(image)
+    sequential_time = time.perf_counter() - start
+    clear_caches()
+
+    start = time.perf_counter()
+    generator.generate_stickers(images)
+    album_time = time.perf_counter() - start
+
+    return sequential_time / len(images), album_time / len(images)
+
+
+def get_iou(mask: Optional[np.ndarray], reference: Optional[np.ndarray]) -> float:
+    if mask is None or reference is None:
+        return float(mask is None and reference is None)
+    union = np.logical_or(mask, reference).sum()
+    return float(np.logical_and(mask, reference).sum() / union) if union else 1.0
+
+
+def main() -> None:
+    args = Arguments(underscores_to_dashes=True).parse_args()
+    images = load_images(args.images_folder)
+
+    reference_config = StickerModelConfig(SamModelType.VIT_H, SamPrecision.FP32, args.models_folder)
+    configs = [reference_config] + [
+        StickerModelConfig(SamModelType(model_type), SamPrecision(precision), args.models_folder)
+        for model_type in args.model_types
+        for precision in args.precisions
+        if (SamModelType(model_type), SamPrecision(precision)) != (SamModelType.VIT_H, SamPrecision.FP32)
+        # Dynamic quantization only runs on CPU
+        and not (SamPrecision(precision) == SamPrecision.INT8 and torch.cuda.is_available())
+    ]
+
+    context = multiprocessing.get_context("spawn")
+    reference: Optional[BenchmarkResult] = None
+    print(f"{'model':>6} | {'precision':>9} | {'encoder, ms':>11} | {'decoder, ms':>11} | {'peak, MB':>9} | {'IoU':>5}")
+    for config in configs:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_configuration, (config, images, args.repeats))
+        reference = reference or result
+        iou = np.mean([get_iou(mask, ref) for mask, ref in zip(result.masks, reference.masks)])
+        print(
+            f"{config.model_type.value:>6} | {config.precision.value:>9} | {result.encoder_ms:>11.1f} | "
+            f"{result.decoder_ms:>11.1f} | {result.peak_memory_mb:>9.0f} | {iou:>5.3f}"
+        )
+
+    if args.album_size > 0:
+        if args.album_size > len(images):
+            raise ValueError(f"Album of {args.album_size} photos needs as many distinct images in the folder")
+        album = [cv2_to_pil(image) for image in images[: args.album_size]]
+        album_config = StickerModelConfig(SamModelType(args.album_model_type), models_folder=args.models_folder)
+        with context.Pool(1) as pool:
+            sequential_ms, album_ms = pool.apply(compare_album_latency, (album_config, album))
+        print(
+            f"\nAlbum of {args.album_size} photos, per sticker: sequential {1000 * sequential_ms:.1f} ms, "
+            f"album {1000 * album_ms:.1f} ms, speedup {sequential_ms / album_ms:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
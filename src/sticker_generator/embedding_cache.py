@@ -0,0 +1,127 @@
+import hashlib
+import io
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+from segment_anything import SamPredictor  # type: ignore
+
+from src.cache.disk_cache import DiskCache
+from src.cache.lru_cache import CacheStats, LRUCache
+
+
+def get_image_hash(image: np.ndarray) -> str:
+    """
+    Get the content hash of the decoded image, so recompressed copies of the same pixels share the hash
+    Args:
+        image: np.ndarray image
+    Returns:
+        str: hex digest of the image shape and pixels
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(image.shape).encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+@dataclass
+class ImageEmbedding:
+    """
+    State of the SamPredictor after `set_image`
+    """
+
+    features: torch.Tensor
+    original_size: Tuple[int, int]
+    input_size: Tuple[int, int]
+
+    def restore(self, predictor: SamPredictor) -> None:
+        """
+        Set the embedding to the predictor instead of running the image encoder
+        Args:
+            predictor: SAM predictor
+        """
+        predictor.reset_image()
+        predictor.features = self.features
+        predictor.original_size = self.original_size
+        predictor.input_size = self.input_size
+        predictor.is_image_set = True
+
+
+class EmbeddingCache:
+    """
+    SAM image embeddings keyed by the image hash. Recent embeddings are kept in memory on the model device.
+    With a folder they are also stored as .npy files, which are memory-mapped when read back
+    """
+
+    def __init__(
+        self,
+        device: str,
+        max_size: int = 16,
+        folder: Optional[Path] = None,
+        disk_size_bytes: int = 1024 * 1024 * 1024,
+    ) -> None:
+        """
+        Args:
+            device: device of the SAM model
+            max_size: number of embeddings kept in memory
+            folder: folder of the on-disk store, embeddings are only kept in memory if it is not set
+            disk_size_bytes: size of the on-disk store
+        """
+        self._device = device
+        self._memory = LRUCache[str, ImageEmbedding](max_size)
+        self._disk = DiskCache(folder, disk_size_bytes) if folder is not None else None
+
+    @property
+    def memory_stats(self) -> CacheStats:
+        return self._memory.stats
+
+    @property
+    def disk_stats(self) -> Optional[CacheStats]:
+        return self._disk.stats if self._disk is not None else None
+
+    def clear(self) -> None:
+        """
+        Drop the embeddings kept in memory, the on-disk store is kept
+        """
+        self._memory.clear()
+
+    def get(self, key: str) -> Optional[ImageEmbedding]:
+        embedding = self._memory.get(key)
+        if embedding is None:
+            embedding = self._load(key)
+            if embedding is not None:
+                self._memory.put(key, embedding)
+        return embedding
+
+    def put(self, key: str, embedding: ImageEmbedding) -> None:
+        self._memory.put(key, embedding)
+        if self._disk is None:
+            return
+
+        features = io.BytesIO()
+        np.save(features, embedding.features.detach().cpu().numpy())
+        sizes = {"original_size": embedding.original_size, "input_size": embedding.input_size}
+        # Sizes are written last, so an embedding is only read back when both parts are stored
+        self._disk.put(f"{key}/features", features.getvalue())
+        self._disk.put(f"{key}/sizes", json.dumps(sizes).encode())
+
+    def _load(self, key: str) -> Optional[ImageEmbedding]:
+        if self._disk is None:
+            return None
+        sizes = self._disk.get(f"{key}/sizes")
+        features_path = self._disk.get_path(f"{key}/features")
+        if sizes is None or features_path is None:
+            return None
+
+        parsed_sizes = json.loads(sizes)
+        # A copy-on-write mapping is writable, so the tensor shares it and pages are read on first access.
+        # The mapping stays valid if the file is evicted later
+        features = np.load(features_path, mmap_mode="c")
+        return ImageEmbedding(
+            torch.from_numpy(features).to(self._device),
+            tuple(parsed_sizes["original_size"]),
+            tuple(parsed_sizes["input_size"]),
+        )
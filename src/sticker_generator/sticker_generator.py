@@ -1,4 +1,11 @@
-from typing import Optional
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import ContextManager, Dict, List, Optional, Tuple, cast
 
 import cv2
 import numpy as np
@@ -6,57 +13,189 @@ import torch
 from PIL import Image
 from segment_anything import SamPredictor, sam_model_registry  # type: ignore
 
+from src.cache.lru_cache import LRUCache
+from src.sticker_generator.embedding_cache import EmbeddingCache, ImageEmbedding, get_image_hash
 from src.utils import pil_to_cv2
 
 
+class SamModelType(Enum):
+    VIT_B = "vit_b"
+    VIT_L = "vit_l"
+    VIT_H = "vit_h"
+
+
+SAM_CHECKPOINTS: Dict[SamModelType, str] = {
+    SamModelType.VIT_B: "sam_vit_b_01ec64.pth",
+    SamModelType.VIT_L: "sam_vit_l_0b3195.pth",
+    SamModelType.VIT_H: "sam_vit_h_4b8939.pth",
+}
+
+
+class SamPrecision(Enum):
+    """
+    Precision of the image encoder. The mask decoder always runs in float32
+    """
+
+    FP32 = "fp32"
+    BF16 = "bf16"
+    INT8 = "int8"
+
+
+@dataclass
+class StickerModelConfig:
+    model_type: SamModelType = SamModelType.VIT_H
+    precision: SamPrecision = SamPrecision.FP32
+    models_folder: Path = Path("models/")
+
+    @property
+    def model_path(self) -> Path:
+        return self.models_folder / SAM_CHECKPOINTS[self.model_type]
+
+
+def get_sticker_model_config_from_env() -> StickerModelConfig:
+    """
+    Get the sticker model configuration with overrides from `STICKER_MODEL_TYPE` and `STICKER_PRECISION`
+    environment variables
+    Returns:
+        StickerModelConfig: sticker model configuration
+    """
+    config = StickerModelConfig()
+    model_type = os.environ.get("STICKER_MODEL_TYPE")
+    if model_type:
+        config.model_type = SamModelType(model_type)
+    precision = os.environ.get("STICKER_PRECISION")
+    if precision:
+        config.precision = SamPrecision(precision)
+    return config
+
+
 class StickerGenerator:
     """
     Generates stickers by segmenting the main object in an image using model and postprocess afterwards.
     """
 
-    def __init__(self, model_path: str = "models/sam_vit_h_4b8939.pth", model_type: str = "vit_h") -> None:
+    def __init__(  # pylint: disable=too-many-positional-arguments, too-many-arguments
+        self,
+        model_path: Optional[str] = None,
+        model_type: str = "vit_h",
+        precision: SamPrecision = SamPrecision.FP32,
+        embedding_cache_size: int = 16,
+        embedding_cache_folder: Optional[Path] = None,
+        sticker_cache_size: int = 64,
+        encoder_batch_size: int = 2,
+    ) -> None:
         """
         Initialize the StickerGenerator with model.
 
         Args:
-            model_path: Path to the SAM model checkpoint. Defaults to "models/sam_vit_h_4b8939.pth".
-            model_type: Type of SAM model architecture. Defaults to "vit_h".
+            model_path: Path to the SAM model checkpoint. Defaults to the official checkpoint of the model type
+                in "models/".
+            model_type: Type of SAM model architecture, one of "vit_b", "vit_l" and "vit_h". Defaults to "vit_h".
+            precision: Precision of the image encoder. INT8 quantization is only supported on CPU.
+            embedding_cache_size: Number of image embeddings kept in memory.
+            embedding_cache_folder: Folder to store image embeddings in. Embeddings are only kept in memory if unset.
+            sticker_cache_size: Number of generated stickers kept in memory.
+            encoder_batch_size: Number of images encoded in a single forward pass. Encoder activations take
+                gigabytes per image, so large batches mostly pay off on GPU.
         """
         device = "cuda" if torch.cuda.is_available() else "cpu"
+        if model_path is None:
+            model_path = str(StickerModelConfig(SamModelType(model_type)).model_path)
 
         sam = sam_model_registry[model_type](checkpoint=model_path)
         sam.to(device=device)
+        sam.eval()
+
+        if precision == SamPrecision.INT8:
+            if device != "cpu":
+                raise ValueError("INT8 quantization of the image encoder is only supported on CPU")
+            sam.image_encoder = torch.ao.quantization.quantize_dynamic(
+                sam.image_encoder, {torch.nn.Linear}, dtype=torch.qint8
+            )
 
         self._model = SamPredictor(sam)
+        self._device = device
+        self._precision = precision
+        self._encoder_batch_size = encoder_batch_size
 
-    def generate_sticker(self, image: Image.Image) -> Optional[Image.Image]:
+        cache_folder = None
+        if embedding_cache_folder is not None:
+            cache_folder = embedding_cache_folder / f"{model_type}_{precision.value}"
+        self.embedding_cache = EmbeddingCache(device, embedding_cache_size, cache_folder)
+        self.sticker_cache = LRUCache[Tuple[str, Tuple[int, int]], Image.Image](sticker_cache_size)
+
+    def generate_sticker(self, image: Image.Image, point: Optional[Tuple[int, int]] = None) -> Optional[Image.Image]:
         """
-        Generate a sticker by segmenting the central object in the image.
+        Generate a sticker by segmenting the object under the prompt point in the image.
 
         Args:
             image: Input PIL image to process.
+            point: (x, y) prompt point in image pixels. Defaults to the image center.
 
         Returns:
             Processed PIL image with transparency, cropped and resized to 512x512.
             Returns `None` if segmentation fails.
         """
-        cv2_image = pil_to_cv2(image)
-        self._model.set_image(cv2_image)
+        return self.generate_stickers([image], [point])[0]
 
-        H, W = cv2_image.shape[:2]
-        point_coords = np.array([[W // 2, H // 2]], dtype=np.float32)
-        point_labels = np.array([1], dtype=np.int64)
+    def generate_stickers(
+        self, images: List[Image.Image], points: Optional[List[Optional[Tuple[int, int]]]] = None
+    ) -> List[Optional[Image.Image]]:
+        """
+        Generate stickers for several images. Images which are not cached are encoded in batches,
+        and the stickers are cut out in parallel.
 
-        masks, scores, _ = self._model.predict(
-            point_coords=point_coords, point_labels=point_labels, multimask_output=True
-        )
+        Args:
+            images: Input PIL images to process.
+            points: (x, y) prompt point of every image. Defaults to the image centers.
 
-        index = np.argmax(scores)
+        Returns:
+            Processed PIL images, `None` for the images where segmentation fails.
+        """
+        cv2_images = [pil_to_cv2(image) for image in images]
+        if points is None:
+            points = [None] * len(images)
+        prompt_points = [
+            point if point is not None else (image.shape[1] // 2, image.shape[0] // 2)
+            for image, point in zip(cv2_images, points)
+        ]
+        keys = list(zip((get_image_hash(image) for image in cv2_images), prompt_points))
+
+        stickers = [self.sticker_cache.get(key) for key in keys]
+        if any(sticker is not None for sticker in stickers):
+            logging.info("Sticker cache hit")
+        stickers = [sticker.copy() if sticker is not None else None for sticker in stickers]
+
+        missing = [i for i, sticker in enumerate(stickers) if sticker is None]
+        embeddings = self._get_embeddings([cv2_images[i] for i in missing], [keys[i][0] for i in missing])
+
+        masks = []
+        for i, embedding in zip(missing, embeddings):
+            embedding.restore(self._model)
+            masks.append(self._predict_mask(prompt_points[i]))
+
+        with ThreadPoolExecutor(max_workers=max(min(len(missing), os.cpu_count() or 1), 1)) as pool:
+            cut_out = list(pool.map(self._cut_out_sticker, [cv2_images[i] for i in missing], masks))
+
+        for i, sticker in zip(missing, cut_out):
+            if sticker is not None:
+                self.sticker_cache.put(keys[i], sticker.copy())
+            stickers[i] = sticker
+        return stickers
+
+    def _cut_out_sticker(self, cv2_image: np.ndarray, mask: Optional[np.ndarray]) -> Optional[Image.Image]:
+        """
+        Cut the masked object out of the image as a sticker.
 
-        if len(masks) == 0:
-            return None
+        Args:
+            cv2_image: Input image (numpy array).
+            mask: Predicted mask of the object.
 
-        mask = masks[index].astype(np.uint8)
+        Returns:
+            Processed PIL image or `None` if the mask is empty.
+        """
+        if mask is None:
+            return None
         mask = self._postprocess_mask(mask)
 
         cv2_image = cv2.cvtColor(cv2_image, cv2.COLOR_BGR2RGBA)
@@ -73,7 +212,97 @@ class StickerGenerator:
 
         return final
 
-    def _postprocess_mask(self, mask: np.ndarray) -> np.ndarray:
+    def _predict_mask(self, point: Tuple[int, int]) -> Optional[np.ndarray]:
+        """
+        Run the mask decoder for the image set to the predictor.
+
+        Args:
+            point: (x, y) prompt point in image pixels.
+
+        Returns:
+            The mask with the best score or `None` if no mask is predicted.
+        """
+        point_coords = np.array([point], dtype=np.float32)
+        point_labels = np.array([1], dtype=np.int64)
+
+        masks, scores, _ = self._model.predict(
+            point_coords=point_coords, point_labels=point_labels, multimask_output=True
+        )
+
+        if len(masks) == 0:
+            return None
+
+        index = np.argmax(scores)
+        return cast(np.ndarray, masks[index].astype(np.uint8))
+
+    def _get_embeddings(self, images: List[np.ndarray], image_hashes: List[str]) -> List[ImageEmbedding]:
+        """
+        Get the image embeddings from the cache, encoding the images which were not encoded yet.
+
+        Args:
+            images: Input images (numpy arrays).
+            image_hashes: Content hashes of the images.
+
+        Returns:
+            Embedding of every image.
+        """
+        embeddings = [self.embedding_cache.get(image_hash) for image_hash in image_hashes]
+        if any(embedding is not None for embedding in embeddings):
+            logging.info("Image embedding cache hit")
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        for start in range(0, len(missing), self._encoder_batch_size):
+            batch = missing[start : start + self._encoder_batch_size]
+            for i, embedding in zip(batch, self._encode_images([images[i] for i in batch])):
+                self.embedding_cache.put(image_hashes[i], embedding)
+                embeddings[i] = embedding
+        return [embedding for embedding in embeddings if embedding is not None]
+
+    def _encode_images(self, images: List[np.ndarray]) -> List[ImageEmbedding]:
+        """
+        Run the image encoder on a batch of images in the configured precision.
+        Every image is resized and padded to the encoder input as in `SamPredictor.set_image`.
+
+        Args:
+            images: Input images (numpy arrays).
+
+        Returns:
+            Embedding of every image.
+        """
+        sam = self._model.model
+        transformed_images = [self._model.transform.apply_image(image) for image in images]
+        input_images = torch.cat(
+            [
+                sam.preprocess(torch.as_tensor(image, device=self._device).permute(2, 0, 1)[None, :, :, :])
+                for image in transformed_images
+            ]
+        )
+
+        autocast: ContextManager = nullcontext()
+        if self._precision == SamPrecision.BF16:
+            autocast = torch.autocast(device_type=self._device, dtype=torch.bfloat16)
+
+        with torch.no_grad(), autocast:
+            features = sam.image_encoder(input_images)
+        # The mask decoder runs in float32
+        features = features.float()
+
+        return [
+            ImageEmbedding(features[i : i + 1], image.shape[:2], transformed_image.shape[:2])
+            for i, (image, transformed_image) in enumerate(zip(images, transformed_images))
+        ]
+
+    def _encode_image(self, image: np.ndarray) -> None:
+        """
+        Run the image encoder and set the embedding to the predictor.
+
+        Args:
+            image: Input image (numpy array).
+        """
+        self._encode_images([image])[0].restore(self._model)
+
+    @staticmethod
+    def _postprocess_mask(mask: np.ndarray) -> np.ndarray:
         """
         Refine the raw segmentation mask using thresholding and morphological operations.
 
@@ -88,7 +317,8 @@ class StickerGenerator:
         mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
         return mask
 
-    def _apply_mask(self, image: np.ndarray, mask: np.ndarray) -> Image.Image:
+    @staticmethod
+    def _apply_mask(image: np.ndarray, mask: np.ndarray) -> Image.Image:
         """
         Apply the mask to the image to create transparency.
 
@@ -104,7 +334,8 @@ class StickerGenerator:
         image_pil.putalpha(mask_pil)
         return image_pil
 
-    def _resize_to_sticker(self, image: Image.Image) -> Image.Image:
+    @staticmethod
+    def _resize_to_sticker(image: Image.Image) -> Image.Image:
         """
         Resize the image to 512x512 while preserving aspect ratio and centering.
 
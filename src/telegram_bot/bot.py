@@ -1,44 +1,62 @@
+import asyncio
+from contextlib import ExitStack
+from dataclasses import replace
 from logging import Logger
 from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
 
 from PIL import Image
-from telegram import InlineKeyboardMarkup, Update, Voice
+from telegram import InlineKeyboardMarkup, InputMediaDocument, Message, Update, Voice
+from telegram.constants import MessageLimit
 from telegram.ext import ContextTypes, ConversationHandler
 
-from src.audio2text.speech_recognition import SpeechRecognition
-from src.image_generation.generation import StableDiffusionPipeline
+from src.image_generation.generation import GenerationParameters
+from src.image_generation.generation_cache import get_prompt_seed
+from src.image_generation.job import GenerationCancelledError, GenerationJob
 from src.image_processing.command_parser.command_parser import ParserParameters
-from src.image_processing.command_parser.command_parser_creator import CommandParserTypes, get_command_parser
-from src.image_processing.command_parser.language_package import LanguageType
-from src.image_processing.image_processor import ImageProcessor
-from src.sticker_generator.sticker_generator import StickerGenerator
+from src.inference.async_models import (
+    AsyncCommandParser,
+    AsyncImageProcessor,
+    AsyncSpeechRecognition,
+    AsyncStableDiffusionPipeline,
+    AsyncStickerGenerator,
+)
 
+from .media import DEFAULT_SPILL_THRESHOLD, decode_image, download_to_buffer, encode_image
+from .media_group import MediaGroupCollector
 from .utils import (
     BOT_STATES,
     KEYBOARD,
+    LONG_FORM_MIN_DURATION_S,
+    PROGRESS_UPDATE_INTERVAL_S,
     PROMPT_IF_CONTINUE_EDIT,
     PROMPT_IF_CONTINUE_GENERATE,
     PROMPT_IF_CONTINUE_STICKER,
     PROMPT_IF_CONTINUE_TRANSCRIBE,
+    get_cancel_generation_keyboard,
+    get_progress_text,
 )
 
 
 class TelegramBot:
     def __init__(  # pylint: disable=too-many-positional-arguments, too-many-arguments
         self,
-        audio_processor: SpeechRecognition,
-        image_processor: ImageProcessor,
-        sticker_processor: StickerGenerator,
+        audio_processor: AsyncSpeechRecognition,
+        image_processor: AsyncImageProcessor,
+        sticker_processor: AsyncStickerGenerator,
+        image_generator: AsyncStableDiffusionPipeline,
+        command_parser: AsyncCommandParser,
         logger: Logger,
         data_folder: Path = Path("data/"),
         num_few_shot_samples: int = -1,
         analyze_image: bool = False,
+        spill_threshold: int = DEFAULT_SPILL_THRESHOLD,
     ) -> None:
         self.audio_processor = audio_processor
         self.image_processor = image_processor
         self.sticker_processor = sticker_processor
-        self.image_generator = StableDiffusionPipeline()
-        self.command_parser = get_command_parser(CommandParserTypes.PATTERN)(LanguageType.EN)
+        self.image_generator = image_generator
+        self.command_parser = command_parser
         self.parsing_parameters = ParserParameters(
             num_few_shot_samples=num_few_shot_samples,
             analyze_image=analyze_image,
@@ -46,6 +64,10 @@ class TelegramBot:
         )
         self.logger = logger
         self.data_folder = data_folder
+        self.spill_threshold = spill_threshold
+        self.media_groups = MediaGroupCollector()
+        self.generation_jobs: Dict[str, GenerationJob] = {}
+        self.user_generation_jobs: Dict[int, GenerationJob] = {}
 
     async def start(self, update: Update, _: ContextTypes.DEFAULT_TYPE) -> BOT_STATES:
         """
@@ -73,7 +95,7 @@ class TelegramBot:
             await query.answer()
             await query.message.reply_text(  # type: ignore[union-attr]
                 "Please send a photo to prepare sticker. "
-                "Use photo with an object placed in the center. Send photo 1 by 1"
+                "Use photo with an object placed in the center. You can send several photos as an album"
             )
         else:
             self.logger.error("Exception in photo_to_sticker_prompt")
@@ -85,7 +107,9 @@ class TelegramBot:
         if update.callback_query:
             query = update.callback_query
             await query.answer()
-            await query.message.reply_text("Please send a photo to edit.")  # type: ignore[union-attr]
+            await query.message.reply_text(  # type: ignore[union-attr]
+                "Please send a photo to edit. You can send several photos as an album with a single caption"
+            )
         else:
             self.logger.error("Exception in edit_photo_prompt")
         return BOT_STATES.PHOTO_EDIT
@@ -112,9 +136,10 @@ class TelegramBot:
             self.logger.error("Exception in generate_image_prompt")
         return BOT_STATES.GENERATE
 
-    async def photo_to_sticker(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> BOT_STATES:
+    async def photo_to_sticker(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[BOT_STATES]:
         """
-        Handler to gathed needed data and call sticker pack creation model
+        Handler to gathed needed data and call sticker pack creation model.
+        Photos sent as an album are processed together by the handler of the first photo
         """
         self.logger.info("EVENT: photo_to_sticker")
         if not update.effective_message:
@@ -125,44 +150,60 @@ class TelegramBot:
             await update.effective_message.reply_text("Please provide photo first.")
             return await self.restart(update, context)
 
-        await update.effective_message.reply_text("Image is being processed. Please wait...")
-
-        photo = await update.effective_message.photo[-1].get_file()
-
-        input_image_path = None
-        output_image_path = None
-
-        if update.effective_user:
-            input_image_path = Path(f"{self.data_folder}/{update.effective_user.id}_sticker.png")
-            output_image_path = Path(f"{self.data_folder}/{update.effective_user.id}_sticker_generated.png")
+        messages = await self.media_groups.collect(update.effective_message)
+        if messages is None:
+            self.logger.info("Photo is added to the album")
+            return None
 
-        if not input_image_path or not output_image_path:
-            self.logger.error("Input and/or output image path is not set!")
-            await update.effective_message.reply_text("Internal error occured. Please try again.")
-            return await self.photo_to_sticker_continue(update, context)
-
-        await photo.download_to_drive(input_image_path)
+        await update.effective_message.reply_text("Image is being processed. Please wait...")
 
-        if not input_image_path.exists():
+        input_images = await asyncio.gather(*(self._download_photo(message) for message in messages))
+        decoded_images = [image for image in input_images if image]
+        if len(decoded_images) != len(input_images):
             await update.effective_message.reply_text("There is a problem with provided photo. Please, resend it.")
             self.logger.error("Error occured during sticker generation : No data is provided.")
             return await self.photo_to_sticker_continue(update, context)
 
-        input_image = Image.open(input_image_path).convert("RGB")
-        result_image = self.sticker_processor.generate_sticker(input_image)
+        if len(decoded_images) == 1:
+            result_images = [await self.sticker_processor.generate_sticker(decoded_images[0])]
+        else:
+            result_images = await self.sticker_processor.generate_stickers(decoded_images)
+        stickers = [image for image in result_images if image]
 
-        if not result_image:
+        if not stickers:
             await update.effective_message.reply_text("An error occured during sticker generation")
             self.logger.error("Error occured during sticker generation : No sticker is generated.")
             return await self.restart(update, context)
 
-        result_image.save(output_image_path)
-        with open(output_image_path, "rb") as photo_file:
-            await update.effective_message.reply_document(photo_file, filename="prepared_sticker.png")
-            self.logger.info("Sticker generated successfully")
+        if len(stickers) != len(result_images):
+            await update.effective_message.reply_text(
+                f"Stickers were not generated for {len(result_images) - len(stickers)} of the photos"
+            )
+        await self._reply_images(update.effective_message, stickers, "prepared_sticker")
+        self.logger.info("%d stickers generated successfully", len(stickers))
 
         return await self.photo_to_sticker_continue(update, context)
 
+    async def _download_photo(self, message: Message) -> Optional[Image.Image]:
+        photo = await message.photo[-1].get_file()
+        with await download_to_buffer(photo, self.data_folder, self.spill_threshold) as input_buffer:
+            return decode_image(input_buffer)
+
+    async def _reply_images(self, message: Message, images: List[Image.Image], file_name: str) -> None:
+        """
+        Send a single image as a document and several images as a media group
+        """
+        with ExitStack() as stack:
+            buffers = [
+                stack.enter_context(encode_image(image, self.data_folder, self.spill_threshold)) for image in images
+            ]
+            if len(buffers) == 1:
+                await message.reply_document(buffers[0], filename=f"{file_name}.png")
+                return
+            await message.reply_media_group(
+                [InputMediaDocument(buffer, filename=f"{file_name}_{i + 1}.png") for i, buffer in enumerate(buffers)]
+            )
+
     async def audio_to_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> BOT_STATES:
         """
         Handler to gathed needed data and call audio to text conversion model
@@ -172,36 +213,57 @@ class TelegramBot:
             self.logger.warning("Update.effective_message is empty")
             return await self.restart(update, context)
 
-        if not update.effective_user:
-            self.logger.warning("Update.effective_user is empty")
-            return await self.restart(update, context)
-
-        input_audio_path = Path(f"{self.data_folder}/{update.effective_user.id}_audio_in.ogg")
-
         if update.effective_message and not update.effective_message.voice:
             await update.effective_message.reply_text("No audio is provided. Please provide one")
             return await self.audio_to_text_continue(update, context)
 
-        await update.effective_message.reply_text("Transcription in progress...")
+        progress_message = await update.effective_message.reply_text("Transcription in progress...")
         if update.effective_message and isinstance(update.effective_message.voice, Voice):
-            audio_file = await update.effective_message.voice.get_file()
+            voice = update.effective_message.voice
+            audio_file = await voice.get_file()
         else:
             self.logger.error("No voice is provided.")
             return await self.audio_to_text_continue(update, context)
 
-        await audio_file.download_to_drive(input_audio_path)
-        generated_transcription = self.audio_processor.gen_transcription(input_audio_path)
+        with await download_to_buffer(audio_file, self.data_folder, self.spill_threshold) as input_buffer:
+            if voice.duration > LONG_FORM_MIN_DURATION_S:
+                await self._stream_transcription(progress_message, input_buffer, voice.file_unique_id)
+            else:
+                generated_transcription = await self.audio_processor.gen_transcription(
+                    input_buffer, voice.file_unique_id
+                )
+                await update.effective_message.reply_text(
+                    f"Here is the transcribed message:\n\n{generated_transcription}"
+                )
 
         self.logger.info("Audio transcribed successfully")
-        await update.effective_message.reply_text(f"Here is the transcribed message:\n\n{generated_transcription}")
-
         return await self.audio_to_text_continue(update, context)
 
+    async def _stream_transcription(
+        self, progress_message: Message, input_buffer: BinaryIO, file_unique_id: str
+    ) -> None:
+        """
+        Transcribe long audio chunk by chunk, editing the progress message as every chunk is transcribed.
+        Text which does not fit into a single message is sent in follow-up messages
+        """
+        full_text, shown_text = "", ""
+        async for transcription in self.audio_processor.gen_transcription_long_form(input_buffer, file_unique_id):
+            full_text = f"Here is the transcribed message:\n\n{transcription}"
+            # Telegram rejects edits which do not change the message
+            if full_text[: MessageLimit.MAX_TEXT_LENGTH].strip() != shown_text:
+                shown_text = full_text[: MessageLimit.MAX_TEXT_LENGTH].strip()
+                await progress_message.edit_text(shown_text)
+            self.logger.info("Transcribed %d characters", len(transcription))
+
+        for start in range(MessageLimit.MAX_TEXT_LENGTH, len(full_text), MessageLimit.MAX_TEXT_LENGTH):
+            await progress_message.reply_text(full_text[start : start + MessageLimit.MAX_TEXT_LENGTH])
+
     async def edit_photo(  # pylint: disable=too-many-return-statements
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
-    ) -> BOT_STATES:
+    ) -> Optional[BOT_STATES]:
         """
-        Handler to gathed needed data and call picture edit model
+        Handler to gathed needed data and call picture edit model.
+        Photos sent as an album are edited by the caption of the album in the handler of the first photo
         """
         self.logger.info("EVENT: edit_photo")
         if not update.effective_message:
@@ -212,11 +274,13 @@ class TelegramBot:
             await update.effective_message.reply_text("Please provide photo first.")
             return await self.restart(update, context)
 
-        photo = await update.effective_message.photo[-1].get_file()
-        description = None
+        messages = await self.media_groups.collect(update.effective_message)
+        if messages is None:
+            self.logger.info("Photo is added to the album")
+            return None
 
-        if update.effective_message.caption:
-            description = update.effective_message.caption
+        # Telegram keeps the caption of an album on one of its photos
+        description = next((message.caption for message in messages if message.caption), None)
 
         if not description:
             await update.effective_message.reply_text(
@@ -224,46 +288,40 @@ class TelegramBot:
             )
             return await self.edit_photo_continue(update, context)
 
-        input_image_path = None
-        output_image_path = None
+        input_images = await asyncio.gather(*(self._download_photo(message) for message in messages))
+        decoded_images = [image for image in input_images if image]
 
-        if update.effective_user:
-            input_image_path = Path(f"{self.data_folder}/{update.effective_user.id}_edit.png")
-            output_image_path = Path(f"{self.data_folder}/{update.effective_user.id}_edited_photo.png")
-
-        if not input_image_path or not output_image_path:
-            self.logger.error("Input and/or output image path is not set!")
-            await update.effective_message.reply_text("Internal error occured. Please try again.")
-            return await self.edit_photo_continue(update, context)
-
-        await photo.download_to_drive(input_image_path)
-
-        if not input_image_path.exists():
+        if len(decoded_images) != len(input_images):
             await update.effective_message.reply_text("There is a problem with provided photo. Please, resend it.")
             self.logger.error("Error occured during image changing : No data is provided.")
-            return await self.photo_to_sticker_continue(update, context)
-
-        input_image = Image.open(input_image_path).convert("RGB")
+            return await self.edit_photo_continue(update, context)
 
-        if self.parsing_parameters.analyze_image:
-            self.parsing_parameters.image_to_analyze = input_image
+        parsing_parameters = self.parsing_parameters
+        if parsing_parameters.analyze_image:
+            parsing_parameters = replace(parsing_parameters, image_to_analyze=decoded_images[0])
 
-        commands = self.command_parser.parse_text(description, self.parsing_parameters)
+        # The caption is parsed once for the whole album
+        commands = await self.command_parser.parse_text(description, parsing_parameters)
 
         self.logger.info("%s -> %s", description, commands)
         await update.effective_message.reply_text(f"Processing image with command: '{description}'")
 
-        edited_photo = self.image_processor.get_processed_image(image=input_image, command_queue=commands)
+        if len(decoded_images) == 1:
+            edited_photos = [
+                await self.image_processor.get_processed_image(image=decoded_images[0], command_queue=commands)
+            ]
+        else:
+            edited_photos = await self.image_processor.get_processed_images(
+                images=decoded_images, command_queue=commands
+            )
 
-        if not edited_photo:
+        if not all(edited_photos):
             await update.effective_message.reply_text("An error occured during photo editing")
             self.logger.error("Error occured during photo editing : Photo not edited.")
             return await self.edit_photo_continue(update, context)
 
-        edited_photo.save(output_image_path)
-        with open(output_image_path, "rb") as photo_file:
-            await update.effective_message.reply_document(photo_file, filename="edited_photo.png")
-            self.logger.info("photo edited successfully")
+        await self._reply_images(update.effective_message, edited_photos, "edited_photo")
+        self.logger.info("%d photos edited successfully", len(edited_photos))
 
         return await self.edit_photo_continue(update, context)
 
@@ -276,36 +334,98 @@ class TelegramBot:
             self.logger.warning("Update.effective_message is empty")
             return await self.restart(update, context)
 
-        if not update.effective_user:
-            self.logger.warning("Update.effective_user is empty")
-            return await self.restart(update, context)
-
-        output_image_path = Path(f"{self.data_folder}/{update.effective_user.id}_generated_image.png")
-
         if update.effective_message and not update.effective_message.text:
             await update.effective_message.reply_text("No prompt is provided. Please provide one")
             return await self.generate_image_continue(update, context)
 
-        await update.effective_message.reply_text("Generation in progress... It may take a while. You'll get notified")
         prompt = update.effective_message.text
 
         if not prompt:
             self.logger.error("No prompt provided")
             return await self.generate_image_continue(update, context)
 
-        generated_image = self.image_generator.generate_image(prompt)
+        user_id = update.effective_user.id if update.effective_user else update.effective_message.chat_id
+        job = self._start_generation_job(user_id, prompt)
+        status_message = await update.effective_message.reply_text(
+            "Generation in progress... It may take a while. You'll get notified",
+            reply_markup=InlineKeyboardMarkup(get_cancel_generation_keyboard(job.job_id)),
+        )
+
+        try:
+            generated_image = await self._run_generation_job(job, status_message)
+        except GenerationCancelledError:
+            self.logger.info("Image generation is cancelled")
+            await status_message.edit_text("Generation is cancelled")
+            return await self.generate_image_continue(update, context)
+        finally:
+            self.generation_jobs.pop(job.job_id, None)
+            if self.user_generation_jobs.get(user_id) is job:
+                del self.user_generation_jobs[user_id]
+
+        await status_message.edit_text("Generation is finished")
         if not generated_image:
             self.logger.error("No image generated.")
             await update.effective_message.reply_text("An error occured during image generation. Try again")
+            return await self.generate_image_continue(update, context)
 
-        generated_image.save(output_image_path)
-
-        with open(output_image_path, "rb") as photo_file:
-            await update.effective_message.reply_document(photo_file, filename="generated.png")
+        with encode_image(generated_image, self.data_folder, self.spill_threshold) as output_buffer:
+            await update.effective_message.reply_document(output_buffer, filename="generated.png")
             self.logger.info("image is generated successfully")
 
         return await self.generate_image_continue(update, context)
 
+    def _start_generation_job(self, user_id: int, prompt: str) -> GenerationJob:
+        """
+        Create a generation job for the user, cancelling the previous job of the user
+        """
+        previous_job = self.user_generation_jobs.get(user_id)
+        if previous_job is not None:
+            self.logger.info("Cancelling the previous generation job %s", previous_job.job_id)
+            previous_job.cancel()
+
+        job = GenerationJob(prompt)
+        self.generation_jobs[job.job_id] = job
+        self.user_generation_jobs[user_id] = job
+        return job
+
+    async def _run_generation_job(self, job: GenerationJob, status_message: Message) -> Image.Image:
+        """
+        Run the generation job, editing the status message with its progress
+        """
+        # The seed is derived from the prompt, so repeated prompts give the same image and are served from the cache
+        parameters = GenerationParameters(seed=get_prompt_seed(job.prompt))
+        generation = asyncio.ensure_future(self.image_generator.generate_image(job.prompt, parameters, job))
+        keyboard = InlineKeyboardMarkup(get_cancel_generation_keyboard(job.job_id))
+        shown_step = 0
+        try:
+            while not generation.done():
+                await asyncio.wait({generation}, timeout=PROGRESS_UPDATE_INTERVAL_S)
+                if job.step != shown_step and not generation.done() and not job.is_cancelled:
+                    shown_step = job.step
+                    await status_message.edit_text(get_progress_text(job.step, job.total_steps), reply_markup=keyboard)
+            return generation.result()
+        finally:
+            # The job is cancelled if the handler is cancelled, so the worker does not keep generating
+            if not generation.done():
+                generation.cancel()
+
+    async def cancel_generation(self, update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handles the Cancel button of the image generation status message."""
+        self.logger.info("EVENT: cancel_generation")
+        query = update.callback_query
+        if not query or not query.data:
+            self.logger.error("Exception in cancel_generation")
+            return
+
+        job = self.generation_jobs.get(query.data.split(":", 1)[1])
+        if job is None or job.is_finished:
+            await query.answer("Generation is already finished")
+            return
+
+        job.cancel()
+        await query.answer("Cancelling the generation")
+        await query.edit_message_text("Cancelling the generation...")
+
     async def photo_to_sticker_continue(self, update: Update, _: ContextTypes.DEFAULT_TYPE) -> BOT_STATES:
         """
         Handler to process more photos to sticker or return to menu
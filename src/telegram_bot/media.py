@@ -0,0 +1,75 @@
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Optional, cast
+
+from PIL import Image, UnidentifiedImageError
+from telegram import File
+
+DEFAULT_SPILL_THRESHOLD = 16 * 1024 * 1024
+
+
+def create_media_buffer(spill_folder: Path, spill_threshold: int = DEFAULT_SPILL_THRESHOLD) -> BinaryIO:
+    """
+    Create a buffer which keeps data in memory and spills it to disk only above the threshold
+    Args:
+        spill_folder: folder for the spilled data
+        spill_threshold: maximal size in bytes kept in memory
+    Returns:
+        BinaryIO: empty buffer
+    """
+    return cast(BinaryIO, tempfile.SpooledTemporaryFile(max_size=spill_threshold, mode="w+b", dir=str(spill_folder)))
+
+
+async def download_to_buffer(
+    file: File, spill_folder: Path, spill_threshold: int = DEFAULT_SPILL_THRESHOLD
+) -> BinaryIO:
+    """
+    Download a Telegram file into a buffer
+    Args:
+        file: Telegram file to download
+        spill_folder: folder for the spilled data
+        spill_threshold: maximal size in bytes kept in memory
+    Returns:
+        BinaryIO: buffer with the file content, rewound to the beginning
+    """
+    buffer = create_media_buffer(spill_folder, spill_threshold)
+    await file.download_to_memory(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def decode_image(buffer: BinaryIO) -> Optional[Image.Image]:
+    """
+    Decode an RGB image from the buffer
+    Args:
+        buffer: buffer with encoded image
+    Returns:
+        Optional[Image.Image]: decoded image or None if the data is not an image
+    """
+    try:
+        with Image.open(buffer) as image:
+            return image.convert("RGB")
+    except UnidentifiedImageError:
+        return None
+
+
+def encode_image(
+    image: Image.Image,
+    spill_folder: Path,
+    spill_threshold: int = DEFAULT_SPILL_THRESHOLD,
+    image_format: str = "PNG",
+) -> BinaryIO:
+    """
+    Encode the image into a buffer
+    Args:
+        image: PIL image
+        spill_folder: folder for the spilled data
+        spill_threshold: maximal size in bytes kept in memory
+        image_format: output image format
+    Returns:
+        BinaryIO: buffer with the encoded image, rewound to the beginning
+    """
+    buffer = create_media_buffer(spill_folder, spill_threshold)
+    image.save(buffer, format=image_format)
+    buffer.seek(0)
+    return buffer
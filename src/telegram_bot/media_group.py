@@ -0,0 +1,44 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Message
+
+
+class MediaGroupCollector:
+    """
+    Collects the messages of a media group (album). Telegram delivers every album item as a separate update,
+    so the handler of the first item waits for the rest and processes the whole album
+    """
+
+    def __init__(self, wait_s: float = 1.0) -> None:
+        """
+        Args:
+            wait_s: time to wait for the next item of the album
+        """
+        self._wait_s = wait_s
+        self._groups: Dict[Tuple[int, str], List[Message]] = {}
+
+    async def collect(self, message: Message) -> Optional[List[Message]]:
+        """
+        Collect the album of the message
+        Args:
+            message: received message
+        Returns:
+            Optional[List[Message]]: all messages of the album in the sent order for the first item of the album
+                or a message without an album, None for the other items of the album
+        """
+        if message.media_group_id is None:
+            return [message]
+
+        key = (message.chat_id, message.media_group_id)
+        if key in self._groups:
+            self._groups[key].append(message)
+            return None
+
+        self._groups[key] = [message]
+        num_messages = 0
+        while num_messages != len(self._groups[key]):
+            num_messages = len(self._groups[key])
+            await asyncio.sleep(self._wait_s)
+
+        return sorted(self._groups.pop(key), key=lambda group_message: group_message.message_id)
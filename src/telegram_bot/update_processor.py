@@ -0,0 +1,72 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+@dataclass
+class _ChatState:
+    condition: asyncio.Condition = field(default_factory=asyncio.Condition)
+    is_busy: bool = False
+    # Album collected by the running handler of the chat
+    media_group_id: Optional[str] = None
+    num_updates: int = 0
+
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes the updates of different chats concurrently and the updates of a chat one by one in the order
+    they arrive, so two handlers never change the ConversationHandler state of a chat at once.
+    Two kinds of updates join the running handler of their chat instead of waiting for it: the items of the album
+    which the handler collects, and the updates matched by `is_concurrent`, e.g. a Cancel button of a running job
+    """
+
+    def __init__(self, max_concurrent_updates: int, is_concurrent: Callable[[object], bool]) -> None:
+        """
+        Args:
+            max_concurrent_updates: number of updates processed at once
+            is_concurrent: check if the update is processed without waiting for the other updates of the chat
+        """
+        super().__init__(max_concurrent_updates)
+        self._is_concurrent = is_concurrent
+        self._chats: Dict[int, _ChatState] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if not isinstance(update, Update) or update.effective_chat is None or self._is_concurrent(update):
+            await coroutine
+            return
+
+        chat_id = update.effective_chat.id
+        media_group_id = update.effective_message.media_group_id if update.effective_message else None
+        chat = self._chats.setdefault(chat_id, _ChatState())
+        chat.num_updates += 1
+        try:
+            async with chat.condition:
+                await chat.condition.wait_for(
+                    lambda: not chat.is_busy or (media_group_id is not None and media_group_id == chat.media_group_id)
+                )
+                is_joined = chat.is_busy
+                if not is_joined:
+                    chat.is_busy = True
+                    chat.media_group_id = media_group_id
+
+            try:
+                await coroutine
+            finally:
+                if not is_joined:
+                    async with chat.condition:
+                        chat.is_busy = False
+                        chat.media_group_id = None
+                        chat.condition.notify_all()
+        finally:
+            chat.num_updates -= 1
+            if chat.num_updates == 0:
+                del self._chats[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
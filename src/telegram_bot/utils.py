@@ -1,6 +1,16 @@
 from enum import IntEnum
+from typing import List
 
-from telegram import InlineKeyboardButton
+from telegram import InlineKeyboardButton, Update
+
+# Voice messages longer than one Whisper window are transcribed chunk by chunk
+LONG_FORM_MIN_DURATION_S = 30
+
+# Interval between edits of the image generation status message
+PROGRESS_UPDATE_INTERVAL_S = 2.0
+
+# Callback data prefix of the Cancel button of an image generation, followed by the job identifier
+CANCEL_GENERATION_PREFIX = "cancel_generation:"
 
 
 class BOT_STATES(IntEnum):
@@ -38,3 +48,21 @@ PROMPT_IF_CONTINUE_GENERATE = [
     [InlineKeyboardButton("Generate more images", callback_data="continue_generate")],
     [InlineKeyboardButton("Return to menu", callback_data="return")],
 ]
+
+
+def get_cancel_generation_keyboard(job_id: str) -> List[List[InlineKeyboardButton]]:
+    return [[InlineKeyboardButton("Cancel", callback_data=f"{CANCEL_GENERATION_PREFIX}{job_id}")]]
+
+
+def is_cancel_generation(update: object) -> bool:
+    """
+    Check if the update is a press of the Cancel button of an image generation
+    """
+    if not isinstance(update, Update) or update.callback_query is None:
+        return False
+    return str(update.callback_query.data).startswith(CANCEL_GENERATION_PREFIX)
+
+
+def get_progress_text(step: int, total_steps: int, width: int = 20) -> str:
+    filled = width * step // total_steps if total_steps else 0
+    return f"Generation in progress... [{'#' * filled}{'-' * (width - filled)}] {step}/{total_steps}"
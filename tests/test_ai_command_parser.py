@@ -0,0 +1,71 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+import torch
+
+from src.image_processing.command_parser import ai_command_parser
+from src.image_processing.command_parser.ai_command_parser import AICommandParser, Messages
+
+
+class FakeModel:
+    """
+    Causal LM which counts the prefills and returns the prompt as the generated sequence
+    """
+
+    device = torch.device("cpu")
+
+    def __init__(self) -> None:
+        self.num_prefills = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, input_ids: torch.Tensor, **kwargs: Any) -> None:  # pylint: disable=unused-argument
+        with self._lock:
+            self.num_prefills += 1
+        time.sleep(0.05)
+
+    def generate(self, input_ids: torch.Tensor, **kwargs: Any) -> torch.Tensor:  # pylint: disable=unused-argument
+        return input_ids
+
+
+class FakeAICommandParser(AICommandParser):
+    """
+    AICommandParser which tokenizes every message as a single token
+    """
+
+    def _tokenize(self, messages: Messages, add_generation_prompt: bool) -> torch.Tensor:
+        tokens: List[int] = [hash(message["content"]) % 1000 for message in messages]
+        if add_generation_prompt:
+            tokens.append(0)
+        return torch.tensor([tokens])
+
+
+@pytest.fixture(name="parser")
+def fixture_parser(monkeypatch: pytest.MonkeyPatch) -> FakeAICommandParser:
+    fake_pipeline = SimpleNamespace(
+        model=FakeModel(), tokenizer=SimpleNamespace(eos_token_id=0, decode=lambda ids, **kwargs: "")
+    )
+    monkeypatch.setattr(ai_command_parser, "pipeline", lambda *args, **kwargs: fake_pipeline)
+    return FakeAICommandParser()
+
+
+def test_prefix_cache_is_filled_once_by_concurrent_calls(parser: FakeAICommandParser) -> None:
+    # pylint: disable=protected-access
+    messages = parser._get_system_messages(2) + [{"role": "user", "content": "blur"}]
+
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _: parser._generate(messages, 2), range(4)))
+
+    assert parser._pipeline.model.num_prefills == 1
+    assert (parser.prefix_cache_stats.hits, parser.prefix_cache_stats.misses) == (4, 0)
+
+
+def test_prefix_mismatch_is_counted(parser: FakeAICommandParser) -> None:
+    messages = [{"role": "system", "content": "another prompt"}, {"role": "user", "content": "blur"}]
+
+    parser._generate(messages, 2)  # pylint: disable=protected-access
+
+    assert (parser.prefix_cache_stats.hits, parser.prefix_cache_stats.misses) == (0, 1)
@@ -0,0 +1,48 @@
+import asyncio
+import io
+from pathlib import Path
+from typing import List, cast
+
+from src.audio2text.speech_recognition import AudioSource, SpeechRecognition
+from src.audio2text.transcription_cache import TranscriptionCache
+from src.inference.async_models import AsyncSpeechRecognition
+from src.inference.executor import InferenceExecutor, ModelName
+from src.inference.model_registry import ModelRegistry
+
+
+class FakeSpeechRecognition:
+    """
+    Non-Whisper model which transcribes every audio to the same text
+    """
+
+    whisper = False
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def gen_transcription(self, path_to_file: AudioSource) -> str:  # pylint: disable=unused-argument
+        self.calls += 1
+        return "transcription"
+
+
+async def transcribe_long_form(speech_recognition: AsyncSpeechRecognition) -> List[str]:
+    return [text async for text in speech_recognition.gen_transcription_long_form(io.BytesIO(b"audio"), "file-id")]
+
+
+def test_long_form_fallback_looks_up_the_cache_once(tmp_path: Path) -> None:
+    model = FakeSpeechRecognition()
+    registry = ModelRegistry()
+    handle = registry.register(ModelName.SPEECH_RECOGNITION, lambda: cast(SpeechRecognition, model))
+    executor = InferenceExecutor()
+    cache = TranscriptionCache(tmp_path, "fake")
+    speech_recognition = AsyncSpeechRecognition(handle, executor, cache=cache)
+
+    try:
+        assert asyncio.run(transcribe_long_form(speech_recognition)) == ["transcription"]
+        assert (cache.stats.hits, cache.stats.misses) == (0, 1)
+
+        assert asyncio.run(transcribe_long_form(speech_recognition)) == ["transcription"]
+        assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+        assert model.calls == 1
+    finally:
+        executor.shutdown()
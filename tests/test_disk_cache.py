@@ -0,0 +1,29 @@
+import os
+import time
+from pathlib import Path
+
+from src.cache.disk_cache import STALE_TEMPORARY_FILE_AGE_S, DiskCache
+
+
+def test_stale_temporary_files_are_removed(tmp_path: Path) -> None:
+    DiskCache(tmp_path, 1024).put("key", b"value")
+    stale_path = tmp_path / "interrupted.tmp"
+    stale_path.write_bytes(b"partial value")
+    stale_mtime = time.time() - STALE_TEMPORARY_FILE_AGE_S - 1
+    os.utime(stale_path, (stale_mtime, stale_mtime))
+
+    cache = DiskCache(tmp_path, 1024)
+
+    assert not stale_path.exists()
+    assert cache.get("key") == b"value"
+    assert cache.size_bytes == len(b"value")
+
+
+def test_temporary_files_of_running_writers_are_kept(tmp_path: Path) -> None:
+    in_flight_path = tmp_path / "writing.tmp"
+    in_flight_path.write_bytes(b"partial value")
+
+    cache = DiskCache(tmp_path, 1024)
+
+    assert in_flight_path.exists()
+    assert cache.size_bytes == 0
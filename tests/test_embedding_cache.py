@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+from src.sticker_generator.embedding_cache import EmbeddingCache, ImageEmbedding
+
+
+def get_mapped_file(address: int) -> str:
+    with open("/proc/self/maps", encoding="utf-8") as maps:
+        for line in maps:
+            fields = line.split()
+            start, stop = (int(value, 16) for value in fields[0].split("-"))
+            if start <= address < stop:
+                return fields[5] if len(fields) > 5 else ""
+    return ""
+
+
+def test_embedding_is_read_back_from_disk(tmp_path: Path) -> None:
+    features = torch.randn(1, 256, 64, 64)
+    EmbeddingCache("cpu", folder=tmp_path).put("image", ImageEmbedding(features, (480, 640), (768, 1024)))
+
+    embedding = EmbeddingCache("cpu", folder=tmp_path).get("image")
+
+    assert embedding is not None
+    assert torch.equal(embedding.features, features)
+    assert (embedding.original_size, embedding.input_size) == ((480, 640), (768, 1024))
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="reads the memory mappings from /proc")
+def test_embedding_read_back_is_memory_mapped(tmp_path: Path) -> None:
+    EmbeddingCache("cpu", folder=tmp_path).put("image", ImageEmbedding(torch.randn(1, 256, 64, 64), (1, 1), (1, 1)))
+
+    embedding = EmbeddingCache("cpu", folder=tmp_path).get("image")
+
+    assert embedding is not None
+    assert get_mapped_file(embedding.features.data_ptr()).startswith(str(tmp_path))
+
+
+def test_memory_only_cache_misses_unknown_images() -> None:
+    assert EmbeddingCache("cpu").get("image") is None
@@ -0,0 +1,10 @@
+import pytest
+
+from src.inference.executor import ExecutorConfig, ExecutorType, InferenceExecutor, ModelName
+
+
+def test_process_pools_are_rejected_for_models() -> None:
+    configs = {ModelName.IMAGE_PROCESSING: ExecutorConfig(max_workers=2, executor_type=ExecutorType.PROCESS)}
+
+    with pytest.raises(ValueError, match="thread pools"):
+        InferenceExecutor(configs)
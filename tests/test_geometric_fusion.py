@@ -0,0 +1,51 @@
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.image_processing.command import Command, CommandParameters
+from src.image_processing.image_processor import ImageProcessor
+from src.image_processing.kernels.kernel_types import KernelTypes
+
+
+def get_noise_image(height: int, width: int) -> Image.Image:
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def resize(width: int, height: int) -> Command:
+    return Command(KernelTypes.RESIZE, CommandParameters(width=str(width), height=str(height)))
+
+
+def crop(width: int, height: int) -> Command:
+    return Command(KernelTypes.CROP, CommandParameters(width=str(width), height=str(height)))
+
+
+def rotate(angle: int) -> Command:
+    return Command(KernelTypes.ROTATE, CommandParameters(angle=str(angle)))
+
+
+def get_fused_and_sequential(command_queue: List[Command]) -> Tuple[np.ndarray, np.ndarray]:
+    image = get_noise_image(300, 400)
+    fused = ImageProcessor().get_processed_image(image, command_queue)
+    sequential = ImageProcessor(optimize=False).get_processed_image(image, command_queue)
+    return np.asarray(fused, dtype=np.int16), np.asarray(sequential, dtype=np.int16)
+
+
+@pytest.mark.parametrize(
+    "command_queue",
+    [
+        [resize(100, 75), resize(400, 300)],
+        [crop(200, 150), resize(50, 38), resize(800, 600)],
+        [resize(800, 600), resize(100, 75)],
+        [crop(200, 150), rotate(90), resize(600, 800)],
+        [rotate(-90), resize(150, 200), crop(100, 100)],
+    ],
+)
+def test_fused_geometric_commands_match_sequential(command_queue: List[Command]) -> None:
+    fused, sequential = get_fused_and_sequential(command_queue)
+
+    assert fused.shape == sequential.shape
+    # warpAffine and resize round the interpolation weights differently
+    assert np.abs(fused - sequential).max() <= 3
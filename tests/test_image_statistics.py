@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.image_statistics import ImageStatistics
+from src.utils import get_saturation
+
+
+def get_smooth_image(height: int, width: int) -> Image.Image:
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (max(1, height // 4), max(1, width // 4), 3), dtype=np.uint8)
+    return Image.fromarray(cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC))
+
+
+def get_laplacian_variance(image: Image.Image) -> float:
+    grayscale = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+    return float(cv2.Laplacian(grayscale, cv2.CV_64F).var())
+
+
+@pytest.mark.parametrize("height, width", [(40, 2000), (2000, 40), (1, 3000), (63, 5000), (5000, 63)])
+def test_level_of_detail_of_thin_images(height: int, width: int) -> None:
+    image = get_smooth_image(height, width)
+
+    image_parameters = ImageStatistics().compute(image)
+
+    assert image_parameters["level_of_detail"] == pytest.approx(get_laplacian_variance(image), rel=1e-3)
+
+
+def test_level_of_detail_of_large_images_is_close_to_whole_image() -> None:
+    image = get_smooth_image(1500, 2000)
+
+    image_parameters = ImageStatistics().compute(image)
+
+    assert image_parameters["level_of_detail"] == pytest.approx(get_laplacian_variance(image), rel=0.25)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+def test_saturation_matches_utils(mode: str) -> None:
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)).convert(mode)
+
+    image_parameters = ImageStatistics().compute(image)
+
+    assert image_parameters["saturation"] == pytest.approx(get_saturation(image), abs=1e-9)
+
+
+def test_saturation_of_large_images_is_close_to_utils() -> None:
+    image = get_smooth_image(1500, 2000)
+
+    image_parameters = ImageStatistics().compute(image)
+
+    assert image_parameters["saturation"] == pytest.approx(get_saturation(image), rel=1e-3)
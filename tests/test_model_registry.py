@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import numpy as np
+import torch
+
+from src.inference.executor import ModelName
+from src.inference.model_registry import ModelRegistry, get_model_size
+
+
+class Wrapper:  # pylint: disable=too-few-public-methods
+    """
+    Model wrapper which holds torch modules in its attributes
+    """
+
+    def __init__(self, **attributes: Any) -> None:
+        self.__dict__.update(attributes)
+
+
+def test_model_size_counts_shared_weights_once() -> None:
+    encoder = torch.nn.Linear(16, 8)
+    decoder = torch.nn.Sequential(encoder, torch.nn.BatchNorm1d(8))
+
+    size = get_model_size(Wrapper(components={"encoder": encoder, "decoder": decoder}, name="model"))
+
+    # Linear weight and bias, BatchNorm weight, bias, running mean, running variance and batch counter
+    assert size == (16 * 8 + 8) * 4 + 4 * 8 * 4 + 8
+
+
+def test_concurrent_loads_do_not_share_memory_growth() -> None:
+    registry = ModelRegistry()
+    is_array_loaded = threading.Event()
+
+    def load_array() -> Wrapper:
+        model = Wrapper(array=np.ones(64 * 1024 * 1024, dtype=np.uint8))
+        is_array_loaded.set()
+        return model
+
+    def load_module() -> Wrapper:
+        model = Wrapper(model=torch.nn.Linear(256, 256))
+        # The array is allocated while the module is being loaded
+        is_array_loaded.wait(timeout=10)
+        return model
+
+    registry.register(ModelName.IMAGE_PROCESSING, load_array)
+    registry.register(ModelName.SPEECH_RECOGNITION, load_module)
+
+    def acquire(model_name: ModelName) -> None:
+        with registry.acquire(model_name):
+            pass
+
+    with ThreadPoolExecutor(2) as executor:
+        list(executor.map(acquire, [ModelName.SPEECH_RECOGNITION, ModelName.IMAGE_PROCESSING]))
+
+    assert registry.get_sizes() == {ModelName.SPEECH_RECOGNITION: (256 * 256 + 256) * 4, ModelName.IMAGE_PROCESSING: 0}
@@ -0,0 +1,48 @@
+from typing import Dict, List, Optional, Union
+
+from src.image_processing.command_parser.ai_command_parser import AICommandParser
+from src.image_processing.command_parser.command_parser import ParserParameters
+from src.image_processing.command_parser.language_package import ImageParameters
+from src.image_processing.command_parser.tiered_command_parser import TieredCommandParser
+from src.image_processing.kernels.kernel_types import KernelTypes
+
+
+class FakeLLMCommandParser(AICommandParser):
+    """
+    AICommandParser which returns a fixed LLM output instead of loading the model
+    """
+
+    def __init__(self, llm_output: List[Dict[str, Union[str, Dict]]]) -> None:  # pylint: disable=super-init-not-called
+        self._llm_output = llm_output
+
+    def _get_llm_output(
+        self, input_text: str, num_few_shot_samples: int = -1, image_parameters: Optional[ImageParameters] = None
+    ) -> List[Dict[str, Union[str, Dict]]]:
+        return self._llm_output
+
+
+def get_parser_with_fake_llm(llm_output: List[Dict[str, Union[str, Dict]]]) -> TieredCommandParser:
+    parser = TieredCommandParser()
+    parser._ai_parser = FakeLLMCommandParser(llm_output)  # pylint: disable=protected-access
+    return parser
+
+
+def test_unknown_llm_parameters_are_ignored() -> None:
+    llm_output: List[Dict[str, Union[str, Dict]]] = [{"action": "blur", "parameters": {"step": "5", "radius": "3"}}]
+    parser = get_parser_with_fake_llm(llm_output)
+
+    commands = parser.parse_text("Make it look vintage", ParserParameters())
+
+    assert len(commands) == 1
+    assert commands[0].kernel_type == KernelTypes.BLUR
+    assert commands[0].parameters.step == "5"
+
+
+def test_malformed_llm_output_falls_back_to_patterns() -> None:
+    # A list of strings instead of command objects
+    parser = get_parser_with_fake_llm(["blur"])  # type: ignore[list-item]
+
+    commands = parser.parse_text("Blur by 5 and make it look vintage", ParserParameters())
+
+    assert [command.kernel_type for command in commands] == [KernelTypes.BLUR]
+    assert parser.ai_stats.calls == 1
@@ -0,0 +1,109 @@
+import os
+import tracemalloc
+from typing import Iterator, List
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing.command import Command, CommandParameters
+from src.image_processing.command_optimizer.geometric_fusion import AffineOperation
+from src.image_processing.command_optimizer.operations import KernelOperation
+from src.image_processing.image_buffer import ChannelOrder, ImageBuffer
+from src.image_processing.image_processor import ImageProcessor
+from src.image_processing.kernels.kernel import Kernel
+from src.image_processing.kernels.kernel_map import get_kernel_map
+from src.image_processing.kernels.kernel_types import KernelTypes
+from src.image_processing.tiled_executor import TiledExecutor, TilingConfig
+from src.inference.executor import ExecutorType
+
+
+class ThreadCountKernel(Kernel):
+    """
+    Pointwise kernel which records the OpenCV thread count of every band
+    """
+
+    num_threads: List[int] = []
+
+    @staticmethod
+    def process(image: np.ndarray, params: CommandParameters) -> np.ndarray:
+        ThreadCountKernel.num_threads.append(cv2.getNumThreads())
+        return image
+
+
+@pytest.fixture(name="opencv_threads")
+def fixture_opencv_threads() -> Iterator[int]:
+    saved_num_threads = cv2.getNumThreads()
+    cv2.setNumThreads(8)
+    yield 8
+    cv2.setNumThreads(saved_num_threads)
+
+
+def test_opencv_threads_are_split_between_tile_workers(opencv_threads: int, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    ThreadCountKernel.num_threads = []
+    image = ImageBuffer(np.zeros((64, 64, 3), dtype=np.uint8), ChannelOrder.RGB)
+    operation = KernelOperation(ThreadCountKernel, Command(KernelTypes.INVERT, CommandParameters()))
+    executor = TiledExecutor(TilingConfig(memory_limit_bytes=4096, num_workers=2, executor_type=ExecutorType.THREAD))
+
+    try:
+        executor.apply(image, [operation])
+    finally:
+        executor.shutdown()
+
+    # The first band is computed before the workers start
+    assert len(ThreadCountKernel.num_threads) > 2
+    assert set(ThreadCountKernel.num_threads[1:]) == {4}
+    assert cv2.getNumThreads() == opencv_threads
+
+
+def get_noise_image(height: int, width: int) -> ImageBuffer:
+    rng = np.random.default_rng(0)
+    return ImageBuffer(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), ChannelOrder.RGB)
+
+
+def command(kernel_type: KernelTypes, **parameters: str) -> Command:
+    return Command(kernel_type, CommandParameters(**parameters))
+
+
+@pytest.mark.parametrize(
+    "command_queue",
+    [
+        [command(KernelTypes.ROTATE, angle="90"), command(KernelTypes.RESIZE, width="100", height="75")],
+        [command(KernelTypes.RESIZE, width="600", height="450"), command(KernelTypes.ROTATE, angle="-90")],
+        [command(KernelTypes.BLUR, step="5"), command(KernelTypes.ROTATE, angle="90")],
+        [command(KernelTypes.SHARPEN), command(KernelTypes.ROTATE, angle="180"), command(KernelTypes.SHARPEN)],
+        [command(KernelTypes.CROP, width="500", height="350"), command(KernelTypes.ROTATE, angle="90")],
+    ],
+)
+def test_tiled_geometric_commands_match_whole_image(command_queue: List[Command]) -> None:
+    image = get_noise_image(300, 400)
+    processor = ImageProcessor()
+    tiled_processor = ImageProcessor(tiling=TilingConfig(memory_limit_bytes=64 * 1024))
+
+    # pylint: disable=protected-access
+    whole = processor._apply_commands(image, command_queue)
+    tiled = tiled_processor._apply_commands(image, command_queue)
+
+    assert np.array_equal(tiled.array, whole.array)
+
+
+def test_warped_image_is_not_materialized() -> None:
+    image = get_noise_image(1000, 1000)
+    operations = [
+        AffineOperation(
+            [command(KernelTypes.RESIZE, width="2000", height="2000"), command(KernelTypes.ROTATE, angle="90")]
+        ),
+        KernelOperation(get_kernel_map()[KernelTypes.INVERT], command(KernelTypes.INVERT)),
+    ]
+    executor = TiledExecutor(TilingConfig(memory_limit_bytes=1024 * 1024))
+
+    tracemalloc.start()
+    try:
+        output = executor.apply(image, operations)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # The output is the only full-size allocation
+    assert peak_bytes < output.array.nbytes + 2 * 1024 * 1024
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+
+from src.telegram_bot.update_processor import ChatUpdateProcessor
+from src.telegram_bot.utils import CANCEL_GENERATION_PREFIX, is_cancel_generation
+
+USER = User(1, "user", is_bot=False)
+
+
+def get_message_update(update_id: int, chat_id: int, media_group_id: Optional[str] = None) -> Update:
+    message = Message(
+        update_id, datetime.now(), Chat(chat_id, Chat.PRIVATE), from_user=USER, media_group_id=media_group_id
+    )
+    return Update(update_id, message=message)
+
+
+def get_callback_update(update_id: int, chat_id: int, data: str) -> Update:
+    message = Message(update_id, datetime.now(), Chat(chat_id, Chat.PRIVATE), from_user=USER)
+    return Update(update_id, callback_query=CallbackQuery(str(update_id), USER, "chat", message=message, data=data))
+
+
+async def record(events: List[str], name: str, duration_s: float = 0.05) -> None:
+    events.append(f"start {name}")
+    await asyncio.sleep(duration_s)
+    events.append(f"stop {name}")
+
+
+async def process(processor: ChatUpdateProcessor, updates: List[Update], events: List[str]) -> None:
+    await asyncio.gather(
+        *(processor.process_update(update, record(events, str(update.update_id))) for update in updates)
+    )
+
+
+def test_updates_of_a_chat_are_processed_in_order() -> None:
+    events: List[str] = []
+    processor = ChatUpdateProcessor(16, is_concurrent=is_cancel_generation)
+
+    asyncio.run(process(processor, [get_message_update(1, chat_id=10), get_message_update(2, chat_id=10)], events))
+
+    assert events == ["start 1", "stop 1", "start 2", "stop 2"]
+
+
+def test_updates_of_different_chats_are_concurrent() -> None:
+    events: List[str] = []
+    processor = ChatUpdateProcessor(16, is_concurrent=is_cancel_generation)
+
+    asyncio.run(process(processor, [get_message_update(1, chat_id=10), get_message_update(2, chat_id=20)], events))
+
+    assert events[:2] == ["start 1", "start 2"]
+
+
+def test_album_items_and_cancel_join_the_running_handler() -> None:
+    events: List[str] = []
+    processor = ChatUpdateProcessor(16, is_concurrent=is_cancel_generation)
+    updates = [
+        get_message_update(1, chat_id=10, media_group_id="album"),
+        get_message_update(2, chat_id=10, media_group_id="album"),
+        get_callback_update(3, chat_id=10, data=f"{CANCEL_GENERATION_PREFIX}job"),
+        get_message_update(4, chat_id=10),
+    ]
+
+    asyncio.run(process(processor, updates, events))
+
+    assert events[:3] == ["start 1", "start 2", "start 3"]
+    assert events[-2:] == ["start 4", "stop 4"]